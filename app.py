@@ -1,225 +1,483 @@
-import streamlit as st
-from vehicle_constructor import Tractor, SemiTrailer, Van, Scene
-
-# --- Инициализация состояния сессии ---
-def init_session_state():
-    """Инициализирует состояние сессии, если оно еще не создано."""
-    defaults = {
-        "vehicle_type": "Сборка автопоезда",
-        "library": {},
-        "current_tractor": Tractor(),
-        "current_trailer": SemiTrailer(),
-        "current_van": Van()
-    }
-    for key, value in defaults.items():
-        if key not in st.session_state:
-            st.session_state[key] = value
-
-init_session_state()
-
-# --- Основное приложение ---
-st.set_page_config(layout="wide")
-st.title("Движок-Конструктор 3D-моделей")
-
-# --- Боковая панель ---
-st.sidebar.header("Управление")
-
-# Главное меню выбора режима
-st.session_state.vehicle_type = st.sidebar.selectbox(
-    "Выберите режим",
-    ("Сборка автопоезда", "Тягач", "Прицеп", "Фургон"),
-    key="main_mode_selector"
-)
-
-# --- Динамический интерфейс в боковой панели ---
-
-# --- ИНТЕРФЕЙС ДЛЯ ТЯГАЧА ---
-if st.session_state.vehicle_type == "Тягач":
-    st.sidebar.header("Параметры тягача")
-    
-    brand = st.sidebar.text_input("Марка", value=st.session_state.current_tractor.brand)
-    model = st.sidebar.text_input("Модель", value=st.session_state.current_tractor.model)
-    
-    st.sidebar.subheader("Габариты")
-    cab_length = st.sidebar.number_input("Длина кабины (м)", value=2.2, step=0.1, key="t_cab_l")
-    cab_width = st.sidebar.number_input("Ширина кабины (м)", value=2.5, step=0.1, key="t_cab_w")
-    cab_height = st.sidebar.number_input("Высота кабины (м)", value=2.8, step=0.1, key="t_cab_h")
-    
-    st.sidebar.subheader("Шасси")
-    front_axle_pos = st.sidebar.number_input("Положение передней оси от бампера (м)", value=1.45, step=0.05, key="t_ax_pos")
-    wheelbase = st.sidebar.number_input("Колесная база (м)", value=3.6, step=0.1, key="t_wb")
-    saddle_pos_from_rear_axle = st.sidebar.number_input("Смещение седла от центра задней тележки (м)", value=0.5, step=0.05, key="t_saddle")
-    
-    st.sidebar.subheader("Колеса")
-    num_rear_axles = st.sidebar.number_input("Кол-во задних осей", min_value=1, value=2, step=1, key="t_num_ax")
-    rear_axle_spacing = st.sidebar.number_input("Расстояние между задними осями (м)", value=1.3, step=0.1, key="t_ax_sp")
-    wheel_type = st.sidebar.selectbox("Тип задних колес", ('dual', 'single'), key="t_w_type")
-    wheel_diameter = st.sidebar.number_input("Диаметр колес (м)", value=1.0, step=0.05, key="t_w_d")
-    wheel_width = st.sidebar.number_input("Ширина колес (м)", value=0.4, step=0.05, key="t_w_w")
-    
-    if st.sidebar.button("Создать / Обновить"):
-        params = {
-            'brand': brand, 'model': model, 'cab_length': cab_length, 'cab_width': cab_width,
-            'cab_height': cab_height, 'front_axle_pos': front_axle_pos, 'wheelbase': wheelbase,
-            'saddle_pos_from_rear_axle': saddle_pos_from_rear_axle, 'num_rear_axles': num_rear_axles,
-            'rear_axle_spacing': rear_axle_spacing, 'wheel_type': wheel_type,
-            'wheel_diameter': wheel_diameter, 'wheel_width': wheel_width
-        }
-        st.session_state.current_tractor = Tractor(**params)
-        st.sidebar.success("Тягач обновлен!")
-
-    if st.sidebar.button("Сохранить в библиотеку"):
-        # Сначала обновляем объект, чтобы сохранить последние введенные данные
-        params = {
-            'brand': brand, 'model': model, 'cab_length': cab_length, 'cab_width': cab_width,
-            'cab_height': cab_height, 'front_axle_pos': front_axle_pos, 'wheelbase': wheelbase,
-            'saddle_pos_from_rear_axle': saddle_pos_from_rear_axle, 'num_rear_axles': num_rear_axles,
-            'rear_axle_spacing': rear_axle_spacing, 'wheel_type': wheel_type,
-            'wheel_diameter': wheel_diameter, 'wheel_width': wheel_width
-        }
-        st.session_state.current_tractor = Tractor(**params)
-        unique_name = st.session_state.current_tractor.get_unique_name()
-        if unique_name in st.session_state.library:
-            st.sidebar.error("Техника с такой маркой и моделью уже существует!")
-        else:
-            st.session_state.library[unique_name] = st.session_state.current_tractor
-            st.sidebar.success(f"Тягач '{unique_name}' сохранен!")
-
-
-# --- ИНТЕРФЕЙС ДЛЯ ПРИЦЕПА ---
-elif st.session_state.vehicle_type == "Прицеп":
-    st.sidebar.header("Параметры прицепа")
-    
-    brand = st.sidebar.text_input("Марка", value=st.session_state.current_trailer.brand, key="trl_brand")
-    model = st.sidebar.text_input("Модель", value=st.session_state.current_trailer.model, key="trl_model")
-
-    st.sidebar.subheader("Габариты кузова")
-    length = st.sidebar.number_input("Длина (м)", value=13.6, step=0.1, key="trl_l")
-    width = st.sidebar.number_input("Ширина (м)", value=2.55, step=0.1, key="trl_w")
-    height = st.sidebar.number_input("Высота (м)", value=2.7, step=0.1, key="trl_h")
-
-    st.sidebar.subheader("Шасси")
-    kingpin_offset = st.sidebar.number_input("Смещение шкворня от переднего края (м)", value=1.2, step=0.1, key="trl_k_off")
-    axle_pos_from_rear = st.sidebar.number_input("Положение задней оси от заднего края (м)", value=2.5, step=0.1, key="trl_ax_pos")
-    num_axles = st.sidebar.number_input("Количество осей", min_value=1, value=3, step=1, key="trl_num_ax")
-    axle_spacing = st.sidebar.number_input("Расстояние между осями (м)", value=1.3, step=0.1, key="trl_ax_sp")
-
-    st.sidebar.subheader("Колеса")
-    wheel_type = st.sidebar.selectbox("Тип колес", ('single', 'dual'), key="trl_w_type")
-    wheel_diameter = st.sidebar.number_input("Диаметр колес (м)", value=1.0, step=0.05, key="trl_w_d")
-    wheel_width = st.sidebar.number_input("Ширина колес (м)", value=0.4, step=0.05, key="trl_w_w")
-
-    if st.sidebar.button("Создать / Обновить"):
-        params = {
-            'brand': brand, 'model': model, 'length': length, 'width': width, 'height': height,
-            'kingpin_offset': kingpin_offset, 'axle_pos_from_rear': axle_pos_from_rear,
-            'num_axles': num_axles, 'axle_spacing': axle_spacing, 'wheel_type': wheel_type,
-            'wheel_diameter': wheel_diameter, 'wheel_width': wheel_width
-        }
-        st.session_state.current_trailer = SemiTrailer(**params)
-        st.sidebar.success("Прицеп обновлен!")
-    
-    if st.sidebar.button("Сохранить в библиотеку"):
-        params = {
-            'brand': brand, 'model': model, 'length': length, 'width': width, 'height': height,
-            'kingpin_offset': kingpin_offset, 'axle_pos_from_rear': axle_pos_from_rear,
-            'num_axles': num_axles, 'axle_spacing': axle_spacing, 'wheel_type': wheel_type,
-            'wheel_diameter': wheel_diameter, 'wheel_width': wheel_width
-        }
-        st.session_state.current_trailer = SemiTrailer(**params)
-        unique_name = st.session_state.current_trailer.get_unique_name()
-        if unique_name in st.session_state.library:
-            st.sidebar.error("Техника с такой маркой и моделью уже существует!")
-        else:
-            st.session_state.library[unique_name] = st.session_state.current_trailer
-            st.sidebar.success(f"Прицеп '{unique_name}' сохранен!")
-
-# --- ИНТЕРФЕЙС ДЛЯ ФУРГОНА ---
-elif st.session_state.vehicle_type == "Фургон":
-    st.sidebar.header("Параметры фургона")
-    
-    brand = st.sidebar.text_input("Марка", value=st.session_state.current_van.brand, key="van_brand")
-    model = st.sidebar.text_input("Модель", value=st.session_state.current_van.model, key="van_model")
-
-    st.sidebar.subheader("Габариты")
-    cab_length = st.sidebar.number_input("Длина кабины (м)", value=2.0, step=0.1, key="van_cab_l")
-    body_length = st.sidebar.number_input("Длина кузова (м)", value=4.2, step=0.1, key="van_body_l")
-    body_width = st.sidebar.number_input("Ширина кузова (м)", value=2.2, step=0.1, key="van_body_w")
-    body_height = st.sidebar.number_input("Высота кузова (м)", value=2.2, step=0.1, key="van_body_h")
-    
-    st.sidebar.subheader("Шасси")
-    front_axle_pos = st.sidebar.number_input("Положение передней оси от бампера (м)", value=1.0, step=0.05, key="van_ax_pos")
-    wheelbase = st.sidebar.number_input("Колесная база (м)", value=4.0, step=0.1, key="van_wb")
-    
-    st.sidebar.subheader("Колеса")
-    num_rear_axles = st.sidebar.number_input("Кол-во задних осей", min_value=1, value=1, step=1, key="van_num_ax")
-    rear_axle_spacing = st.sidebar.number_input("Расстояние между задними осями (м)", value=1.0, step=0.1, key="van_ax_sp")
-    wheel_type = st.sidebar.selectbox("Тип задних колес", ('dual', 'single'), key="van_w_type")
-    wheel_diameter = st.sidebar.number_input("Диаметр колес (м)", value=0.8, step=0.05, key="van_w_d")
-    wheel_width = st.sidebar.number_input("Ширина колес (м)", value=0.3, step=0.05, key="van_w_w")
-
-    if st.sidebar.button("Создать / Обновить"):
-        params = {
-            'brand': brand, 'model': model, 'cab_length': cab_length, 'body_length': body_length,
-            'body_width': body_width, 'body_height': body_height, 'front_axle_pos': front_axle_pos,
-            'wheelbase': wheelbase, 'num_rear_axles': num_rear_axles, 'rear_axle_spacing': rear_axle_spacing,
-            'wheel_type': wheel_type, 'wheel_diameter': wheel_diameter, 'wheel_width': wheel_width
-        }
-        st.session_state.current_van = Van(**params)
-        st.sidebar.success("Фургон обновлен!")
-    
-    if st.sidebar.button("Сохранить в библиотеку"):
-        params = {
-            'brand': brand, 'model': model, 'cab_length': cab_length, 'body_length': body_length,
-            'body_width': body_width, 'body_height': body_height, 'front_axle_pos': front_axle_pos,
-            'wheelbase': wheelbase, 'num_rear_axles': num_rear_axles, 'rear_axle_spacing': rear_axle_spacing,
-            'wheel_type': wheel_type, 'wheel_diameter': wheel_diameter, 'wheel_width': wheel_width
-        }
-        st.session_state.current_van = Van(**params)
-        unique_name = st.session_state.current_van.get_unique_name()
-        if unique_name in st.session_state.library:
-            st.sidebar.error("Техника с такой маркой и моделью уже существует!")
-        else:
-            st.session_state.library[unique_name] = st.session_state.current_van
-            st.sidebar.success(f"Фургон '{unique_name}' сохранен!")
-
-
-# --- ИНТЕРФЕЙС ДЛЯ СБОРКИ ---
-elif st.session_state.vehicle_type == "Сборка автопоезда":
-    st.sidebar.header("Сборка")
-    tractors = {name: obj for name, obj in st.session_state.library.items() if isinstance(obj, Tractor)}
-    trailers = {name: obj for name, obj in st.session_state.library.items() if isinstance(obj, SemiTrailer)}
-    
-    if not tractors or not trailers:
-        st.sidebar.warning("Сначала создайте и сохраните в библиотеку хотя бы один тягач и один прицеп.")
-    else:
-        sel_tractor_name = st.sidebar.selectbox("Выберите тягач", list(tractors.keys()))
-        sel_trailer_name = st.sidebar.selectbox("Выберите прицеп", list(trailers.keys()))
-        if st.sidebar.button("Собрать автопоезд"):
-            st.session_state.current_tractor = st.session_state.library[sel_tractor_name]
-            st.session_state.current_trailer = st.session_state.library[sel_trailer_name]
-            st.sidebar.success("Автопоезд готов к отображению!")
-
-# --- Основная область и 3D Сцена ---
-st.header("3D Модель")
-scene = Scene()
-
-if st.session_state.vehicle_type == "Тягач":
-    scene.add(st.session_state.current_tractor)
-elif st.session_state.vehicle_type == "Прицеп":
-    scene.add(st.session_state.current_trailer)
-elif st.session_state.vehicle_type == "Фургон":
-    scene.add(st.session_state.current_van)
-elif st.session_state.vehicle_type == "Сборка автопоезда":
-    scene.add_articulated_vehicle(st.session_state.current_tractor, st.session_state.current_trailer)
-
-fig = scene.generate_figure()
-st.plotly_chart(fig, use_container_width=True)
-
-st.sidebar.header("Библиотека")
-if st.session_state.library:
-    st.sidebar.json(list(st.session_state.library.keys()))
-else:
-    st.sidebar.write("Пусто")
-
-
+import csv
+import importlib.machinery
+import io
+import math
+import os
+
+import streamlit as st
+from catalog_io import ErrorLog, import_file, export_csv
+from clearance import DEFAULT_MAX_ANGLE, coupling_clearance, screen_pairs
+from figure_transport import payload_report
+from instrumentation import RerunTrace, SamplingProfiler, metrics, span
+from mesh_assets import AssetError, asset_cache
+from mesh_export import FORMATS, export_scene
+from render_pool import RenderError, scene_spec, shared_pool
+from swept_path import (TURNING_CIRCLE_INNER, TURNING_CIRCLE_OUTER, arc_path, simulate, swept_path_figure,
+                        turning_circle_check)
+from thumbnails import render_thumbnails
+from vehicle_constructor import Tractor, SemiTrailer, Van, Scene, geometry_key
+from vehicle_library import VehicleLibrary, open_library
+
+# Streamlit исполняет скрипт как модуль __main__ без __spec__, и воркеры пулов forkserver/spawn
+# (parallel.process_pool) заново исполняли бы весь скрипт. Спецификация с именем "__main__"
+# говорит multiprocessing не импортировать главный модуль: функции воркеров лежат в модулях пакета.
+__spec__ = importlib.machinery.ModuleSpec("__main__", None)
+
+# Каталог постоянной библиотеки; без него библиотека живет только в сессии
+LIBRARY_PATH = os.environ.get("VEHICLE_LIBRARY_PATH")
+# Файл метрик в формате Prometheus; без него метрики видны только в отладочной панели
+METRICS_PATH = os.environ.get("VEHICLE_METRICS_PATH")
+# Число процессов общего пула построения фигур; без него фигура строится в потоке сессии
+RENDER_WORKERS = int(os.environ.get("VEHICLE_RENDER_WORKERS") or 0)
+# Число процессов для проверок всего каталога; без него проверки считаются в потоке сессии
+BATCH_WORKERS = int(os.environ.get("VEHICLE_BATCH_WORKERS") or 0)
+
+# Запись этапов перезапуска; профилировщик включается флажком в отладочной панели
+trace = RerunTrace().start()
+trace.stage("app.init")
+profiler = SamplingProfiler().start() if st.session_state.get("profile_rerun") else None
+
+# --- Инициализация состояния сессии ---
+def init_session_state():
+    """Инициализирует состояние сессии, если оно еще не создано."""
+    defaults = {
+        "vehicle_type": "Сборка автопоезда",
+        # Постоянная библиотека - общий для всех сессий процесса объект
+        "library": open_library(LIBRARY_PATH) if LIBRARY_PATH else VehicleLibrary(),
+        "current_tractor": Tractor(),
+        "current_trailer": SemiTrailer(),
+        "current_van": Van(),
+        "scene": Scene(),
+        "figure": None
+    }
+    for key, value in defaults.items():
+        if key not in st.session_state:
+            st.session_state[key] = value
+
+# Перезапуск, прерванный кликом (RerunException, StopException) или ошибкой, тоже
+# закрывает запись этапов и останавливает профилировщик в finally
+try:
+    init_session_state()
+
+    # Меши моделей из библиотеки разбираются в фоне один раз на процесс (кэш общий)
+    if "assets_preloaded" not in st.session_state:
+        asset_cache.preload(st.session_state.library.model_paths())
+        st.session_state.assets_preloaded = True
+
+    # --- Основное приложение ---
+    st.set_page_config(layout="wide")
+    st.title("Движок-Конструктор 3D-моделей")
+
+    # --- Боковая панель ---
+    trace.stage("app.widgets")
+    st.sidebar.header("Управление")
+
+    # Главное меню выбора режима
+    st.session_state.vehicle_type = st.sidebar.selectbox(
+        "Выберите режим",
+        ("Сборка автопоезда", "Тягач", "Прицеп", "Фургон"),
+        key="main_mode_selector"
+    )
+
+    # Уровень детализации колес: 'auto' выбирает его по числу ТС на сцене и бюджету треугольников
+    st.session_state.scene.lod = st.sidebar.selectbox(
+        "Детализация колес",
+        ("auto", "coarse", "medium", "fine"),
+        key="lod_selector"
+    )
+
+    # --- Динамический интерфейс в боковой панели ---
+
+    # --- ИНТЕРФЕЙС ДЛЯ ТЯГАЧА ---
+    if st.session_state.vehicle_type == "Тягач":
+        st.sidebar.header("Параметры тягача")
+    
+        brand = st.sidebar.text_input("Марка", value=st.session_state.current_tractor.brand)
+        model = st.sidebar.text_input("Модель", value=st.session_state.current_tractor.model)
+    
+        st.sidebar.subheader("Габариты")
+        cab_length = st.sidebar.number_input("Длина кабины (м)", value=2.2, step=0.1, key="t_cab_l")
+        cab_width = st.sidebar.number_input("Ширина кабины (м)", value=2.5, step=0.1, key="t_cab_w")
+        cab_height = st.sidebar.number_input("Высота кабины (м)", value=2.8, step=0.1, key="t_cab_h")
+    
+        st.sidebar.subheader("Шасси")
+        front_axle_pos = st.sidebar.number_input("Положение передней оси от бампера (м)", value=1.45, step=0.05, key="t_ax_pos")
+        wheelbase = st.sidebar.number_input("Колесная база (м)", value=3.6, step=0.1, key="t_wb")
+        saddle_pos_from_rear_axle = st.sidebar.number_input("Смещение седла от центра задней тележки (м)", value=0.5, step=0.05, key="t_saddle")
+    
+        st.sidebar.subheader("Колеса")
+        num_rear_axles = st.sidebar.number_input("Кол-во задних осей", min_value=1, value=2, step=1, key="t_num_ax")
+        rear_axle_spacing = st.sidebar.number_input("Расстояние между задними осями (м)", value=1.3, step=0.1, key="t_ax_sp")
+        wheel_type = st.sidebar.selectbox("Тип задних колес", ('dual', 'single'), key="t_w_type")
+        wheel_diameter = st.sidebar.number_input("Диаметр колес (м)", value=1.0, step=0.05, key="t_w_d")
+        wheel_width = st.sidebar.number_input("Ширина колес (м)", value=0.4, step=0.05, key="t_w_w")
+        cab_model = st.sidebar.text_input("Файл модели кабины (.gltf/.glb)", value=st.session_state.current_tractor.cab_model, key="t_cab_model")
+    
+        if st.sidebar.button("Создать / Обновить"):
+            params = {
+                'brand': brand, 'model': model, 'cab_length': cab_length, 'cab_width': cab_width,
+                'cab_height': cab_height, 'front_axle_pos': front_axle_pos, 'wheelbase': wheelbase,
+                'saddle_pos_from_rear_axle': saddle_pos_from_rear_axle, 'num_rear_axles': num_rear_axles,
+                'rear_axle_spacing': rear_axle_spacing, 'wheel_type': wheel_type,
+                'wheel_diameter': wheel_diameter, 'wheel_width': wheel_width, 'cab_model': cab_model
+            }
+            st.session_state.current_tractor = Tractor(**params)
+            st.sidebar.success("Тягач обновлен!")
+
+        if st.sidebar.button("Сохранить в библиотеку"):
+            # Сначала обновляем объект, чтобы сохранить последние введенные данные
+            params = {
+                'brand': brand, 'model': model, 'cab_length': cab_length, 'cab_width': cab_width,
+                'cab_height': cab_height, 'front_axle_pos': front_axle_pos, 'wheelbase': wheelbase,
+                'saddle_pos_from_rear_axle': saddle_pos_from_rear_axle, 'num_rear_axles': num_rear_axles,
+                'rear_axle_spacing': rear_axle_spacing, 'wheel_type': wheel_type,
+                'wheel_diameter': wheel_diameter, 'wheel_width': wheel_width, 'cab_model': cab_model
+            }
+            st.session_state.current_tractor = Tractor(**params)
+            unique_name = st.session_state.current_tractor.get_unique_name()
+            if unique_name in st.session_state.library:
+                st.sidebar.error("Техника с такой маркой и моделью уже существует!")
+            else:
+                st.session_state.library.add(st.session_state.current_tractor)
+                st.sidebar.success(f"Тягач '{unique_name}' сохранен!")
+
+
+    # --- ИНТЕРФЕЙС ДЛЯ ПРИЦЕПА ---
+    elif st.session_state.vehicle_type == "Прицеп":
+        st.sidebar.header("Параметры прицепа")
+    
+        brand = st.sidebar.text_input("Марка", value=st.session_state.current_trailer.brand, key="trl_brand")
+        model = st.sidebar.text_input("Модель", value=st.session_state.current_trailer.model, key="trl_model")
+
+        st.sidebar.subheader("Габариты кузова")
+        length = st.sidebar.number_input("Длина (м)", value=13.6, step=0.1, key="trl_l")
+        width = st.sidebar.number_input("Ширина (м)", value=2.55, step=0.1, key="trl_w")
+        height = st.sidebar.number_input("Высота (м)", value=2.7, step=0.1, key="trl_h")
+
+        st.sidebar.subheader("Шасси")
+        kingpin_offset = st.sidebar.number_input("Смещение шкворня от переднего края (м)", value=1.2, step=0.1, key="trl_k_off")
+        axle_pos_from_rear = st.sidebar.number_input("Положение задней оси от заднего края (м)", value=2.5, step=0.1, key="trl_ax_pos")
+        num_axles = st.sidebar.number_input("Количество осей", min_value=1, value=3, step=1, key="trl_num_ax")
+        axle_spacing = st.sidebar.number_input("Расстояние между осями (м)", value=1.3, step=0.1, key="trl_ax_sp")
+
+        st.sidebar.subheader("Колеса")
+        wheel_type = st.sidebar.selectbox("Тип колес", ('single', 'dual'), key="trl_w_type")
+        wheel_diameter = st.sidebar.number_input("Диаметр колес (м)", value=1.0, step=0.05, key="trl_w_d")
+        wheel_width = st.sidebar.number_input("Ширина колес (м)", value=0.4, step=0.05, key="trl_w_w")
+        body_model = st.sidebar.text_input("Файл модели кузова (.gltf/.glb)", value=st.session_state.current_trailer.body_model, key="trl_body_model")
+
+        if st.sidebar.button("Создать / Обновить"):
+            params = {
+                'brand': brand, 'model': model, 'length': length, 'width': width, 'height': height,
+                'kingpin_offset': kingpin_offset, 'axle_pos_from_rear': axle_pos_from_rear,
+                'num_axles': num_axles, 'axle_spacing': axle_spacing, 'wheel_type': wheel_type,
+                'wheel_diameter': wheel_diameter, 'wheel_width': wheel_width, 'body_model': body_model
+            }
+            st.session_state.current_trailer = SemiTrailer(**params)
+            st.sidebar.success("Прицеп обновлен!")
+    
+        if st.sidebar.button("Сохранить в библиотеку"):
+            params = {
+                'brand': brand, 'model': model, 'length': length, 'width': width, 'height': height,
+                'kingpin_offset': kingpin_offset, 'axle_pos_from_rear': axle_pos_from_rear,
+                'num_axles': num_axles, 'axle_spacing': axle_spacing, 'wheel_type': wheel_type,
+                'wheel_diameter': wheel_diameter, 'wheel_width': wheel_width, 'body_model': body_model
+            }
+            st.session_state.current_trailer = SemiTrailer(**params)
+            unique_name = st.session_state.current_trailer.get_unique_name()
+            if unique_name in st.session_state.library:
+                st.sidebar.error("Техника с такой маркой и моделью уже существует!")
+            else:
+                st.session_state.library.add(st.session_state.current_trailer)
+                st.sidebar.success(f"Прицеп '{unique_name}' сохранен!")
+
+    # --- ИНТЕРФЕЙС ДЛЯ ФУРГОНА ---
+    elif st.session_state.vehicle_type == "Фургон":
+        st.sidebar.header("Параметры фургона")
+    
+        brand = st.sidebar.text_input("Марка", value=st.session_state.current_van.brand, key="van_brand")
+        model = st.sidebar.text_input("Модель", value=st.session_state.current_van.model, key="van_model")
+
+        st.sidebar.subheader("Габариты")
+        cab_length = st.sidebar.number_input("Длина кабины (м)", value=2.0, step=0.1, key="van_cab_l")
+        body_length = st.sidebar.number_input("Длина кузова (м)", value=4.2, step=0.1, key="van_body_l")
+        body_width = st.sidebar.number_input("Ширина кузова (м)", value=2.2, step=0.1, key="van_body_w")
+        body_height = st.sidebar.number_input("Высота кузова (м)", value=2.2, step=0.1, key="van_body_h")
+    
+        st.sidebar.subheader("Шасси")
+        front_axle_pos = st.sidebar.number_input("Положение передней оси от бампера (м)", value=1.0, step=0.05, key="van_ax_pos")
+        wheelbase = st.sidebar.number_input("Колесная база (м)", value=4.0, step=0.1, key="van_wb")
+    
+        st.sidebar.subheader("Колеса")
+        num_rear_axles = st.sidebar.number_input("Кол-во задних осей", min_value=1, value=1, step=1, key="van_num_ax")
+        rear_axle_spacing = st.sidebar.number_input("Расстояние между задними осями (м)", value=1.0, step=0.1, key="van_ax_sp")
+        wheel_type = st.sidebar.selectbox("Тип задних колес", ('dual', 'single'), key="van_w_type")
+        wheel_diameter = st.sidebar.number_input("Диаметр колес (м)", value=0.8, step=0.05, key="van_w_d")
+        wheel_width = st.sidebar.number_input("Ширина колес (м)", value=0.3, step=0.05, key="van_w_w")
+        cab_model = st.sidebar.text_input("Файл модели кабины (.gltf/.glb)", value=st.session_state.current_van.cab_model, key="van_cab_model")
+        body_model = st.sidebar.text_input("Файл модели кузова (.gltf/.glb)", value=st.session_state.current_van.body_model, key="van_body_model")
+
+        if st.sidebar.button("Создать / Обновить"):
+            params = {
+                'brand': brand, 'model': model, 'cab_length': cab_length, 'body_length': body_length,
+                'body_width': body_width, 'body_height': body_height, 'front_axle_pos': front_axle_pos,
+                'wheelbase': wheelbase, 'num_rear_axles': num_rear_axles, 'rear_axle_spacing': rear_axle_spacing,
+                'wheel_type': wheel_type, 'wheel_diameter': wheel_diameter, 'wheel_width': wheel_width,
+                'cab_model': cab_model, 'body_model': body_model
+            }
+            st.session_state.current_van = Van(**params)
+            st.sidebar.success("Фургон обновлен!")
+    
+        if st.sidebar.button("Сохранить в библиотеку"):
+            params = {
+                'brand': brand, 'model': model, 'cab_length': cab_length, 'body_length': body_length,
+                'body_width': body_width, 'body_height': body_height, 'front_axle_pos': front_axle_pos,
+                'wheelbase': wheelbase, 'num_rear_axles': num_rear_axles, 'rear_axle_spacing': rear_axle_spacing,
+                'wheel_type': wheel_type, 'wheel_diameter': wheel_diameter, 'wheel_width': wheel_width,
+                'cab_model': cab_model, 'body_model': body_model
+            }
+            st.session_state.current_van = Van(**params)
+            unique_name = st.session_state.current_van.get_unique_name()
+            if unique_name in st.session_state.library:
+                st.sidebar.error("Техника с такой маркой и моделью уже существует!")
+            else:
+                st.session_state.library.add(st.session_state.current_van)
+                st.sidebar.success(f"Фургон '{unique_name}' сохранен!")
+
+
+    # --- ИНТЕРФЕЙС ДЛЯ СБОРКИ ---
+    elif st.session_state.vehicle_type == "Сборка автопоезда":
+        st.sidebar.header("Сборка")
+        tractors = st.session_state.library.names(Tractor)
+        trailers = st.session_state.library.names(SemiTrailer)
+    
+        if not tractors or not trailers:
+            st.sidebar.warning("Сначала создайте и сохраните в библиотеку хотя бы один тягач и один прицеп.")
+        else:
+            sel_tractor_name = st.sidebar.selectbox("Выберите тягач", tractors)
+            sel_trailer_name = st.sidebar.selectbox("Выберите прицеп", trailers)
+            if st.sidebar.button("Собрать автопоезд"):
+                st.session_state.current_tractor = st.session_state.library[sel_tractor_name]
+                st.session_state.current_trailer = st.session_state.library[sel_trailer_name]
+                st.sidebar.success("Автопоезд готов к отображению!")
+
+    # --- Основная область и 3D Сцена ---
+    trace.stage("app.scene")
+    st.header("3D Модель")
+    # Сцена и фигура живут между перезапусками: перестраиваются только изменившиеся узлы
+    scene = st.session_state.scene
+
+    if st.session_state.vehicle_type == "Тягач":
+        scene.set_node("main", st.session_state.current_tractor)
+    elif st.session_state.vehicle_type == "Прицеп":
+        scene.set_node("main", st.session_state.current_trailer)
+    elif st.session_state.vehicle_type == "Фургон":
+        scene.set_node("main", st.session_state.current_van)
+    elif st.session_state.vehicle_type == "Сборка автопоезда":
+        scene.add_articulated_vehicle(st.session_state.current_tractor, st.session_state.current_trailer, name="main")
+        # Зазоры по углам складывания считаются один раз на пару; пересекающиеся детали выделяются на сцене
+        try:
+            pair_key = (geometry_key(st.session_state.current_tractor), geometry_key(st.session_state.current_trailer))
+            if st.session_state.get("clearance_key") != pair_key:
+                st.session_state.clearance = coupling_clearance(st.session_state.current_tractor,
+                                                                st.session_state.current_trailer)
+                st.session_state.clearance_key = pair_key
+            clearance = st.session_state.clearance
+            scene.set_highlight("main/tractor", clearance["offending"]["tractor"])
+            scene.set_highlight("main/trailer", clearance["offending"]["trailer"])
+        except (OSError, AssetError):
+            clearance = None # Ошибку загрузки модели покажет построение фигуры ниже
+
+    try:
+        if RENDER_WORKERS:
+            # Пул строит фигуру целиком при изменении сцены; одинаковые сцены разных сессий строятся один раз
+            figure_key, spec = scene_spec(scene)
+            if st.session_state.figure is None or st.session_state.get("figure_key") != figure_key:
+                try:
+                    st.session_state.figure = shared_pool(RENDER_WORKERS).figure(figure_key, spec)
+                except RenderError:
+                    st.session_state.figure = scene.generate_figure() # Пул перегружен - строим сами
+                st.session_state.figure_key = figure_key
+        elif st.session_state.figure is None:
+            st.session_state.figure = scene.generate_figure()
+        else:
+            scene.update_figure(st.session_state.figure)
+    except (OSError, AssetError) as e:
+        # Битый или отсутствующий файл модели не должен ронять приложение
+        st.error(f"Не удалось загрузить модель: {e}")
+    if st.session_state.figure is not None:
+        # Включает сериализацию фигуры в JSON внутри Streamlit
+        with span("app.plotly_chart"):
+            st.plotly_chart(st.session_state.figure, use_container_width=True)
+        if st.session_state.vehicle_type == "Сборка автопоезда" and clearance is not None:
+            if clearance["contacts"] and clearance["contacts"][0][3] < 0:
+                angle, tractor_part, trailer_part, distance = clearance["contacts"][0]
+                st.warning(f"Детали пересекаются при складывании до {DEFAULT_MAX_ANGLE:g}°: {tractor_part} и "
+                           f"{trailer_part} на {-distance:.2f} м при угле {abs(math.degrees(angle)):.0f}°. "
+                           f"Пересекающиеся детали выделены красным.")
+            elif clearance["contacts"]:
+                angle, tractor_part, trailer_part, distance = clearance["contacts"][0]
+                st.caption(f"Наименьший зазор: {tractor_part} - {trailer_part} {distance:.2f} м "
+                           f"при угле складывания {abs(math.degrees(angle)):.0f}°")
+            else:
+                st.caption(f"Зазор между тягачом и прицепом больше 1 м при складывании до {DEFAULT_MAX_ANGLE:g}°")
+        # Замер сериализует фигуру еще раз, поэтому включается только по запросу
+        if st.sidebar.checkbox("Показывать размер фигуры", key="show_payload"):
+            report = payload_report(st.session_state.figure)
+            st.caption(f"Фигура: {report['total'] / 1024:.1f} КБ; "
+                       + ", ".join(f"{name}: {size / 1024:.1f} КБ" for name, size in report['traces']))
+
+    # --- Маневрирование автопоезда ---
+    # Дуга маневра в радианах; наружный передний угол тягача идет по внешнему радиусу
+    MANEUVERS = {"Круг поворота 360°": 2 * math.pi, "Разворот 180°": math.pi, "Поворот 90°": math.pi / 2}
+    if st.session_state.vehicle_type == "Сборка автопоезда":
+        trace.stage("app.maneuver")
+        with st.expander("Маневрирование: габаритный коридор"):
+            maneuver = st.selectbox("Маневр", tuple(MANEUVERS), key="maneuver_type")
+            outer_radius = st.number_input("Внешний радиус габаритного круга (м)", value=TURNING_CIRCLE_OUTER,
+                                           step=0.1, key="maneuver_outer")
+            inner_radius = st.number_input("Внутренний радиус габаритного круга (м)", value=TURNING_CIRCLE_INNER,
+                                           step=0.1, key="maneuver_inner")
+
+            if st.button("Смоделировать маневр"):
+                tractor, trailer = st.session_state.current_tractor, st.session_state.current_trailer
+                check = turning_circle_check(tractor, trailer, outer_radius, inner_radius)[0]
+                if math.isnan(check["front_radius"]):
+                    st.session_state.maneuver = None
+                    st.error("Тягач не вписывается во внешний радиус: база с передним свесом длиннее радиуса.")
+                else:
+                    angle = MANEUVERS[maneuver]
+                    path = arc_path(check["front_radius"], angle, approach=5.0, exit=0.0 if angle >= 2 * math.pi else 15.0)
+                    result = simulate(tractor, trailer, path)
+                    inner, _ = result.radii((0.0, check["front_radius"]))
+                    verdict = "проходит" if check["passes"] else "не проходит"
+                    st.session_state.maneuver = (swept_path_figure(result, tractor, trailer), (
+                        f"Круг {outer_radius:g}/{inner_radius:g} м: {verdict} (внутренний радиус "
+                        f"{check['inner_radius']:.2f} м, внешний {check['outer_radius']:.2f} м). "
+                        f"Маневр: ближе всего к центру поворота {inner[0]:.2f} м, "
+                        f"ширина коридора до {result.swept_width():.2f} м."))
+            if st.session_state.get("maneuver"):
+                maneuver_figure, summary = st.session_state.maneuver
+                st.plotly_chart(maneuver_figure, use_container_width=True)
+                st.caption(summary)
+
+            # Все пары тягач x прицеп библиотеки интегрируются одновременно
+            if st.button("Проверить каталог на круг поворота"):
+                library = st.session_state.library
+                tractor_names, trailer_names = library.names(Tractor), library.names(SemiTrailer)
+                with st.spinner(f"Проверка {len(tractor_names) * len(trailer_names)} пар..."):
+                    check = turning_circle_check(library.to_structured(Tractor), library.to_structured(SemiTrailer),
+                                                 outer_radius, inner_radius, workers=BATCH_WORKERS)
+                st.session_state.circle_check = [
+                    {"Тягач": tractor_names[row["tractor"]], "Прицеп": trailer_names[row["trailer"]],
+                     "Внутренний радиус (м)": round(float(row["inner_radius"]), 2),
+                     "Внешний радиус (м)": round(float(row["outer_radius"]), 2), "Проходит": bool(row["passes"])}
+                    for row in check]
+            if st.session_state.get("circle_check") is not None:
+                rows = st.session_state.circle_check
+                st.caption(f"Проходят {sum(row['Проходит'] for row in rows)} из {len(rows)} пар")
+                st.dataframe(rows, use_container_width=True)
+
+        with st.expander("Зазоры сцепок в каталоге"):
+            # Аналитический скрининг кабина - кузов для всех пар и углов складывания
+            if st.button("Проверить зазоры всех пар"):
+                library = st.session_state.library
+                tractor_names, trailer_names = library.names(Tractor), library.names(SemiTrailer)
+                with st.spinner(f"Проверка {len(tractor_names) * len(trailer_names)} пар..."):
+                    screen = screen_pairs(library.to_structured(Tractor), library.to_structured(SemiTrailer),
+                                          workers=BATCH_WORKERS)
+                st.session_state.clearance_screen = sorted((
+                    {"Тягач": tractor_names[row["tractor"]], "Прицеп": trailer_names[row["trailer"]],
+                     "Зазор (м)": round(float(row["clearance"]), 3), "Угол (°)": float(row["worst_angle"]),
+                     "Пересечение": bool(row["collides"])}
+                    for row in screen), key=lambda row: row["Зазор (м)"])
+            if st.session_state.get("clearance_screen") is not None:
+                rows = st.session_state.clearance_screen
+                st.caption(f"Пересечения в {sum(row['Пересечение'] for row in rows)} из {len(rows)} пар")
+                st.dataframe(rows, use_container_width=True)
+
+    # Экспорт 3D-модели тоже собирается только по кнопке
+    trace.stage("app.export")
+    export_format = st.selectbox("Формат 3D-экспорта", tuple(FORMATS), key="mesh_export_format")
+    if st.button("Подготовить 3D-экспорт"):
+        buffer = io.BytesIO()
+        try:
+            export_scene(scene, buffer, export_format)
+        except (OSError, AssetError) as e:
+            st.session_state.mesh_export = None
+            st.error(f"Не удалось загрузить модель: {e}")
+        else:
+            st.session_state.mesh_export = (export_format, buffer.getvalue())
+    if st.session_state.get("mesh_export"):
+        fmt, data = st.session_state.mesh_export
+        extension, mime = FORMATS[fmt]
+        st.download_button("Скачать 3D-модель", data, file_name=f"scene.{extension}", mime=mime)
+
+    trace.stage("app.library")
+    st.sidebar.header("Библиотека")
+
+    with st.sidebar.expander("Импорт / экспорт каталога"):
+        uploaded = st.file_uploader("Каталог (CSV или JSONL)", type=["csv", "jsonl"])
+        if uploaded is not None and st.button("Импортировать"):
+            fmt = "csv" if uploaded.name.lower().endswith(".csv") else "jsonl"
+            errors = ErrorLog(max_messages=10)
+            try:
+                stats = import_file(st.session_state.library,
+                                    io.TextIOWrapper(uploaded, encoding="utf-8", newline=""), fmt, errors=errors)
+            except (OSError, ValueError, csv.Error) as e:
+                # Битая кодировка или структура файла; пачки до ошибки уже в библиотеке
+                st.error(f"Импорт прерван: {e}")
+            else:
+                st.success(f"Добавлено: {stats['added']}, дубликатов: {stats['skipped']}, "
+                           f"с ошибками: {stats['invalid']}")
+            for message in errors.messages:
+                st.warning(message)
+
+        # Экспорт собирается только по кнопке, чтобы не сериализовать библиотеку на каждом перезапуске
+        if st.button("Подготовить экспорт (CSV)"):
+            buffer = io.StringIO()
+            export_csv(st.session_state.library, buffer)
+            st.session_state.catalog_export = buffer.getvalue()
+        if st.session_state.get("catalog_export"):
+            st.download_button("Скачать каталог", st.session_state.catalog_export,
+                               file_name="catalog.csv", mime="text/csv")
+
+    # Галерея миниатюр: PNG рисуются один раз и дальше берутся из общего кэша процесса
+    GALLERY_PAGE_SIZE = 6
+    if st.session_state.library:
+        names = st.session_state.library.keys()
+        pages = (len(names) + GALLERY_PAGE_SIZE - 1) // GALLERY_PAGE_SIZE
+        page = st.sidebar.number_input("Страница", min_value=1, max_value=pages, value=1, step=1,
+                                       key="gallery_page") if pages > 1 else 1
+        page_names = names[(page - 1) * GALLERY_PAGE_SIZE:page * GALLERY_PAGE_SIZE]
+        try:
+            images = render_thumbnails([st.session_state.library[name] for name in page_names])
+            st.sidebar.image(images, caption=page_names, width=140)
+        except (OSError, AssetError) as e:
+            st.sidebar.warning(f"Не удалось нарисовать миниатюры: {e}")
+            st.sidebar.json(page_names)
+    else:
+        st.sidebar.write("Пусто")
+finally:
+    trace.finish()
+    if profiler is not None:
+        st.session_state.profile = profiler.stop()
+
+# --- Производительность ---
+if METRICS_PATH:
+    metrics.write_prometheus(METRICS_PATH, min_interval=5)
+
+if st.sidebar.checkbox("Отладка производительности", key="debug_panel"):
+    with st.expander("Производительность перезапуска", expanded=True):
+        st.caption(f"Перезапуск: {trace.total * 1e3:.1f} мс (без вывода этой панели)")
+        st.table([{"Этап": "\u00a0\u00a0" * depth + name, "мс": round(elapsed * 1e3, 2)}
+                  for name, depth, _, elapsed in trace.records if elapsed is not None])
+        snapshot = metrics.snapshot()
+        st.json({"counters": snapshot["counters"], "gauges": snapshot["gauges"]}, expanded=False)
+        st.checkbox("Сэмплирующий профилировщик (со следующего перезапуска)", key="profile_rerun")
+        profile = st.session_state.get("profile")
+        if profile is not None and profile.samples:
+            st.table([{"Функция": name, "Доля сэмплов": f"{share:.0%}"}
+                      for name, share in profile.top_functions(15)])
+            st.download_button("Скачать стеки (collapsed)", profile.collapsed(),
+                               file_name="rerun.collapsed.txt", mime="text/plain")
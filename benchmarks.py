@@ -0,0 +1,246 @@
+"""Бенчмарки построения геометрии и фигур с сохранением базовой линии.
+
+Запуск:
+  python benchmarks.py                        - полный прогон, таблица в stdout;
+  python benchmarks.py --quick                - сокращенная сетка параметров;
+  python benchmarks.py --save baseline.json   - сохранить результаты как базовую линию;
+  python benchmarks.py --compare baseline.json [--tolerance 0.25] [--time-tolerance 0.5]
+                                              - сравнить с базовой линией; код выхода 1 при регрессии.
+  python benchmarks.py --filter figure/       - только случаи, в имени которых есть подстрока.
+
+Для каждого случая измеряются время (минимум и медиана по повторам),
+пиковая память по tracemalloc (отдельным прогоном, чтобы трассировка не
+искажала время), а для фигур - число трасс и размер сериализованной фигуры.
+Случаи намеренно строят геометрию без общего кэша: измеряется стоимость
+перестроения, а не попадания в кэш: ТС сцены различаются геометрией, а не
+маркой. Базовая линия имеет смысл только на той же машине и в том же
+окружении; базовые линии, снятые до этого правила, в случаях figure/* и
+rerun/* мерили попадания в кэш и сравнивать с ними нельзя.
+"""
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import plotly
+import plotly.graph_objects as go
+
+from figure_transport import payload_bytes
+from clearance import coupling_clearance, screen_pairs
+from fleet_evaluation import to_structured
+from swept_path import turning_circle_check
+from vehicle_constructor import (LOD_SEGMENTS, GeometryCache, Scene, SemiTrailer, Tractor, Van,
+                                 _create_cuboid, _create_cylinder, grid_layout)
+
+AXLE_COUNTS = tuple(range(1, 11))
+WHEEL_TYPES = ('single', 'dual')
+SCENE_SIZES = (1, 10, 100, 1000)
+QUICK_AXLE_COUNTS = (1, 3, 10)
+QUICK_SCENE_SIZES = (1, 10, 100)
+FLEET_SIZES = (10, 100) # Тягачей и прицепов в пакетной проверке круга поворота
+QUICK_FLEET_SIZES = (10,)
+
+# --- Случаи ---
+
+def _vehicle(vehicle_cls, axles, wheel_type):
+    axle_param = 'num_axles' if vehicle_cls is SemiTrailer else 'num_rear_axles'
+    return vehicle_cls(**{axle_param: axles, 'wheel_type': wheel_type})
+
+# Класс ТС и геометрический параметр, который меняется от узла к узлу сцены: марка и модель
+# в ключ кэша геометрии не входят и одинаковые ТС не различают
+_SCENE_VEHICLES = ((Tractor, 'wheelbase', 3.6), (SemiTrailer, 'length', 13.6), (Van, 'wheelbase', 4.0))
+
+def _scene(count, lod):
+    """Сцена из count разных ТС (по узлу на ТС), геометрия строится с нуля."""
+    scene = Scene(cache=GeometryCache(), lod=lod)
+    positions = grid_layout(count, columns=10, spacing_x=20, spacing_y=4)
+    for i, (x, y, z, _) in enumerate(positions):
+        vehicle_cls, param, base = _SCENE_VEHICLES[i % 3]
+        vehicle = vehicle_cls(**{param: base + 0.001 * i})
+        scene.add(vehicle, x, y, z, name=f"v{i}")
+    return scene
+
+def _rerun(count, lod):
+    """Перезапуск с изменением одного ТС: подготовка сцены вне замера, замеряется update_figure."""
+    scene = _scene(count, lod)
+    fig = scene.generate_figure()
+    state = {'wheelbase': 3.6}
+
+    def run():
+        state['wheelbase'] += 0.1
+        scene.set_node('v0', Tractor(wheelbase=state['wheelbase']))
+        scene.update_figure(fig)
+        return fig
+    return run
+
+def _fleet(count):
+    """count тягачей и count прицепов с разными базами и свесами (структурированные массивы)."""
+    tractors = [Tractor(model=f"T{i}", wheelbase=3.2 + 0.01 * i, num_rear_axles=1 + i % 2) for i in range(count)]
+    trailers = [SemiTrailer(model=f"S{i}", length=12.0 + 0.02 * i, kingpin_offset=1.0 + 0.005 * i)
+                for i in range(count)]
+    return to_structured(tractors, Tractor), to_structured(trailers, SemiTrailer)
+
+def iter_cases(quick=False):
+    """Пары (имя случая, функция без аргументов); функция может вернуть фигуру."""
+    axle_counts = QUICK_AXLE_COUNTS if quick else AXLE_COUNTS
+    scene_sizes = QUICK_SCENE_SIZES if quick else SCENE_SIZES
+
+    yield 'primitives/cuboid x1000', lambda: [_create_cuboid((i, 0, 0), (1, 2, 3)) for i in range(1000)]
+    for lod, segments in LOD_SEGMENTS.items():
+        yield (f'primitives/cylinder/{lod} x100',
+               lambda segments=segments: [_create_cylinder((i, 0, 0), 0.5, 0.4, num_points=segments)
+                                          for i in range(100)])
+
+    for vehicle_cls in (Tractor, SemiTrailer, Van):
+        for axles in axle_counts:
+            for wheel_type in WHEEL_TYPES:
+                vehicle = _vehicle(vehicle_cls, axles, wheel_type)
+                for lod in LOD_SEGMENTS:
+                    yield (f'components/{vehicle_cls.__name__}/axles={axles}/{wheel_type}/{lod}',
+                           lambda vehicle=vehicle, lod=lod: vehicle.get_components(lod=lod))
+
+    for count in scene_sizes:
+        for lod in LOD_SEGMENTS:
+            yield f'figure/{count}/{lod}', lambda count=count, lod=lod: _scene(count, lod).generate_figure()
+        yield f'rerun/{count}/medium', _rerun(count, 'medium')
+
+    for count in (QUICK_FLEET_SIZES if quick else FLEET_SIZES):
+        tractors, trailers = _fleet(count)
+        yield (f'swept_path/turning_circle/{count}x{count}',
+               lambda tractors=tractors, trailers=trailers: turning_circle_check(tractors, trailers))
+        yield (f'clearance/screen/{count}x{count}',
+               lambda tractors=tractors, trailers=trailers: screen_pairs(tractors, trailers))
+    yield 'clearance/coupling/default', lambda: coupling_clearance(Tractor(), SemiTrailer())
+
+# --- Замеры ---
+
+def measure(fn, repeats=5, budget=1.0):
+    """Время вызовов fn: не больше repeats повторов и не дольше budget секунд (но хотя бы один)."""
+    times = []
+    start = time.perf_counter()
+    while len(times) < repeats:
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+        if time.perf_counter() - start > budget:
+            break
+    return times, result
+
+def peak_memory(fn):
+    """Пиковый объем памяти Python-аллокаций за один вызов fn (байты)."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_case(fn, repeats=5, budget=1.0):
+    times, result = measure(fn, repeats, budget)
+    record = {
+        'time_min': min(times),
+        'time_median': statistics.median(times),
+        'repeats': len(times),
+        'peak_bytes': peak_memory(fn),
+    }
+    if isinstance(result, go.Figure):
+        record['traces'] = len(result.data)
+        record['payload_bytes'] = payload_bytes(result)
+    return record
+
+def run(quick=False, name_filter=None, repeats=5, budget=1.0, out=sys.stdout):
+    results = {}
+    for name, fn in iter_cases(quick):
+        if name_filter and name_filter not in name:
+            continue
+        record = results[name] = run_case(fn, repeats, budget)
+        extra = ''
+        if 'traces' in record:
+            extra = f"  traces={record['traces']:<3} payload={record['payload_bytes'] / 1024:>9.1f} KB"
+        print(f"{name:<48} {record['time_median'] * 1e3:>10.3f} ms  "
+              f"peak={record['peak_bytes'] / 1024:>10.1f} KB{extra}", file=out, flush=True)
+    return results
+
+# --- Базовая линия ---
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'plotly': plotly.__version__,
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+
+def save_baseline(path, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment(), 'results': results}, f, ensure_ascii=False, indent=1)
+
+# Рост метрики меньше этих абсолютных порогов не считается регрессией: на коротких
+# случаях шум таймера и аллокатора дает десятки процентов
+TIME_FLOOR = 0.005 # секунды
+MEMORY_FLOOR = 256 << 10 # байты
+
+def compare(results, baseline, tolerance=0.25, time_tolerance=0.5):
+    """Регрессии относительно базовой линии: список строк (пустой - регрессий нет).
+
+    Медиана времени может превысить базовую не больше чем на time_tolerance
+    (доля), пиковая память и размер фигуры - на tolerance; рост времени
+    меньше TIME_FLOOR и памяти меньше MEMORY_FLOOR не учитывается. Число
+    трасс не должно расти.
+    """
+    limits = (('time_median', time_tolerance, TIME_FLOOR), ('peak_bytes', tolerance, MEMORY_FLOOR),
+              ('payload_bytes', tolerance, 0))
+    regressions = []
+    for name, record in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, allowed, floor in limits:
+            if metric not in record or metric not in base:
+                continue
+            if record[metric] > base[metric] * (1 + allowed) and record[metric] - base[metric] > floor:
+                regressions.append(f"{name}: {metric} {base[metric]:.6g} -> {record[metric]:.6g} "
+                                   f"(+{(record[metric] / base[metric] - 1) * 100:.0f}%)")
+        if record.get('traces', 0) > base.get('traces', record.get('traces', 0)):
+            regressions.append(f"{name}: traces {base['traces']} -> {record['traces']}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки геометрии и фигур")
+    parser.add_argument('--quick', action='store_true', help="сокращенная сетка параметров")
+    parser.add_argument('--filter', dest='name_filter', help="только случаи с этой подстрокой в имени")
+    parser.add_argument('--repeats', type=int, default=9)
+    parser.add_argument('--budget', type=float, default=1.0, help="секунд на замер времени одного случая")
+    parser.add_argument('--save', metavar='PATH', help="сохранить результаты как базовую линию")
+    parser.add_argument('--compare', metavar='PATH', help="сравнить с базовой линией")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="допустимый рост памяти и размера фигуры (доля)")
+    parser.add_argument('--time-tolerance', type=float, default=0.5, help="допустимый рост медианы времени (доля)")
+    args = parser.parse_args(argv)
+
+    results = run(args.quick, args.name_filter, args.repeats, args.budget)
+    if args.save:
+        save_baseline(args.save, results)
+        print(f"Базовая линия сохранена: {args.save}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        missing = sorted(set(baseline) - set(results))
+        if missing and not args.name_filter:
+            print(f"Нет в текущем прогоне: {len(missing)} случаев")
+        regressions = compare(results, baseline, args.tolerance, args.time_tolerance)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ {line}")
+        if regressions:
+            return 1
+        print("Регрессий нет")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""Общий для кэшей процесса LRU-кэш (геометрия, меши моделей, миниатюры)."""
+import collections
+import threading
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш, ограниченный числом записей и/или объемом значений.
+
+    size_of(value) - объем значения в байтах, учитывается только при заданном
+    max_bytes. Значение больше max_bytes не вытесняет само себя, пока оно
+    единственное в кэше. hits и misses считаются в lookup.
+    """
+    def __init__(self, max_entries=None, max_bytes=None, size_of=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = collections.OrderedDict() # Ключ -> (значение, объем)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key):
+        """Значение по ключу или None (промах)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def store(self, key, value):
+        """Кладет значение и вытесняет самые старые записи сверх лимитов."""
+        size = self.size_of(value) if self.max_bytes is not None else 0
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[1]
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while len(self._entries) > 1 and (
+                    (self.max_entries is not None and len(self._entries) > self.max_entries)
+                    or (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+
+    def stats(self):
+        with self._lock:
+            stats = {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+            if self.max_entries is not None:
+                stats['max_entries'] = self.max_entries
+            if self.max_bytes is not None:
+                stats.update(bytes=self.nbytes, max_bytes=self.max_bytes)
+            return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
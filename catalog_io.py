@@ -0,0 +1,189 @@
+"""Потоковый импорт и экспорт каталогов ТС в форматах CSV и JSONL.
+
+Каждая строка каталога - одно ТС: поле type (имя класса Tractor/SemiTrailer/Van
+или его подпись Тягач/Прицеп/Фургон) и параметры конструктора. Отсутствующие
+параметры берут значения по умолчанию конструктора. Строки читаются
+генераторами и пишутся в библиотеку пачками, поэтому память ограничена
+размером пачки, а не размером каталога.
+"""
+import csv
+import itertools
+import json
+import math
+
+from vehicle_library import VEHICLE_TYPES
+
+WHEEL_TYPES = ('single', 'dual')
+# Размеры, которые должны быть больше нуля, и положения, которые не могут быть отрицательными.
+# Целые параметры - числа осей, они не меньше 1, как в боковой панели приложения.
+POSITIVE_PARAMETERS = {'cab_length', 'cab_width', 'cab_height', 'wheelbase', 'wheel_diameter', 'wheel_width',
+                       'length', 'width', 'height', 'body_length', 'body_width', 'body_height'}
+NON_NEGATIVE_PARAMETERS = {'front_axle_pos', 'rear_axle_spacing', 'kingpin_offset', 'axle_pos_from_rear',
+                           'axle_spacing'}
+MAX_ERROR_MESSAGES = 100
+
+_TYPES_BY_NAME = {name: cls for cls in VEHICLE_TYPES for name in (cls.__name__, cls.TYPE_LABEL)}
+
+class CatalogError(ValueError):
+    """Строка каталога не соответствует схеме параметров ТС."""
+    def __init__(self, line, message):
+        super().__init__(f"Строка {line}: {message}")
+        self.line = line
+
+_DEFAULTS = {cls: cls.default_params() for cls in VEHICLE_TYPES}
+
+def _coerce(kind, value):
+    if kind is str:
+        return str(value)
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{value!r} не является конечным числом")
+    if kind is int:
+        if number != int(number):
+            raise ValueError(f"{value!r} не является целым числом")
+        return int(number)
+    return number
+
+def validate_record(record, line=0):
+    """Проверяет строку каталога и возвращает (класс ТС, параметры по схеме).
+
+    Пустые значения (как в CSV для чужих колонок) считаются отсутствующими.
+    """
+    if not isinstance(record, dict):
+        raise CatalogError(line, f"строка должна быть объектом, а не {type(record).__name__}")
+    if None in record:
+        # csv.DictReader кладет значения сверх заголовка под ключ None
+        raise CatalogError(line, f"лишние поля {record[None]} сверх заголовка")
+    record = {key: value for key, value in record.items() if value not in (None, '')}
+    type_name = record.pop('type', None)
+    vehicle_cls = _TYPES_BY_NAME.get(type_name)
+    if vehicle_cls is None:
+        raise CatalogError(line, f"неизвестный тип ТС {type_name!r}")
+
+    unknown = set(record) - set(vehicle_cls.PARAMETERS)
+    if unknown:
+        raise CatalogError(line, f"неизвестные параметры {sorted(unknown, key=str)} для {vehicle_cls.__name__}")
+
+    params = dict(_DEFAULTS[vehicle_cls])
+    for name, value in record.items():
+        try:
+            params[name] = _coerce(vehicle_cls.PARAMETERS[name], value)
+        except (TypeError, ValueError) as e:
+            raise CatalogError(line, f"параметр {name}: {e}") from None
+    for name, kind in vehicle_cls.PARAMETERS.items():
+        value = params[name]
+        if kind is int and value < 1:
+            raise CatalogError(line, f"параметр {name} должен быть не меньше 1")
+        if name in POSITIVE_PARAMETERS and value <= 0:
+            raise CatalogError(line, f"параметр {name} должен быть больше нуля")
+        if name in NON_NEGATIVE_PARAMETERS and value < 0:
+            raise CatalogError(line, f"параметр {name} не может быть отрицательным")
+    if params['wheel_type'] not in WHEEL_TYPES:
+        raise CatalogError(line, f"wheel_type должен быть одним из {WHEEL_TYPES}")
+    return vehicle_cls, params
+
+# --- Чтение ---
+
+def iter_csv_records(f):
+    """Строки CSV-каталога (с заголовком) как словари."""
+    yield from csv.DictReader(f)
+
+def iter_jsonl_records(f):
+    """Строки JSONL-каталога как словари; пустые строки пропускаются.
+
+    Вместо строки с некорректным JSON выдается CatalogError: чтение
+    продолжается, а ошибку учитывает iter_valid_records.
+    """
+    line = 0
+    for text in f:
+        if text.strip():
+            line += 1
+            try:
+                record = json.loads(text)
+            except ValueError as e:
+                record = CatalogError(line, f"некорректный JSON: {e}")
+            yield record
+
+class ErrorLog:
+    """Ошибки строк каталога: общее число и тексты первых max_messages.
+
+    Хранятся строки, а не исключения с трассировками, поэтому память не
+    растет с числом ошибочных строк.
+    """
+    def __init__(self, max_messages=MAX_ERROR_MESSAGES):
+        self.max_messages = max_messages
+        self.count = 0
+        self.messages = []
+
+    def add(self, error):
+        self.count += 1
+        if len(self.messages) < self.max_messages:
+            self.messages.append(str(error))
+
+def iter_valid_records(records, errors=None):
+    """Проверяет записи по одной и выдает (класс ТС, параметры).
+
+    Если передан errors (ErrorLog), ошибочные строки учитываются в нем и
+    пропускаются; иначе первая ошибка прерывает чтение.
+    """
+    for line, record in enumerate(records, start=1):
+        try:
+            if isinstance(record, CatalogError):
+                raise record
+            yield validate_record(record, line)
+        except CatalogError as e:
+            if errors is None:
+                raise
+            errors.add(e)
+
+def import_catalog(library, records, batch_size=10000, errors=None):
+    """Загружает записи каталога в библиотеку пачками по batch_size.
+
+    Дубликаты по уникальному имени (как в библиотеке, так и внутри каталога)
+    пропускаются. Возвращает статистику {'added', 'skipped', 'invalid'}.
+    """
+    if errors is None:
+        errors = ErrorLog()
+    stats = {'added': 0, 'skipped': 0, 'invalid': 0}
+    valid = iter_valid_records(records, errors)
+    while True:
+        batch = list(itertools.islice(valid, batch_size))
+        if not batch:
+            break
+        added = library.extend(batch)
+        stats['added'] += added
+        stats['skipped'] += len(batch) - added
+    stats['invalid'] = errors.count
+    return stats
+
+def import_file(library, f, fmt, **kwargs):
+    """Импортирует открытый текстовый файл формата 'csv' или 'jsonl'."""
+    records = iter_csv_records(f) if fmt == 'csv' else iter_jsonl_records(f)
+    return import_catalog(library, records, **kwargs)
+
+# --- Запись ---
+
+def iter_export_records(library, vehicle_types=VEHICLE_TYPES):
+    """Все ТС библиотеки как плоские словари с полем type."""
+    for vehicle_cls in vehicle_types:
+        for params in library.iter_params(vehicle_cls):
+            yield {'type': vehicle_cls.__name__, **params}
+
+def export_jsonl(library, f, vehicle_types=VEHICLE_TYPES):
+    """Потоково пишет библиотеку в JSONL; возвращает число записей."""
+    count = 0
+    for record in iter_export_records(library, vehicle_types):
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+def export_csv(library, f, vehicle_types=VEHICLE_TYPES):
+    """Потоково пишет библиотеку в CSV с объединением колонок всех типов."""
+    fieldnames = ['type'] + list(dict.fromkeys(name for cls in vehicle_types for name in cls.PARAMETERS))
+    writer = csv.DictWriter(f, fieldnames=fieldnames)
+    writer.writeheader()
+    count = 0
+    for record in iter_export_records(library, vehicle_types):
+        writer.writerow(record)
+        count += 1
+    return count
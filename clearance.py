@@ -0,0 +1,393 @@
+"""Проверка пересечений и зазоров в сцепке тягач + полуприцеп.
+
+Прицеп складывается относительно тягача поворотом вокруг вертикальной оси
+шкворня. Поэтому оба ТС задаются коробками, выровненными по осям в своих
+локальных координатах, а коробки прицепа поворачиваются только по yaw.
+Расстояние между такими коробками (призмами с параллельными вертикальными
+осями) считается точно: в плане - по разделяющим осям и вершинам
+прямоугольников, по высоте - по интервалам. Отрицательное расстояние -
+глубина взаимного проникновения.
+
+Подробный анализ одной сцепки работает по деталям из geometry_cache. Каждая
+деталь разбивается на связные куски (колеса набора - отдельные куски), по
+кускам строится иерархия AABB (BVH). Обход двух иерархий идет сразу для
+всех углов складывания. Коробки кусков описывают детали с запасом (колесо -
+коробкой), поэтому зазор по ним - нижняя оценка: пересечение не
+пропускается.
+
+Пакетный скрининг библиотеки считает аналитически по параметрам: кабина и
+кузов прицепа - коробки, все пары x все углы - массивами, как в
+fleet_evaluation.
+"""
+import functools
+
+import numpy as np
+
+from fleet_evaluation import as_structured
+from parallel import map_blocks
+from vehicle_constructor import SemiTrailer, Tractor, geometry_cache
+
+DEFAULT_MAX_ANGLE = 90.0 # Предельный угол складывания, градусы
+DEFAULT_ANGLES = np.radians(np.arange(-DEFAULT_MAX_ANGLE, DEFAULT_MAX_ANGLE + 1, 5.0))
+LEAF_SIZE = 4
+
+# Проверяемые пары деталей: кабина тягача со всеми деталями прицепа и колеса
+# прицепа со всеми деталями тягача. Седло, рамы и задние колеса тягача под
+# прицепом в упрощенной модели перекрываются по построению.
+TRACTOR_CHECKED_PARTS = frozenset({'Кабина'})
+TRAILER_CHECKED_PARTS = frozenset({'Колесо'})
+
+SCREEN_RESULT_DTYPE = np.dtype([
+    ('tractor', 'i4'), ('trailer', 'i4'),
+    ('clearance', 'f8'), ('worst_angle', 'f8'), ('collides', '?'),
+])
+
+# --- Расстояние между коробками ---
+
+def _point_rect_distance(px, py, x0, x1, y0, y1):
+    return np.hypot(np.maximum(np.maximum(x0 - px, px - x1), 0), np.maximum(np.maximum(y0 - py, py - y1), 0))
+
+def box_distance(a_lo, a_hi, b_lo, b_hi, transforms):
+    """Расстояние между коробкой A и коробкой B, размещенной в системе A (массивы транслируются).
+
+    a_lo, a_hi, b_lo, b_hi - углы коробок (..., 3) в их локальных координатах;
+    transforms (..., 4) - x, y, z и yaw, переводящие координаты B в систему A.
+    Положительное значение - зазор, отрицательное - глубина проникновения.
+    """
+    tx, ty, tz, yaw = transforms[..., 0], transforms[..., 1], transforms[..., 2], transforms[..., 3]
+    cos, sin = np.cos(yaw), np.sin(yaw)
+
+    # По высоте: перекрытие интервалов (положительное) или зазор
+    overlap_z = np.minimum(a_hi[..., 2], b_hi[..., 2] + tz) - np.maximum(a_lo[..., 2], b_lo[..., 2] + tz)
+
+    # В плане: разделяющие оси - оси A (x, y) и оси B (u, v)
+    a_center, a_half = (a_lo + a_hi)[..., :2] / 2, (a_hi - a_lo)[..., :2] / 2
+    b_local, b_half = (b_lo + b_hi)[..., :2] / 2, (b_hi - b_lo)[..., :2] / 2
+    dx = tx + cos * b_local[..., 0] - sin * b_local[..., 1] - a_center[..., 0]
+    dy = ty + sin * b_local[..., 0] + cos * b_local[..., 1] - a_center[..., 1]
+    abs_cos, abs_sin = np.abs(cos), np.abs(sin)
+    overlaps = np.stack([
+        a_half[..., 0] + b_half[..., 0] * abs_cos + b_half[..., 1] * abs_sin - np.abs(dx),
+        a_half[..., 1] + b_half[..., 0] * abs_sin + b_half[..., 1] * abs_cos - np.abs(dy),
+        b_half[..., 0] + a_half[..., 0] * abs_cos + a_half[..., 1] * abs_sin - np.abs(cos * dx + sin * dy),
+        b_half[..., 1] + a_half[..., 0] * abs_sin + a_half[..., 1] * abs_cos - np.abs(-sin * dx + cos * dy),
+    ])
+    penetration = overlaps.min(axis=0)
+
+    # Разнесенные выпуклые многоугольники: ближайшая точка - вершина одного из них
+    gaps = []
+    for sx, sy in ((-1, -1), (-1, 1), (1, -1), (1, 1)):
+        # Вершина B в системе A и вершина A в системе B (относительно центров)
+        bx, by = sx * b_half[..., 0], sy * b_half[..., 1]
+        gaps.append(_point_rect_distance(dx + cos * bx - sin * by, dy + sin * bx + cos * by,
+                                         -a_half[..., 0], a_half[..., 0], -a_half[..., 1], a_half[..., 1]))
+        ax, ay = sx * a_half[..., 0] - dx, sy * a_half[..., 1] - dy
+        gaps.append(_point_rect_distance(cos * ax + sin * ay, -sin * ax + cos * ay,
+                                         -b_half[..., 0], b_half[..., 0], -b_half[..., 1], b_half[..., 1]))
+    gap_xy = np.minimum.reduce(gaps)
+
+    intersect_xy = penetration > 0
+    return np.where(intersect_xy,
+                    np.where(overlap_z > 0, -np.minimum(penetration, overlap_z), -overlap_z),
+                    np.where(overlap_z > 0, gap_xy, np.hypot(gap_xy, np.minimum(overlap_z, 0))))
+
+# --- Иерархия ограничивающих коробок ---
+
+def piece_boxes(parts):
+    """Коробки связных кусков деталей: (boxes (N, 2, 3), индекс детали для каждого куска)."""
+    boxes, owners = [], []
+    for index, part in enumerate(parts):
+        labels = np.arange(len(part.vertices))
+        faces = np.asarray(part.faces)
+        # Связные компоненты: минимальная метка распространяется по треугольникам
+        while True:
+            smallest = labels[faces].min(axis=1)
+            updated = labels.copy()
+            for corner in range(3):
+                np.minimum.at(updated, faces[:, corner], smallest)
+            updated = updated[updated]
+            if np.array_equal(updated, labels):
+                break
+            labels = updated
+        _, component = np.unique(labels, return_inverse=True)
+        count = component.max() + 1
+        lo = np.full((count, 3), np.inf)
+        hi = np.full((count, 3), -np.inf)
+        np.minimum.at(lo, component, part.vertices)
+        np.maximum.at(hi, component, part.vertices)
+        boxes.append(np.stack([lo, hi], axis=1))
+        owners.append(np.full(count, index))
+    if not boxes:
+        return np.empty((0, 2, 3)), np.empty(0, dtype=int)
+    return np.concatenate(boxes), np.concatenate(owners)
+
+class BVH:
+    """Иерархия AABB над коробками (N, 2, 3); узлы хранятся в массивах.
+
+    Лист хранит до leaf_size коробок: их номера - order[start:start + count].
+    У внутреннего узла count = 0, а потомки - left и right.
+    """
+    def __init__(self, boxes, leaf_size=LEAF_SIZE):
+        self.boxes = np.asarray(boxes, dtype=float)
+        self.order = np.arange(len(self.boxes))
+        lo, hi, left, right, start, count = [], [], [], [], [], []
+        centers = self.boxes.mean(axis=1)
+
+        def build(begin, end):
+            node = len(lo)
+            items = self.order[begin:end]
+            lo.append(self.boxes[items, 0].min(axis=0))
+            hi.append(self.boxes[items, 1].max(axis=0))
+            left.append(-1)
+            right.append(-1)
+            start.append(begin)
+            count.append(end - begin)
+            if end - begin > leaf_size:
+                # Делим по медиане центров вдоль самой длинной оси
+                axis = np.argmax(np.ptp(centers[items], axis=0))
+                middle = (end - begin) // 2
+                self.order[begin:end] = items[np.argpartition(centers[items, axis], middle)]
+                count[node] = 0
+                left[node] = build(begin, begin + middle)
+                right[node] = build(begin + middle, end)
+            return node
+
+        if len(self.boxes):
+            build(0, len(self.boxes))
+        self.lo, self.hi = np.array(lo).reshape(-1, 3), np.array(hi).reshape(-1, 3)
+        self.left, self.right = np.array(left, dtype=int), np.array(right, dtype=int)
+        self.start, self.count = np.array(start, dtype=int), np.array(count, dtype=int)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def query(self, other, transforms, max_distance=0.0):
+        """Пары коробок self и other ближе max_distance при каждом размещении other.
+
+        transforms (A, 4) - размещения (x, y, z, yaw) системы other в системе
+        self. Обе иерархии обходятся одновременно для всех размещений; пары
+        узлов, коробки которых дальше max_distance, отбрасываются.
+        Возвращает массивы (номер размещения, коробка self, коробка other, расстояние).
+        """
+        transforms = np.asarray(transforms, dtype=float).reshape(-1, 4)
+        found = [[], [], [], []]
+        if not len(self) or not len(other):
+            return tuple(np.array(values) for values in found)
+        placement = np.arange(len(transforms))
+        i, j = np.zeros_like(placement), np.zeros_like(placement)
+        while len(placement):
+            distance = box_distance(self.lo[i], self.hi[i], other.lo[j], other.hi[j], transforms[placement])
+            near = distance <= max_distance
+            placement, i, j = placement[near], i[near], j[near]
+            leaf_i, leaf_j = self.count[i] > 0, other.count[j] > 0
+
+            # Два листа: проверяем все пары их коробок
+            both = leaf_i & leaf_j
+            ci, cj = self.count[i[both]], other.count[j[both]]
+            pairs = ci * cj
+            owner = np.repeat(np.arange(len(pairs)), pairs)
+            local = np.arange(pairs.sum()) - np.repeat(np.cumsum(pairs) - pairs, pairs)
+            items_i = self.order[self.start[i[both]][owner] + local // cj[owner]]
+            items_j = other.order[other.start[j[both]][owner] + local % cj[owner]]
+            leaf_placement = placement[both][owner]
+            distance = box_distance(self.boxes[items_i, 0], self.boxes[items_i, 1],
+                                    other.boxes[items_j, 0], other.boxes[items_j, 1], transforms[leaf_placement])
+            near = distance <= max_distance
+            for values, selected in zip(found, (leaf_placement, items_i, items_j, distance)):
+                values.append(selected[near])
+
+            # Иначе спускаемся в больший по объему узел (лист не делится)
+            volume_i = np.prod(self.hi[i] - self.lo[i], axis=1)
+            volume_j = np.prod(other.hi[j] - other.lo[j], axis=1)
+            split_i = ~both & (leaf_j | (~leaf_i & (volume_i >= volume_j)))
+            split_j = ~both & ~split_i
+            placement = np.concatenate([placement[split_i], placement[split_i], placement[split_j], placement[split_j]])
+            i, j = (np.concatenate([self.left[i[split_i]], self.right[i[split_i]], i[split_j], i[split_j]]),
+                    np.concatenate([j[split_i], j[split_i], other.left[j[split_j]], other.right[j[split_j]]]))
+        return tuple(np.concatenate(values) for values in found)
+
+# --- Анализ сцепки ---
+
+def articulation_transforms(tractor, trailer, angles):
+    """Размещения (A, 4) прицепа в системе узла тягача при углах складывания angles (радианы).
+
+    При нулевом угле прицеп стоит как в Scene.add_articulated_vehicle; при
+    складывании он поворачивается вокруг шкворня на седле.
+    """
+    angles = np.asarray(angles, dtype=float)
+    y_offset_tractor = (trailer.width - tractor.cab_width) / 2
+    kingpin = np.array([tractor.saddle_pos, trailer.width / 2 - y_offset_tractor])
+    start = np.array([tractor.saddle_pos - trailer.kingpin_offset, -y_offset_tractor])
+    cos, sin = np.cos(angles), np.sin(angles)
+    rel = start - kingpin
+    return np.column_stack([kingpin[0] + cos * rel[0] - sin * rel[1], kingpin[1] + sin * rel[0] + cos * rel[1],
+                            np.full(len(angles), tractor.frame_level_z), angles])
+
+def coupling_clearance(tractor, trailer, angles=DEFAULT_ANGLES, lod='coarse', max_distance=1.0):
+    """Зазоры между деталями тягача и прицепа при углах складывания angles (радианы).
+
+    Возвращает словарь:
+      'angles' - углы (A,);
+      'clearance' - наименьший зазор проверяемых деталей при каждом угле
+        (inf - ближе max_distance ничего нет, отрицательный - пересечение);
+      'contacts' - список (угол, деталь тягача, деталь прицепа, зазор) ближе
+        max_distance, по наименьшему зазору для каждой пары деталей и угла;
+      'offending' - {'tractor': имена, 'trailer': имена} деталей с пересечением.
+    """
+    angles = np.asarray(angles, dtype=float)
+    tractor_parts = geometry_cache.get_components(tractor, lod=lod)
+    trailer_parts = geometry_cache.get_components(trailer, lod=lod)
+    tractor_boxes, tractor_owner = piece_boxes(tractor_parts)
+    trailer_boxes, trailer_owner = piece_boxes(trailer_parts)
+    tractor_names = np.array([p.name for p in tractor_parts], dtype=object)[tractor_owner]
+    trailer_names = np.array([p.name for p in trailer_parts], dtype=object)[trailer_owner]
+
+    placement, i, j, distance = BVH(tractor_boxes).query(
+        BVH(trailer_boxes), articulation_transforms(tractor, trailer, angles), max_distance)
+    checked = (np.isin(tractor_names[i], list(TRACTOR_CHECKED_PARTS))
+               | np.isin(trailer_names[j], list(TRAILER_CHECKED_PARTS)))
+    placement, i, j, distance = placement[checked], i[checked], j[checked], distance[checked]
+
+    clearance = np.full(len(angles), np.inf)
+    np.minimum.at(clearance, placement, distance)
+    closest = {}
+    for a, name_i, name_j, d in zip(placement.tolist(), tractor_names[i], trailer_names[j], distance.tolist()):
+        key = (a, name_i, name_j)
+        closest[key] = min(d, closest.get(key, np.inf))
+    contacts = sorted(((float(angles[a]), name_i, name_j, d) for (a, name_i, name_j), d in closest.items()),
+                      key=lambda contact: contact[3])
+    colliding = distance < 0
+    return {
+        'angles': angles,
+        'clearance': clearance,
+        'contacts': contacts,
+        'offending': {'tractor': set(tractor_names[i[colliding]]), 'trailer': set(trailer_names[j[colliding]])},
+    }
+
+# --- Пакетный скрининг ---
+
+def _point_rect_squared(px, py, x0, x1, half_y):
+    """Квадрат расстояния от точки до прямоугольника x0..x1, |y| <= half_y (ноль внутри)."""
+    ex = np.maximum(np.maximum(x0 - px, px - x1), 0)
+    ey = np.maximum(np.abs(py) - half_y, 0)
+    return ex * ex + ey * ey
+
+def _cab_body_rects(tractors, trailers):
+    """Кабина и кузов в плане: (x0, x1, полуширина) в своих системах, начало - шкворень."""
+    t, s = tractors, trailers
+    saddle_pos = t['front_axle_pos'] + t['wheelbase'] + t['saddle_pos_from_rear_axle']
+    return ((-saddle_pos, t['cab_length'] - saddle_pos, t['cab_width'] / 2),
+            (-s['kingpin_offset'], s['length'] - s['kingpin_offset'], s['width'] / 2))
+
+def _plan_overlap(cab, body, cos, sin):
+    """Наименьшее перекрытие проекций кабины и повернутого кузова на их оси (SAT).
+
+    Больше нуля - прямоугольники пересекаются, и это глубина проникновения в
+    плане. Иначе минус перекрытие - нижняя оценка зазора. Слагаемые
+    сгруппированы так, чтобы величины только тягача или только прицепа с
+    углом считались на своих (меньших) формах массивов.
+    """
+    (cab_x0, cab_x1, cab_half), (body_x0, body_x1, body_half) = cab, body
+    cab_center, cab_half_x = (cab_x0 + cab_x1) / 2, (cab_x1 - cab_x0) / 2
+    body_center, body_half_x = (body_x0 + body_x1) / 2, (body_x1 - body_x0) / 2
+    abs_cos, abs_sin = np.abs(cos), np.abs(sin)
+    # Полные массивы пары x угол - только overlap и work, остальное считается на малых формах
+    overlap = np.abs(cos * body_center - cab_center)
+    work = np.add(cab_half_x, body_half_x * abs_cos + body_half * abs_sin)
+    np.subtract(work, overlap, out=overlap)
+    np.add(cab_half, body_half_x * abs_sin + body_half * abs_cos - np.abs(sin * body_center), out=work)
+    np.minimum(overlap, work, out=overlap)
+    np.subtract(body_center, cos * cab_center, out=work)
+    np.abs(work, out=work)
+    np.subtract(work, cab_half_x * abs_cos + cab_half * abs_sin, out=work)
+    np.subtract(body_half_x, work, out=work)
+    np.minimum(overlap, work, out=overlap)
+    np.add(body_half, cab_half_x * abs_sin + cab_half * abs_cos - np.abs(sin * cab_center), out=work)
+    return np.minimum(overlap, work, out=overlap)
+
+def _plan_gap(cab, body, cos, sin):
+    """Зазор разнесенных прямоугольников: наименьшее расстояние от вершин одного до другого."""
+    (cab_x0, cab_x1, cab_half), (body_x0, body_x1, body_half) = cab, body
+    gaps = []
+    for x in (body_x0, body_x1):
+        for y in (body_half, -body_half):
+            gaps.append(_point_rect_squared(x * cos - y * sin, x * sin + y * cos, cab_x0, cab_x1, cab_half))
+    for x in (cab_x0, cab_x1):
+        for y in (cab_half, -cab_half):
+            gaps.append(_point_rect_squared(x * cos + y * sin, y * cos - x * sin, body_x0, body_x1, body_half))
+    return np.sqrt(functools.reduce(np.minimum, gaps))
+
+def cab_body_clearance(tractors, trailers, angles):
+    """Зазор кабина - кузов прицепа для транслируемых массивов параметров и углов (радианы).
+
+    Коробки - те же, что строит get_components: кабина от переднего края до
+    cab_length, кузов от шкворня назад и вперед на kingpin_offset, оба на
+    уровне рамы тягача. Начало координат - шкворень. Точнее
+    fleet_evaluation.swing_clearance: учитывает ширину кабины и угол.
+    По высоте коробки всегда перекрываются, поэтому зазор считается в плане,
+    а глубина проникновения ограничена меньшей высотой, как в box_distance.
+    Результат - массив (..., len(angles)).
+    """
+    t, s = tractors, trailers
+    cab, body = _cab_body_rects(t[..., None], s[..., None])
+    angles = np.asarray(angles, dtype=float)
+    cos, sin = np.cos(angles), np.sin(angles)
+    overlap = _plan_overlap(cab, body, cos, sin)
+    depth = np.minimum(t['cab_height'], s['height'])[..., None]
+    return np.where(overlap > 0, -np.minimum(overlap, depth), _plan_gap(cab, body, cos, sin))
+
+def _screen_block(tractors, trailers, tractor_start, angles):
+    """Скрининг всех пар блока тягачей; строки упорядочены по тягачу, затем по прицепу.
+
+    Для всех пар x углов считается только перекрытие проекций: при
+    пересечении оно дает точный зазор, у разнесенных - нижнюю оценку.
+    Зазор по вершинам считается лишь там, где оценка не больше зазора при
+    угле с наименьшей оценкой; наименьший зазор и его угол - те же, что у
+    cab_body_clearance. Ось углов - внешняя, чтобы внутренние циклы NumPy
+    шли по длинной оси прицепов.
+    """
+    cab, body = _cab_body_rects(tractors[:, None], trailers[None, :])
+    cos, sin = np.cos(angles)[:, None, None], np.sin(angles)[:, None, None]
+    overlap = _plan_overlap(cab, body, cos, sin).reshape(len(angles), -1)
+    depth = np.minimum(tractors['cab_height'][:, None], trailers['height'][None, :]).ravel()
+    separated = overlap <= 0
+    # При пересечении - минус проникновение (не больше высоты), у разнесенных - минус перекрытие
+    clearance = np.negative(np.minimum(overlap, depth, out=overlap), out=overlap)
+
+    tractor_idx, trailer_idx = (idx.ravel() for idx in np.indices((len(tractors), len(trailers))))
+    pairs = np.arange(len(tractor_idx))
+
+    def exact_gap(angle, pair):
+        return _plan_gap(tuple(value.ravel()[tractor_idx[pair]] for value in cab),
+                         tuple(value.ravel()[trailer_idx[pair]] for value in body),
+                         np.cos(angles[angle]), np.sin(angles[angle]))
+
+    first = clearance.argmin(axis=0)
+    bound = np.where(separated[first, pairs], exact_gap(first, pairs), clearance[first, pairs])
+    # Запас на округление: оценка по перекрытию не должна отсечь угол с равным зазором
+    angle, pair = np.nonzero(separated & (clearance <= bound + 1e-9))
+    clearance[angle, pair] = exact_gap(angle, pair)
+
+    worst = clearance.argmin(axis=0)
+    result = np.empty(len(pairs), dtype=SCREEN_RESULT_DTYPE)
+    result['tractor'] = tractor_idx + tractor_start
+    result['trailer'] = trailer_idx
+    result['clearance'] = clearance[worst, pairs]
+    result['worst_angle'] = np.degrees(angles[worst])
+    result['collides'] = result['clearance'] < 0
+    return result
+
+def screen_pairs(tractors, trailers, max_angle=DEFAULT_MAX_ANGLE, angle_step=1.0, chunk_size=1 << 18, workers=None):
+    """Наименьший зазор кабина - кузов для всех пар тягач x прицеп по углам до ±max_angle градусов.
+
+    Кабина и кузов симметричны относительно продольной оси сцепки, поэтому
+    перебираются углы от 0 до max_angle с шагом angle_step. Возвращает массив
+    SCREEN_RESULT_DTYPE. Пары x углы считаются блоками не больше chunk_size
+    значений, при workers > 0 - в пуле процессов (parallel.map_blocks).
+    """
+    tractors, trailers = as_structured(tractors, Tractor), as_structured(trailers, SemiTrailer)
+    angles = np.radians(np.arange(0, max_angle + angle_step / 2, angle_step))
+    if not len(tractors) or not len(trailers):
+        return np.empty(0, dtype=SCREEN_RESULT_DTYPE)
+    chunk_size = max(1, chunk_size // len(angles))
+    return np.concatenate(list(map_blocks(_screen_block, tractors, trailers, chunk_size, workers, (angles,))))
@@ -0,0 +1,70 @@
+"""Компактное представление трасс фигуры для передачи в браузер.
+
+Streamlit отправляет фигуру как текст plotly.io.to_json на каждом
+перезапуске. Чтобы уменьшить этот текст без видимой разницы, буферы Mesh3d
+готовятся так:
+  - координаты округляются до COORDINATE_DECIMALS знаков (фиксированная
+    точка, миллиметры): в JSON число занимает несколько символов вместо 17;
+  - совпавшие после округления вершины с одним именем детали сливаются,
+    треугольники переиндексируются, вырожденные отбрасываются;
+  - подпись детали передается одной строкой, если в трассе одна деталь,
+    а не строкой на каждую вершину.
+Бинарные typed arrays (base64) здесь не используются: их не умеют ни
+plotly 5.15, ни plotly.js 2.26 в составе Streamlit 1.31, поэтому буферы
+уходят числами JSON.
+"""
+import numpy as np
+import plotly.io as pio
+
+COORDINATE_DECIMALS = 3
+
+def quantize(values, decimals=COORDINATE_DECIMALS):
+    """Округляет координаты до фиксированной точки."""
+    return np.round(values, decimals)
+
+def compact_buffers(vertices, faces, names, decimals=COORDINATE_DECIMALS):
+    """Сжатые буферы Mesh3d: (vertices, faces, labels, codes).
+
+    labels - различные имена деталей, codes - индекс имени для каждой
+    вершины после слияния (None, если имя одно).
+    """
+    labels, name_codes = np.unique(np.asarray(names, dtype=str), return_inverse=True)
+    rounded = np.round(vertices, decimals)
+    keys = np.column_stack([rounded, name_codes])
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    faces = inverse[faces]
+    faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])]
+
+    vertices = quantize(unique[:, :3], decimals)
+    codes = unique[:, 3].astype(np.intp) if len(labels) > 1 else None
+    return vertices, faces, labels, codes
+
+def hover_labels(labels, codes):
+    """Подписи вершин для Mesh3d: одна строка, если имя одно, иначе массив имен по вершинам."""
+    if codes is None:
+        return str(labels[0])
+    return np.asarray(labels)[codes].astype(object)
+
+def compact_mesh(vertices, faces, names, decimals=COORDINATE_DECIMALS):
+    """Готовит буферы Mesh3d к передаче: (vertices, faces, hovertext).
+
+    names - имя детали для каждой вершины; hovertext - одна строка, если имя
+    одно, иначе массив имен по вершинам после слияния.
+    """
+    vertices, faces, labels, codes = compact_buffers(vertices, faces, names, decimals)
+    return vertices, faces, hover_labels(labels, codes)
+
+# --- Замер ---
+
+def payload_bytes(fig):
+    """Размер фигуры в байтах так, как ее сериализует st.plotly_chart."""
+    return len(pio.to_json(fig, validate=False).encode('utf-8'))
+
+def payload_report(fig):
+    """Размер фигуры целиком и по трассам: {'total': байты, 'traces': [(имя, байты), ...]}."""
+    return {
+        'total': payload_bytes(fig),
+        'traces': [(trace.name, len(pio.to_json(trace.to_plotly_json(), validate=False).encode('utf-8')))
+                   for trace in fig.data],
+    }
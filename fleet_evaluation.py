@@ -0,0 +1,101 @@
+"""Пакетная оценка сцепок тягач + полуприцеп без построения 3D-геометрии.
+
+Параметры ТС хранятся в структурированных массивах NumPy (одно поле на
+параметр конструктора), а производные размеры считаются сразу для всего
+декартова произведения тягачей и прицепов.
+"""
+import numpy as np
+
+from parallel import map_blocks
+from vehicle_constructor import Tractor, SemiTrailer
+
+_FIELD_DTYPES = {float: 'f8', int: 'i4', str: 'U'}
+
+RESULT_DTYPE = np.dtype([
+    ('tractor', 'i4'), ('trailer', 'i4'),
+    ('overall_length', 'f8'), ('overall_height', 'f8'),
+    ('kingpin_to_rear_axle', 'f8'), ('swing_clearance', 'f8'),
+])
+
+def params_dtype(vehicle_cls, str_lengths=None):
+    """Структурированный dtype по схеме PARAMETERS класса ТС.
+
+    Длина строковых полей берется из str_lengths ({параметр: число символов}),
+    чтобы значения не обрезались; без нее строковые поля односимвольные.
+    """
+    str_lengths = str_lengths or {}
+    return np.dtype([(name, _FIELD_DTYPES[kind] + (str(max(str_lengths.get(name, 1), 1)) if kind is str else ''))
+                     for name, kind in vehicle_cls.PARAMETERS.items()])
+
+def to_structured(vehicles, vehicle_cls):
+    """Упаковывает ТС одного класса в структурированный массив параметров."""
+    names = list(vehicle_cls.PARAMETERS)
+    rows = [tuple(v.get_params()[name] for name in names) for v in vehicles]
+    str_lengths = {name: max((len(row[i]) for row in rows), default=1)
+                   for i, (name, kind) in enumerate(vehicle_cls.PARAMETERS.items()) if kind is str}
+    return np.array(rows, dtype=params_dtype(vehicle_cls, str_lengths))
+
+def as_structured(vehicles, vehicle_cls):
+    """Структурированный массив параметров из ТС, списка ТС или готового массива (возвращается как есть)."""
+    if isinstance(vehicles, vehicle_cls):
+        vehicles = [vehicles]
+    if not isinstance(vehicles, np.ndarray):
+        vehicles = to_structured(vehicles, vehicle_cls)
+    return vehicles
+
+def coupling_dimensions(tractors, trailers):
+    """Производные размеры сцепок для транслируемых (broadcast) массивов параметров.
+
+    Геометрия та же, что в Scene.add_articulated_vehicle: прицеп начинается
+    в saddle_pos - kingpin_offset и стоит на уровне рамы тягача.
+    swing_clearance - зазор между задней стенкой кабины и передними углами
+    прицепа при любом угле складывания (отрицательный - углы задевают кабину).
+    """
+    t, s = tractors, trailers
+    first_rear_axle_pos = t['front_axle_pos'] + t['wheelbase']
+    saddle_pos = first_rear_axle_pos + t['saddle_pos_from_rear_axle']
+    chassis_len = saddle_pos + (t['num_rear_axles'] - 1) * t['rear_axle_spacing'] + 0.5
+    frame_level_z = t['wheel_diameter'] / 2 + 0.3
+
+    trailer_start_x = saddle_pos - s['kingpin_offset']
+    overall_length = (np.maximum(trailer_start_x + s['length'], chassis_len)
+                      - np.minimum(trailer_start_x, 0))
+    overall_height = frame_level_z + np.maximum(t['cab_height'], s['height'])
+    kingpin_to_rear_axle = s['length'] - s['axle_pos_from_rear'] - s['kingpin_offset']
+    front_swing_radius = np.hypot(s['kingpin_offset'], s['width'] / 2)
+    swing_clearance = (saddle_pos - t['cab_length']) - front_swing_radius
+    return {
+        'overall_length': overall_length,
+        'overall_height': overall_height,
+        'kingpin_to_rear_axle': np.broadcast_to(kingpin_to_rear_axle, overall_length.shape),
+        'swing_clearance': swing_clearance,
+    }
+
+def _evaluate_block(tractors, trailers, tractor_start):
+    """Оценивает все пары для блока тягачей; строки упорядочены по тягачу, затем по прицепу."""
+    dims = coupling_dimensions(tractors[:, None], trailers[None, :])
+    result = np.empty(len(tractors) * len(trailers), dtype=RESULT_DTYPE)
+    tractor_idx, trailer_idx = np.indices((len(tractors), len(trailers)))
+    result['tractor'] = tractor_idx.ravel() + tractor_start
+    result['trailer'] = trailer_idx.ravel()
+    for name, values in dims.items():
+        result[name] = values.ravel()
+    return result
+
+def iter_evaluate(tractors, trailers, chunk_size=1 << 18, workers=None):
+    """Генератор блоков результатов (RESULT_DTYPE) для всех пар тягач x прицеп.
+
+    tractors и trailers - структурированные массивы из to_structured (или
+    списки объектов Tractor/SemiTrailer). Каждый блок содержит не более
+    chunk_size пар (но не меньше одной строки тягачей). При workers > 0 блоки
+    считаются в пуле процессов (parallel.map_blocks), порядок блоков сохраняется.
+    """
+    tractors, trailers = as_structured(tractors, Tractor), as_structured(trailers, SemiTrailer)
+    return map_blocks(_evaluate_block, tractors, trailers, chunk_size, workers)
+
+def evaluate_pairs(tractors, trailers, chunk_size=1 << 18, workers=None):
+    """Оценивает все пары тягач x прицеп и возвращает один массив RESULT_DTYPE."""
+    chunks = list(iter_evaluate(tractors, trailers, chunk_size, workers))
+    if not chunks:
+        return np.empty(0, dtype=RESULT_DTYPE)
+    return np.concatenate(chunks)
@@ -0,0 +1,297 @@
+"""Легкая инструментация конвейера: интервалы (spans), счетчики и профилировщик.
+
+Интервал - это контекстный менеджер или декоратор, который добавляет время
+выполнения в гистограмму процесса (несколько микросекунд накладных расходов,
+поэтому его можно не выключать). Если в текущем потоке идет запись
+перезапуска (RerunTrace), интервал дополнительно попадает в нее с глубиной
+вложенности - это данные для отладочной панели приложения.
+
+Метрики процесса выгружаются в текстовом формате Prometheus в локальный
+файл (write_prometheus), который может читать node_exporter textfile
+collector или любой другой сборщик.
+
+SamplingProfiler - включаемый по запросу сэмплирующий профилировщик:
+фоновый поток раз в interval снимает стек нужного потока через
+sys._current_frames() и считает одинаковые стеки.
+"""
+import collections
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+
+PREFIX = 'vehicle_constructor'
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_current_trace = contextvars.ContextVar('rerun_trace', default=None)
+
+class _Histogram:
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self, num_buckets):
+        self.counts = [0] * num_buckets
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+class Span:
+    """Интервал замера; используйте Metrics.span(name)."""
+    __slots__ = ('metrics', 'name', 'start', 'trace', 'record')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.trace = _current_trace.get()
+        if self.trace is not None:
+            self.record = self.trace.open(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe(self.name, elapsed)
+        if self.trace is not None:
+            self.trace.close(self.record, elapsed)
+        return False
+
+class Metrics:
+    """Потокобезопасный реестр гистограмм интервалов, счетчиков и наблюдаемых значений."""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._counters = collections.Counter()
+        self._gauges = {} # Имя -> (функция значения, тип метрики, описание)
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+
+    def span(self, name):
+        return Span(self, name)
+
+    def timed(self, name):
+        """Декоратор: каждый вызов функции - интервал name."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with Span(self, name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe(self, name, seconds):
+        index = 0
+        while index < len(self.buckets) and seconds > self.buckets[index]:
+            index += 1
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = _Histogram(len(self.buckets) + 1)
+            histogram.counts[index] += 1
+            histogram.count += 1
+            histogram.sum += seconds
+            histogram.max = max(histogram.max, seconds)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def register_gauge(self, name, fn, help_text='', kind='gauge'):
+        """Значение, которое читается вызовом fn при выгрузке (kind - 'gauge' или 'counter')."""
+        with self._lock:
+            self._gauges[name] = (fn, kind, help_text)
+
+    def snapshot(self):
+        """Текущие значения: {'spans': {имя: {count, sum, max, mean}}, 'counters': {...}, 'gauges': {...}}."""
+        with self._lock:
+            spans = {name: {'count': h.count, 'sum': h.sum, 'max': h.max, 'mean': h.sum / h.count}
+                     for name, h in self._histograms.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        return {'spans': spans, 'counters': counters,
+                'gauges': {name: fn() for name, (fn, _, _) in gauges.items()}}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    # --- Prometheus ---
+
+    def prometheus_text(self):
+        """Метрики в текстовом формате экспозиции Prometheus 0.0.4."""
+        with self._lock:
+            histograms = {name: (list(h.counts), h.count, h.sum) for name, h in self._histograms.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        lines = [f"# HELP {PREFIX}_span_seconds Длительность этапов конвейера",
+                 f"# TYPE {PREFIX}_span_seconds histogram"]
+        for name in sorted(histograms):
+            counts, count, total = histograms[name]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{PREFIX}_span_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{PREFIX}_span_seconds_sum{{span="{name}"}} {total!r}')
+            lines.append(f'{PREFIX}_span_seconds_count{{span="{name}"}} {count}')
+        for name in sorted(counters):
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            lines.append(f"{PREFIX}_{name}_total {counters[name]}")
+        for name in sorted(gauges):
+            fn, kind, help_text = gauges[name]
+            metric = f"{PREFIX}_{name}_total" if kind == 'counter' else f"{PREFIX}_{name}"
+            if help_text:
+                lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {fn()}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path, min_interval=0.0):
+        """Атомарно пишет метрики в файл path; не чаще раза в min_interval секунд.
+
+        Возвращает True, если файл записан.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_write < min_interval:
+                return False
+            self._last_write = now
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        return True
+
+metrics = Metrics()
+span = metrics.span
+timed = metrics.timed
+inc = metrics.inc
+
+# --- Запись перезапуска ---
+
+class RerunTrace:
+    """Интервалы одного перезапуска скрипта (или одного запроса) в порядке начала.
+
+    Записи - [имя, глубина, смещение начала, длительность]. stage(name)
+    размечает последовательные этапы линейного скрипта без отступов:
+    закрывает предыдущий этап и открывает новый.
+    """
+    def __init__(self, metrics_registry=None):
+        self.metrics = metrics_registry or metrics
+        self.records = []
+        self.started = time.perf_counter()
+        self._depth = 0
+        self._stage = None
+        self._token = None
+
+    def open(self, name):
+        record = [name, self._depth, time.perf_counter() - self.started, None]
+        self.records.append(record)
+        self._depth += 1
+        return record
+
+    def close(self, record, elapsed):
+        record[3] = elapsed
+        self._depth -= 1
+
+    def stage(self, name):
+        self.end_stage()
+        self._stage = Span(self.metrics, name)
+        self._stage.__enter__()
+
+    def end_stage(self):
+        if self._stage is not None:
+            self._stage.__exit__(None, None, None)
+            self._stage = None
+
+    def start(self):
+        """Делает запись текущей для интервалов этого потока (контекста)."""
+        self._token = _current_trace.set(self)
+        return self
+
+    def finish(self):
+        self.end_stage()
+        if self._token is not None:
+            _current_trace.reset(self._token)
+            self._token = None
+        return self
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.finish()
+        return False
+
+# --- Сэмплирующий профилировщик ---
+
+class SamplingProfiler:
+    """Сэмплирует стек потока thread_id (по умолчанию - вызвавшего start) раз в interval секунд."""
+    def __init__(self, interval=0.005, max_depth=48):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = collections.Counter()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, thread_id=None):
+        self._thread_id = thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def top_functions(self, n=15):
+        """Функции с наибольшим числом сэмплов на вершине стека: [(функция, доля)]."""
+        leaves = collections.Counter()
+        for stack, count in self.samples.items():
+            leaves[stack[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [(name, count / total) for name, count in leaves.most_common(n)]
+
+    def top_cumulative(self, n=15):
+        """Функции с наибольшим числом сэмплов где угодно в стеке: [(функция, доля)]."""
+        cumulative = collections.Counter()
+        for stack, count in self.samples.items():
+            for name in set(stack):
+                cumulative[name] += count
+        total = sum(self.samples.values()) or 1
+        return [(name, count / total) for name, count in cumulative.most_common(n)]
+
+    def collapsed(self):
+        """Стеки в формате collapsed (для flamegraph.pl/speedscope): 'a;b;c N' по строке."""
+        return '\n'.join(f"{';'.join(stack)} {count}" for stack, count in self.samples.most_common())
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
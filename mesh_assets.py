@@ -0,0 +1,286 @@
+"""Загрузка мешей кабин и кузовов из glTF 2.0 (.gltf и .glb) в буферы NumPy.
+
+Файл разбирается один раз: все треугольные примитивы сцены glTF с учетом
+матриц узлов сливаются в один массив вершин (N, 3) и один массив
+треугольников (M, 3), ось Y glTF переводится в ось Z сцены. Разобранные меши
+хранятся в общем для процесса LRU-кэше, ограниченном суммарным объемом
+буферов, и загружаются лениво при первом обращении; preload() заранее
+загружает меши в фоновом пуле потоков.
+"""
+import base64
+import concurrent.futures
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+
+from caching import LRUCache
+from instrumentation import metrics, span
+
+# Каталог, относительно которого ищутся относительные пути моделей
+ASSET_ROOT = os.environ.get('VEHICLE_ASSET_PATH', '')
+
+_GLB_MAGIC = 0x46546C67 # 'glTF'
+_CHUNK_JSON = 0x4E4F534A
+_CHUNK_BIN = 0x004E4942
+_COMPONENT_DTYPES = {5120: 'i1', 5121: 'u1', 5122: '<i2', 5123: '<u2', 5125: '<u4', 5126: '<f4'}
+_TYPE_SIZES = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT2': 4, 'MAT3': 9, 'MAT4': 16}
+_TRIANGLES, _TRIANGLE_STRIP, _TRIANGLE_FAN = 4, 5, 6
+
+class AssetError(ValueError):
+    """Файл модели не является поддерживаемым glTF 2.0."""
+
+class MeshAsset:
+    """Разобранный меш: вершины (N, 3) в осях сцены (Z вверх), треугольники (M, 3) и габариты."""
+    __slots__ = ('vertices', 'faces', 'bounds_min', 'bounds_max')
+
+    def __init__(self, vertices, faces):
+        if not len(vertices) or not len(faces):
+            raise AssetError("в модели нет треугольников")
+        self.vertices = vertices
+        self.faces = faces
+        self.bounds_min = vertices.min(axis=0)
+        self.bounds_max = vertices.max(axis=0)
+        for array in (self.vertices, self.faces, self.bounds_min, self.bounds_max):
+            array.flags.writeable = False
+
+    @property
+    def num_triangles(self):
+        return len(self.faces)
+
+    @property
+    def nbytes(self):
+        return self.vertices.nbytes + self.faces.nbytes
+
+    def fit_to_box(self, origin, dimensions):
+        """Вершины, масштабированные и сдвинутые так, чтобы габариты меша совпали с коробкой.
+
+        Габарит меша по X - длина (перед модели - минимальный X), по Y - ширина,
+        по Z - высота. Плоские по какой-либо оси меши по ней не растягиваются.
+        """
+        extent = self.bounds_max - self.bounds_min
+        scale = np.asarray(dimensions, dtype=float) / np.where(extent > 0, extent, 1)
+        return (self.vertices - self.bounds_min) * scale + np.asarray(origin, dtype=float)
+
+# --- Разбор glTF ---
+
+def _split_glb(data):
+    """Делит GLB на JSON-документ и бинарный чанк (или None)."""
+    magic, version, length = struct.unpack_from('<III', data)
+    if magic != _GLB_MAGIC or version != 2:
+        raise AssetError("не GLB версии 2")
+    doc, binary, offset = None, None, 12
+    while offset + 8 <= min(length, len(data)):
+        chunk_length, chunk_type = struct.unpack_from('<II', data, offset)
+        chunk = data[offset + 8:offset + 8 + chunk_length]
+        if chunk_type == _CHUNK_JSON:
+            doc = json.loads(bytes(chunk))
+        elif chunk_type == _CHUNK_BIN and binary is None:
+            binary = chunk
+        offset += 8 + chunk_length
+    if doc is None:
+        raise AssetError("в GLB нет JSON-чанка")
+    return doc, binary
+
+def _load_buffers(doc, binary, base_dir):
+    buffers = []
+    for buffer in doc.get('buffers', []):
+        uri = buffer.get('uri')
+        if uri is None:
+            if binary is None:
+                raise AssetError("буфер без uri вне GLB")
+            buffers.append(binary)
+        elif uri.startswith('data:'):
+            buffers.append(memoryview(base64.b64decode(uri.split(',', 1)[1])))
+        else:
+            with open(os.path.join(base_dir, uri), 'rb') as f:
+                buffers.append(memoryview(f.read()))
+    return buffers
+
+def _read_accessor(doc, buffers, index):
+    """Данные аксессора как массив (count, компоненты) без циклов по элементам."""
+    accessor = doc['accessors'][index]
+    if 'sparse' in accessor or 'bufferView' not in accessor:
+        raise AssetError(f"аксессор {index}: sparse и пустые аксессоры не поддерживаются")
+    view = doc['bufferViews'][accessor['bufferView']]
+    dtype = np.dtype(_COMPONENT_DTYPES[accessor['componentType']])
+    width = _TYPE_SIZES[accessor['type']]
+    stride = view.get('byteStride') or dtype.itemsize * width
+    offset = view.get('byteOffset', 0) + accessor.get('byteOffset', 0)
+    count = accessor['count']
+    buffer = buffers[view['buffer']]
+    if count and offset + stride * (count - 1) + dtype.itemsize * width > len(buffer):
+        raise AssetError(f"аксессор {index} выходит за границы буфера")
+    return np.ndarray((count, width), dtype=dtype, buffer=buffer, offset=offset,
+                      strides=(stride, dtype.itemsize))
+
+def _node_matrix(node):
+    """Локальная матрица узла 4x4 (matrix или T * R * S)."""
+    if 'matrix' in node:
+        return np.array(node['matrix'], dtype=float).reshape(4, 4).T # glTF хранит по столбцам
+    x, y, z, w = node.get('rotation', (0, 0, 0, 1))
+    rotation = np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ])
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation * np.asarray(node.get('scale', (1, 1, 1)), dtype=float)
+    matrix[:3, 3] = node.get('translation', (0, 0, 0))
+    return matrix
+
+def _mesh_instances(doc):
+    """Пары (индекс меша, мировая матрица) для узлов сцены по умолчанию."""
+    nodes = doc.get('nodes', [])
+    scenes = doc.get('scenes')
+    if scenes:
+        roots = scenes[doc.get('scene', 0)].get('nodes', [])
+    else:
+        children = {c for node in nodes for c in node.get('children', [])}
+        roots = [i for i in range(len(nodes)) if i not in children]
+    stack = [(index, np.eye(4)) for index in roots]
+    while stack:
+        index, parent = stack.pop()
+        node = nodes[index]
+        matrix = parent @ _node_matrix(node)
+        if 'mesh' in node:
+            yield node['mesh'], matrix
+        stack.extend((child, matrix) for child in node.get('children', []))
+
+def _primitive_faces(primitive, indices, count):
+    """Треугольники примитива (M, 3); не треугольные режимы (линии, точки) пропускаются."""
+    mode = primitive.get('mode', _TRIANGLES)
+    indices = np.arange(count, dtype=np.int64) if indices is None else indices.ravel().astype(np.int64)
+    if mode == _TRIANGLES:
+        return indices[:len(indices) // 3 * 3].reshape(-1, 3)
+    if len(indices) < 3:
+        return np.empty((0, 3), dtype=np.int64)
+    k = np.arange(len(indices) - 2)
+    if mode == _TRIANGLE_STRIP:
+        # Четные треугольники полосы сохраняют порядок обхода, нечетные - меняют
+        even = k % 2 == 0
+        return np.column_stack([indices[k], np.where(even, indices[k + 1], indices[k + 2]),
+                                np.where(even, indices[k + 2], indices[k + 1])])
+    if mode == _TRIANGLE_FAN:
+        return np.column_stack([np.full(len(k), indices[0]), indices[k + 1], indices[k + 2]])
+    return np.empty((0, 3), dtype=np.int64)
+
+def parse_gltf(data, base_dir=''):
+    """Разбирает содержимое .gltf или .glb (bytes) в MeshAsset.
+
+    Внешние буферы .gltf ищутся относительно base_dir.
+    """
+    data = memoryview(data)
+    try:
+        if bytes(data[:4]) == b'glTF':
+            doc, binary = _split_glb(data)
+        else:
+            doc, binary = json.loads(bytes(data)), None
+        buffers = _load_buffers(doc, binary, base_dir)
+        vertex_chunks, face_chunks, offset = [], [], 0
+        for mesh_index, matrix in _mesh_instances(doc):
+            for primitive in doc['meshes'][mesh_index]['primitives']:
+                if 'POSITION' not in primitive.get('attributes', {}):
+                    continue
+                positions = _read_accessor(doc, buffers, primitive['attributes']['POSITION']).astype(float)
+                indices = None
+                if 'indices' in primitive:
+                    indices = _read_accessor(doc, buffers, primitive['indices'])
+                faces = _primitive_faces(primitive, indices, len(positions))
+                if not len(faces):
+                    continue
+                if np.linalg.det(matrix[:3, :3]) < 0:
+                    faces = faces[:, ::-1] # Зеркальная матрица меняет порядок обхода
+                vertex_chunks.append(positions @ matrix[:3, :3].T + matrix[:3, 3])
+                face_chunks.append(faces + offset)
+                offset += len(positions)
+    except (KeyError, IndexError, TypeError, AttributeError, ValueError, struct.error) as e:
+        # ValueError включает JSONDecodeError, UnicodeDecodeError и ошибки формы массивов (matrix не из 16 чисел)
+        raise AssetError(f"некорректный glTF: {e!r}") from None
+    if not vertex_chunks:
+        raise AssetError("в модели нет треугольников")
+    vertices = np.concatenate(vertex_chunks)
+    # glTF: Y вверх, Z к зрителю; сцена: Z вверх -> (x, y, z) -> (x, -z, y)
+    vertices = np.column_stack([vertices[:, 0], -vertices[:, 2], vertices[:, 1]])
+    faces = np.concatenate(face_chunks)
+    if faces.max() >= len(vertices):
+        raise AssetError("индекс вершины выходит за границы")
+    return MeshAsset(vertices, faces.astype(np.int32 if len(vertices) < 2**31 else np.int64))
+
+def resolve_path(path):
+    """Абсолютный путь модели; относительные пути берутся от ASSET_ROOT."""
+    return os.path.abspath(os.path.join(ASSET_ROOT, path))
+
+def load_asset(path):
+    """Читает и разбирает файл модели без кэша."""
+    path = resolve_path(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    return parse_gltf(data, os.path.dirname(path))
+
+# --- Кэш ---
+
+class AssetCache(LRUCache):
+    """Общий для процесса LRU-кэш разобранных мешей, ограниченный объемом буферов.
+
+    Ключ - путь, время изменения и размер файла, поэтому измененный файл
+    перечитывается. Параллельные запросы одного файла ждут одну загрузку.
+    Меш больше max_bytes не вытесняет сам себя, пока он единственный в кэше.
+    """
+    def __init__(self, max_bytes=256 << 20, workers=4):
+        super().__init__(max_bytes=max_bytes, size_of=lambda asset: asset.nbytes)
+        self.workers = workers
+        self._loading = {} # Ключ -> Future загрузки, идущей в другом потоке
+        self._loading_lock = threading.Lock()
+        self._executor = None
+
+    @staticmethod
+    def fingerprint(path):
+        """Ключ версии файла модели: абсолютный путь, время изменения и размер."""
+        path = resolve_path(path)
+        stat = os.stat(path)
+        return path, stat.st_mtime_ns, stat.st_size
+
+    def get(self, path):
+        """Возвращает MeshAsset, разбирая файл только при первом обращении."""
+        key = self.fingerprint(path)
+        with self._loading_lock:
+            asset = self.lookup(key)
+            if asset is not None:
+                return asset
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                future = self._loading[key] = concurrent.futures.Future()
+        if not owner:
+            return future.result()
+
+        try:
+            with span('assets.load'):
+                asset = load_asset(key[0])
+            self.store(key, asset)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._loading_lock:
+                del self._loading[key]
+        future.set_result(asset)
+        return asset
+
+    def preload(self, paths):
+        """Загружает меши в фоновом пуле потоков; возвращает список Future.
+
+        Ошибки загрузки остаются в Future и повторятся при обычном обращении.
+        """
+        with self._loading_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='asset-preload')
+            executor = self._executor
+        return [executor.submit(self.get, path) for path in dict.fromkeys(paths) if path]
+
+asset_cache = AssetCache()
+metrics.register_gauge('asset_cache_bytes', lambda: asset_cache.nbytes, "Объем разобранных мешей в кэше")
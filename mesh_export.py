@@ -0,0 +1,173 @@
+"""Экспорт сцены в GLB (бинарный glTF 2.0), бинарный STL и OBJ.
+
+Геометрия берется потоково из Scene.iter_geometry: вершины и индексы каждой
+порции деталей записываются одним вызовом tobytes() в little-endian, без
+циклов Python по вершинам и без накопления всей сцены в памяти. Форматы,
+которым нужны размеры заранее (GLB, STL), получают их отдельным проходом.
+"""
+import io
+import json
+import struct
+
+import numpy as np
+from PIL import ImageColor
+
+STL_DTYPE = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+
+_GLB_MAGIC = 0x46546C67 # 'glTF'
+_CHUNK_JSON = 0x4E4F534A
+_CHUNK_BIN = 0x004E4942
+_ARRAY_BUFFER = 34962
+_ELEMENT_ARRAY_BUFFER = 34963
+_FLOAT = 5126
+_UNSIGNED_INT = 5125
+
+def color_rgb(color):
+    """Цвет Plotly/CSS ('royalblue', '#4169e1', ...) как RGB в диапазоне 0..1."""
+    return [c / 255 for c in ImageColor.getrgb(color)[:3]]
+
+def _to_y_up(vertices):
+    """Сцена использует ось Z вверх, glTF - ось Y вверх: (x, y, z) -> (x, z, -y)."""
+    return np.column_stack([vertices[:, 0], vertices[:, 2], -vertices[:, 1]])
+
+def geometry_stats(scene, lod=None, y_up=False):
+    """Число вершин, треугольников и габариты по каждому цвету сцены (один проход)."""
+    stats = {}
+    for part in scene.iter_geometry(lod):
+        vertices = _to_y_up(part.vertices) if y_up else part.vertices
+        entry = stats.setdefault(part.color, {'vertices': 0, 'triangles': 0,
+                                              'min': np.full(3, np.inf), 'max': np.full(3, -np.inf)})
+        entry['vertices'] += len(vertices)
+        entry['triangles'] += len(part.faces)
+        entry['min'] = np.minimum(entry['min'], vertices.min(axis=0))
+        entry['max'] = np.maximum(entry['max'], vertices.max(axis=0))
+    return stats
+
+# --- GLB ---
+
+def _glb_document(stats):
+    """JSON-часть glTF: по одному mesh, материалу и узлу на цвет; возвращает (json, длина буфера)."""
+    doc = {
+        'asset': {'version': '2.0', 'generator': 'vehicle_constructor'},
+        'scene': 0, 'scenes': [{'nodes': []}], 'nodes': [], 'meshes': [], 'materials': [],
+        'accessors': [], 'bufferViews': [], 'buffers': [],
+    }
+    offset = 0
+    for index, (color, entry) in enumerate(stats.items()):
+        positions_length = entry['vertices'] * 12
+        indices_length = entry['triangles'] * 12
+        doc['bufferViews'].append({'buffer': 0, 'byteOffset': offset, 'byteLength': positions_length,
+                                   'target': _ARRAY_BUFFER})
+        doc['bufferViews'].append({'buffer': 0, 'byteOffset': offset + positions_length,
+                                   'byteLength': indices_length, 'target': _ELEMENT_ARRAY_BUFFER})
+        offset += positions_length + indices_length
+        doc['accessors'].append({'bufferView': 2 * index, 'componentType': _FLOAT, 'count': entry['vertices'],
+                                 'type': 'VEC3', 'min': entry['min'].astype('f4').tolist(),
+                                 'max': entry['max'].astype('f4').tolist()})
+        doc['accessors'].append({'bufferView': 2 * index + 1, 'componentType': _UNSIGNED_INT,
+                                 'count': entry['triangles'] * 3, 'type': 'SCALAR'})
+        # Треугольники деталей обращены наружу; doubleSided - страховка для мешей моделей с другим обходом
+        doc['materials'].append({'name': color, 'doubleSided': True, 'pbrMetallicRoughness': {
+            'baseColorFactor': color_rgb(color) + [1.0], 'metallicFactor': 0.0, 'roughnessFactor': 0.8}})
+        doc['meshes'].append({'name': color, 'primitives': [
+            {'attributes': {'POSITION': 2 * index}, 'indices': 2 * index + 1, 'material': index}]})
+        doc['nodes'].append({'name': color, 'mesh': index})
+        doc['scenes'][0]['nodes'].append(index)
+    doc['buffers'].append({'byteLength': offset})
+    return doc, offset
+
+def export_glb(scene, f, lod=None):
+    """Пишет сцену в бинарный файловый объект f в формате GLB; возвращает число треугольников."""
+    stats = geometry_stats(scene, lod, y_up=True)
+    doc, buffer_length = _glb_document(stats)
+    json_chunk = json.dumps(doc, separators=(',', ':')).encode('utf-8')
+    json_chunk += b' ' * (-len(json_chunk) % 4)
+    total_length = 12 + 8 + len(json_chunk) + 8 + buffer_length
+
+    f.write(struct.pack('<III', _GLB_MAGIC, 2, total_length))
+    f.write(struct.pack('<II', len(json_chunk), _CHUNK_JSON))
+    f.write(json_chunk)
+    f.write(struct.pack('<II', buffer_length, _CHUNK_BIN))
+    for color in stats:
+        for part in scene.iter_geometry(lod, colors={color}):
+            f.write(_to_y_up(part.vertices).astype('<f4').tobytes())
+        base = 0
+        for part in scene.iter_geometry(lod, colors={color}):
+            f.write((part.faces + base).astype('<u4').tobytes())
+            base += len(part.vertices)
+    return sum(entry['triangles'] for entry in stats.values())
+
+# --- STL ---
+
+def _stl_records(part):
+    triangles = part.vertices[part.faces]
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    records = np.zeros(len(triangles), dtype=STL_DTYPE)
+    records['normal'] = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    records['vertices'] = triangles
+    return records
+
+def export_stl(scene, f, lod=None):
+    """Пишет сцену в бинарный файловый объект f в формате бинарного STL; возвращает число треугольников."""
+    count = sum(entry['triangles'] for entry in geometry_stats(scene, lod).values())
+    f.write(b'vehicle_constructor binary STL'.ljust(80, b' '))
+    f.write(struct.pack('<I', count))
+    for part in scene.iter_geometry(lod):
+        f.write(_stl_records(part).tobytes())
+    return count
+
+# --- OBJ ---
+
+def _format_rows(fmt, array):
+    """Форматирует строки массива одной операцией % вместо цикла по строкам."""
+    return (fmt * len(array)) % tuple(array.ravel().tolist())
+
+def _material_name(color):
+    return color.lstrip('#').replace(' ', '_')
+
+def export_obj(scene, f, mtl=None, mtl_name='scene.mtl', lod=None):
+    """Пишет сцену в текстовый файловый объект f в формате OBJ.
+
+    Если передан текстовый файловый объект mtl, в него пишутся материалы
+    (по одному на цвет), а в OBJ - ссылка mtllib mtl_name.
+    Возвращает число треугольников.
+    """
+    f.write('# vehicle_constructor OBJ\n')
+    if mtl is not None:
+        f.write(f'mtllib {mtl_name}\n')
+    base, count, colors = 1, 0, {}
+    for part in scene.iter_geometry(lod):
+        colors[part.color] = None
+        f.write(f'o {part.name}\nusemtl {_material_name(part.color)}\n')
+        f.write(_format_rows('v %.6f %.6f %.6f\n', part.vertices))
+        f.write(_format_rows('f %d %d %d\n', part.faces + base))
+        base += len(part.vertices)
+        count += len(part.faces)
+    if mtl is not None:
+        for color in colors:
+            mtl.write('newmtl {}\nKd {:.4f} {:.4f} {:.4f}\n'.format(_material_name(color), *color_rgb(color)))
+    return count
+
+# --- Общий интерфейс ---
+
+# Формат -> (расширение файла, MIME-тип)
+FORMATS = {
+    'glb': ('glb', 'model/gltf-binary'),
+    'stl': ('stl', 'model/stl'),
+    'obj': ('obj', 'model/obj'),
+}
+
+def export_scene(scene, f, fmt, lod=None):
+    """Пишет сцену в бинарный файловый объект f в формате fmt ('glb', 'stl' или 'obj')."""
+    if fmt == 'glb':
+        return export_glb(scene, f, lod=lod)
+    if fmt == 'stl':
+        return export_stl(scene, f, lod=lod)
+    if fmt == 'obj':
+        text = io.TextIOWrapper(f, encoding='utf-8', newline='\n', write_through=True)
+        try:
+            return export_obj(scene, text, lod=lod)
+        finally:
+            text.detach()
+    raise ValueError(f"Неизвестный формат экспорта {fmt!r}, ожидается один из {tuple(FORMATS)}")
@@ -0,0 +1,47 @@
+"""Пулы процессов и разбиение на блоки для пакетных расчетов и сервисов."""
+import collections
+import concurrent.futures
+import multiprocessing
+
+def pool_context():
+    """Контекст multiprocessing для пулов: forkserver (или spawn, где его нет), но не fork.
+
+    Процесс, порожденный fork из многопоточного сервера (Streamlit, asyncio),
+    наследует его открытые сокеты и блокировки, захваченные другими потоками.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+def process_pool(workers=None):
+    """ProcessPoolExecutor с воркерами из pool_context()."""
+    return concurrent.futures.ProcessPoolExecutor(workers, mp_context=pool_context())
+
+def row_blocks(num_rows, num_columns, chunk_size):
+    """Границы (start, stop) блоков строк таблицы num_rows x num_columns.
+
+    В блоке не больше chunk_size ячеек, но не меньше одной строки.
+    """
+    rows_per_block = max(1, chunk_size // max(num_columns, 1))
+    for start in range(0, num_rows, rows_per_block):
+        yield start, min(start + rows_per_block, num_rows)
+
+def map_blocks(fn, rows, columns, chunk_size, workers=None, args=()):
+    """Генератор fn(rows[start:stop], columns, start, *args) по блокам row_blocks, в порядке блоков.
+
+    При workers > 0 блоки считаются в process_pool. В полете не больше
+    2 * workers блоков, чтобы не держать в памяти все результаты сразу.
+    """
+    blocks = row_blocks(len(rows), len(columns), chunk_size)
+    if not workers:
+        for start, stop in blocks:
+            yield fn(rows[start:stop], columns, start, *args)
+        return
+
+    with process_pool(workers) as pool:
+        pending = collections.deque()
+        for start, stop in blocks:
+            pending.append(pool.submit(fn, rows[start:stop], columns, start, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
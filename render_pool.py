@@ -0,0 +1,262 @@
+"""Пул процессов для построения фигур сцен, общий для всех сессий Streamlit.
+
+Построение геометрии и сжатие буферов Mesh3d держат GIL, поэтому в одном
+процессе тяжелая сцена одной сессии тормозит все остальные. RenderPool
+отдает эту работу процессам-воркерам, и пропускная способность растет с
+числом ядер:
+  - воркеру передается описание сцены (классы и параметры ТС, размещения,
+    выделенные детали, LOD), а не детали;
+  - воркер строит детали (кэш геометрии у каждого процесса свой), сливает
+    их по цветам и сжимает буферы (figure_transport.compact_buffers);
+    массивы всех трасс кладутся в один блок shared_memory, а через канал
+    пула уходит только разметка блока. Родитель копирует массивы и
+    освобождает блок;
+  - одинаковые сцены, запрошенные одновременно (например, несколько сессий
+    с одной сцепкой), строятся один раз, ожидающие получают общий результат;
+  - в работе не больше max_pending сцен: новая сцена ждет места не дольше
+    queue_timeout, а результат - не дольше timeout, иначе RenderError, и
+    вызывающий код может построить фигуру сам;
+  - воркеры запускаются через forkserver (parallel.process_pool) и не
+    наследуют сокеты и блокировки сервера. Если воркер упал и пул сломан,
+    ожидающие получают RenderError, а пул заменяется новым.
+Фигура Plotly собирается в процессе сессии, у каждой сессии своя копия.
+"""
+import concurrent.futures
+import hashlib
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from figure_transport import compact_buffers, hover_labels
+from instrumentation import inc, metrics, span
+from parallel import process_pool
+from vehicle_constructor import Scene, geometry_key, merge_parts, mesh_trace, scene_figure
+
+DEFAULT_MAX_PENDING = 32
+DEFAULT_QUEUE_TIMEOUT = 2.0 # Секунды ожидания места в очереди
+DEFAULT_TIMEOUT = 60.0 # Секунды ожидания готовой сцены
+_ALIGNMENT = 64 # Выравнивание массивов в блоке shared_memory, байты
+
+class RenderError(Exception):
+    """Пул не принял сцену, не построил ее за отведенное время или сломан."""
+
+# --- Описание сцены ---
+
+def scene_spec(scene):
+    """Ключ и описание сцены для воркера.
+
+    Описание - (lod, ((класс ТС, параметры, размещения (N, 4), выделенные
+    детали), ...)) по листовым узлам; ключ - хэш тех же данных с версиями
+    файлов моделей, по нему объединяются одинаковые сцены.
+    """
+    lod = scene.resolve_lod()
+    leaves, digest = [], hashlib.blake2b(lod.encode('utf-8'), digest_size=16)
+    for node in scene.root.iter_nodes():
+        if node.vehicle is None:
+            continue
+        transforms = node.world_transforms()
+        highlight = tuple(sorted(node.highlight))
+        leaves.append((type(node.vehicle), node.vehicle.get_params(), transforms, highlight))
+        digest.update(geometry_key(node.vehicle).encode('utf-8'))
+        digest.update(transforms.tobytes())
+        digest.update(repr(highlight).encode('utf-8'))
+    return digest.hexdigest(), (lod, tuple(leaves))
+
+# --- Задача воркера ---
+
+def _pack(arrays):
+    """Копирует массивы в новый блок shared_memory: (имя блока или None, [(смещение, dtype, форма), ...])."""
+    layout, size = [], 0
+    for array in arrays:
+        layout.append((size, array.dtype.str, array.shape))
+        size += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+    if not size:
+        return None, layout
+    block = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        for array, (offset, dtype, shape) in zip(arrays, layout):
+            np.ndarray(shape, dtype, buffer=block.buf, offset=offset)[...] = array
+    finally:
+        block.close()
+    # Блок освобождает родитель; трекер воркера не должен удалять его при выходе процесса
+    resource_tracker.unregister(block._name, 'shared_memory')
+    return block.name, layout
+
+def _unpack(name, layout):
+    """Копирует массивы из блока shared_memory и освобождает блок."""
+    if name is None:
+        return [np.empty(shape, dtype) for _, dtype, shape in layout]
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return [np.ndarray(shape, dtype, buffer=block.buf, offset=offset).copy() for offset, dtype, shape in layout]
+    finally:
+        block.close()
+        block.unlink()
+
+def _render_job(spec):
+    """Строит сцену по описанию и кладет сжатые буферы трасс в shared_memory.
+
+    Возвращает (имя блока, разметка блока, [(цвет, имя трассы, имена деталей,
+    есть ли коды подписей), ...]); массивы трасс идут в блоке подряд:
+    vertices, faces и, если у трассы несколько имен деталей, коды подписей.
+    """
+    lod, leaves = spec
+    scene = Scene(lod=lod)
+    for index, (cls, params, transforms, highlight) in enumerate(leaves):
+        scene.set_instances(f'node_{index}', cls(**params), transforms)
+        scene.set_highlight(f'node_{index}', highlight)
+
+    traces, arrays = [], []
+    for color, (vertices, faces, names) in merge_parts(scene.components).items():
+        vertices, faces, labels, codes = compact_buffers(vertices, faces, names)
+        traces.append((color, ', '.join(dict.fromkeys(names)), labels.tolist(), codes is not None))
+        arrays += [vertices, faces] if codes is None else [vertices, faces, codes]
+    name, layout = _pack(arrays)
+    return name, layout, traces
+
+# --- Пул ---
+
+class RenderPool:
+    """Процессы-воркеры, строящие трассы сцен; потокобезопасен, один экземпляр на процесс."""
+    def __init__(self, workers=None, max_pending=DEFAULT_MAX_PENDING, queue_timeout=DEFAULT_QUEUE_TIMEOUT,
+                 timeout=DEFAULT_TIMEOUT):
+        self.workers = workers
+        self.executor = process_pool(workers)
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.closed = False
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._inflight = {} # Ключ сцены -> Future с разобранными трассами
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+        self.executor.shutdown(cancel_futures=True)
+
+    def pending(self):
+        with self._lock:
+            return len(self._inflight)
+
+    def _replace_executor(self, broken):
+        """Заменяет сломанный пул процессов новым, если его еще не заменили."""
+        with self._lock:
+            if self.executor is not broken or self.closed:
+                return
+            self.executor = process_pool(self.workers)
+        inc('render_pool_restarts')
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _join(self, key):
+        with self._lock:
+            future = self._inflight.get(key)
+        if future is not None:
+            inc('render_pool_coalesced')
+        return future
+
+    def submit(self, key, spec):
+        """Future со списком трасс [(цвет, имя, vertices, faces, hovertext), ...] для описания сцены.
+
+        Сцена с тем же ключом, которая уже в работе, не запускается повторно.
+        Если место в очереди не освободилось за queue_timeout или пул
+        процессов сломан, RenderError; Future в этом случае тоже завершается
+        с RenderError.
+        """
+        future = self._join(key)
+        if future is not None:
+            return future
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            inc('render_pool_rejected')
+            raise RenderError(f"Очередь построения сцен заполнена ({self.max_pending} в работе)")
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = concurrent.futures.Future()
+                started = True
+            else:
+                started = False # Ту же сцену запустили, пока ждали места
+        if not started:
+            self._slots.release()
+            inc('render_pool_coalesced')
+            return future
+
+        executor = self.executor
+        try:
+            try:
+                job = executor.submit(_render_job, spec)
+            except (concurrent.futures.BrokenExecutor, RuntimeError):
+                # Пул сломан или его только что заменили - одна попытка в текущем
+                self._replace_executor(executor)
+                executor = self.executor
+                job = executor.submit(_render_job, spec)
+        except BaseException as e:
+            self._finish(key, future, executor, None, e)
+            raise future.exception() # RenderError для сломанного пула, иначе исходная ошибка
+        inc('render_pool_jobs')
+        job.add_done_callback(lambda job: self._finish(key, future, executor, job))
+        return future
+
+    def _finish(self, key, future, executor, job, error=None):
+        """Разбирает результат воркера (в потоке пула) и отдает его всем ожидающим."""
+        try:
+            if error is not None:
+                raise error
+            name, layout, traces = job.result()
+            arrays = iter(_unpack(name, layout))
+            result = []
+            for color, trace_name, labels, has_codes in traces:
+                vertices, faces = next(arrays), next(arrays)
+                hovertext = hover_labels(labels, next(arrays) if has_codes else None)
+                for array in (vertices, faces, hovertext):
+                    if isinstance(array, np.ndarray):
+                        array.flags.writeable = False # Результат общий для всех ожидающих
+                result.append((color, trace_name, vertices, faces, hovertext))
+        except (concurrent.futures.BrokenExecutor, concurrent.futures.CancelledError) as e:
+            # Воркер упал (нехватка памяти, сигнал) и пул больше не принимает задачи, или пул закрыт
+            inc('render_pool_failures')
+            self._replace_executor(executor)
+            error = RenderError(f"Пул построения сцен сломан или закрыт: {e!r}")
+            error.__cause__ = e
+            future.set_exception(error)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            self._slots.release()
+
+    def figure(self, key, spec, timeout=None):
+        """Фигура по ключу и описанию сцены из scene_spec; RenderError, если она не готова за timeout."""
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(key, spec)
+        try:
+            traces = future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            inc('render_pool_timeouts')
+            raise RenderError(f"Сцена не построена за {timeout:g} с") from None
+        with span('render_pool.figure'):
+            return scene_figure([mesh_trace(*trace) for trace in traces])
+
+    def generate_figure(self, scene, timeout=None):
+        """То же, что scene.generate_figure(), но в пуле и без изменения состояния сцены."""
+        return self.figure(*scene_spec(scene), timeout=timeout)
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+def shared_pool(workers=None, **kwargs):
+    """Возвращает общий для процесса RenderPool; создается при первом вызове.
+
+    Сломанный пул процессов RenderPool заменяет сам, поэтому экземпляр
+    пересоздается только после close().
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None or _shared_pool.closed:
+            _shared_pool = RenderPool(workers, **kwargs)
+            metrics.register_gauge('render_pool_pending', _shared_pool.pending, "Сцен в работе у пула построения")
+        return _shared_pool
@@ -0,0 +1,399 @@
+"""HTTP-сервис построения, сборки, оценки и экспорта ТС без сессии Streamlit.
+
+Запуск: python render_service.py --port 8080 [--workers N] [--library PATH]
+
+Сервис написан на asyncio и стандартной библиотеке (HTTP/1.1 с keep-alive,
+тела запросов и ответов - JSON, кроме выгрузки меша; тело запроса - только с
+Content-Length, на Transfer-Encoding ответ 411). Эндпоинты:
+  POST /vehicles  - проверить параметры ТС и сохранить его в библиотеке;
+  POST /assemble  - размеры сцепки тягач + прицеп;
+  POST /evaluate  - оценка всех пар тягачей и прицепов (fleet_evaluation);
+  POST /export    - меш ТС или сцепки в GLB/STL/OBJ (mesh_export);
+  GET  /health    - счетчики сервиса.
+ТС в запросе задается уникальным именем из библиотеки или записью в формате
+каталога ({"type": "Tractor", "brand": ..., ...}, см. catalog_io). Файлы
+моделей (cab_model, body_model) в записи - только относительные пути внутри
+каталога моделей VEHICLE_ASSET_PATH; без него записи с моделями отклоняются.
+Ошибки загрузки моделей и разбора параметров возвращаются клиенту общим
+текстом, без путей и сообщений исключений сервера.
+
+Тяжелые задачи (оценка, экспорт, оценка треугольников ТС с файлами моделей)
+выполняются в пуле процессов. Одинаковые
+задачи, пришедшие одновременно, объединяются по хэшу спецификации и
+выполняются один раз; готовые результаты хранятся в LRU-кэше. Число задач
+в работе ограничено max_pending: сверх него сервис сразу отвечает 503 с
+Retry-After, а не копит очередь.
+"""
+import argparse
+import asyncio
+import collections
+import hashlib
+import io
+import json
+import os
+from http import HTTPStatus
+
+from catalog_io import CatalogError, validate_record
+from fleet_evaluation import coupling_dimensions, evaluate_pairs, to_structured
+from mesh_assets import ASSET_ROOT, AssetError, resolve_path
+from mesh_export import FORMATS, export_scene
+from parallel import process_pool
+from vehicle_constructor import LOD_SEGMENTS, Scene, SemiTrailer, Tractor, geometry_key, vehicle_key
+from vehicle_library import VehicleLibrary, open_library
+
+MAX_BODY_BYTES = 8 << 20
+MAX_HEADER_BYTES = 64 << 10
+MAX_PAIRS = 1_000_000
+
+class HTTPError(Exception):
+    """Ошибка запроса, которая возвращается клиенту с кодом status."""
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = HTTPStatus(status)
+        self.headers = headers or {}
+
+# --- Задачи пула процессов ---
+
+def _export_job(records, fmt, lod):
+    """Строит сцену из записей (класс, параметры) и возвращает файл меша (bytes)."""
+    vehicles = [cls(**params) for cls, params in records]
+    scene = Scene(lod=lod or 'auto', purpose='export')
+    if len(vehicles) == 2:
+        scene.add_articulated_vehicle(*vehicles)
+    else:
+        scene.add(vehicles[0])
+    buffer = io.BytesIO()
+    export_scene(scene, buffer, fmt)
+    return buffer.getvalue()
+
+def _triangles_job(vehicle_cls, params):
+    """Число треугольников ТС на каждом LOD; файлы моделей читаются и разбираются здесь."""
+    vehicle = vehicle_cls(**params)
+    return {lod: vehicle.estimate_triangles(lod) for lod in LOD_SEGMENTS}
+
+def _evaluate_job(tractors, trailers):
+    """Оценивает все пары и возвращает ответ JSON (bytes) с результатом по колонкам.
+
+    Сериализация идет здесь, в пуле, а не в цикле событий: на миллионе пар
+    она занимает секунды. Размер bytes заодно точно учитывается в кэше.
+    """
+    result = evaluate_pairs(tractors, trailers)
+    columns = {name: result[name].tolist() for name in result.dtype.names}
+    return json.dumps({'pairs': len(result), 'results': columns}, ensure_ascii=False).encode('utf-8')
+
+# --- Сервис ---
+
+class RenderService:
+    """Обработчики эндпоинтов, пул процессов, объединение и ограничение задач."""
+    def __init__(self, library=None, workers=None, max_pending=64, result_cache_bytes=64 << 20):
+        self.library = library if library is not None else VehicleLibrary()
+        # workers=0 - задачи в пуле потоков этого процесса (для отладки и тестов)
+        # Воркеры запускаются не через fork, иначе они наследуют сокеты клиентов и держат соединения открытыми
+        self.pool = process_pool(workers) if workers != 0 else None
+        self.max_pending = max_pending
+        self.result_cache_bytes = result_cache_bytes
+        self.counters = collections.Counter()
+        self._pending = 0
+        self._inflight = {} # Ключ задачи -> asyncio.Future общего результата
+        self._results = collections.OrderedDict()
+        self._results_bytes = 0
+        self.routes = {
+            ('POST', '/vehicles'): self.create_vehicle,
+            ('POST', '/assemble'): self.assemble,
+            ('POST', '/evaluate'): self.evaluate,
+            ('POST', '/export'): self.export,
+            ('GET', '/health'): self.health,
+        }
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    # --- Задачи ---
+
+    def _cache_result(self, key, result, size):
+        self._results[key] = (result, size)
+        self._results_bytes += size
+        while self._results_bytes > self.result_cache_bytes and self._results:
+            _, (_, evicted) = self._results.popitem(last=False)
+            self._results_bytes -= evicted
+
+    async def run_job(self, key, size_of, fn, *args):
+        """Выполняет fn(*args) в пуле один раз на ключ.
+
+        Готовый результат берется из кэша, задача с тем же ключом в работе
+        ожидается, а не запускается повторно. При max_pending задачах в
+        работе новая задача отклоняется с 503.
+        """
+        cached = self._results.get(key)
+        if cached is not None:
+            self._results.move_to_end(key)
+            self.counters['cache_hits'] += 1
+            return cached[0]
+        future = self._inflight.get(key)
+        if future is not None:
+            self.counters['coalesced'] += 1
+            return await asyncio.shield(future)
+        if self._pending >= self.max_pending:
+            self.counters['rejected'] += 1
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Сервис перегружен, повторите позже",
+                            {'Retry-After': '1'})
+
+        loop = asyncio.get_running_loop()
+        future = self._inflight[key] = loop.create_future()
+        self._pending += 1
+        try:
+            result = await loop.run_in_executor(self.pool, fn, *args)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception() # Ошибку получают ожидающие; без них не предупреждать
+            raise
+        finally:
+            self._pending -= 1
+            del self._inflight[key]
+        self.counters['jobs'] += 1
+        self._cache_result(key, result, size_of(result))
+        future.set_result(result)
+        return result
+
+    # --- Разбор спецификаций ---
+
+    @staticmethod
+    def check_model_paths(vehicle_cls, params):
+        """Пути моделей из запроса: относительные, без '..' и внутри ASSET_ROOT, иначе 400."""
+        root = os.path.realpath(ASSET_ROOT) if ASSET_ROOT else None
+        for name in vehicle_cls.MODEL_PARAMETERS:
+            path = params[name]
+            if not path:
+                continue
+            inside = (root is not None and not os.path.isabs(path)
+                      and '..' not in path.replace('\\', '/').split('/')
+                      and os.path.commonpath([root, os.path.realpath(resolve_path(path))]) == root)
+            if not inside:
+                raise HTTPError(HTTPStatus.BAD_REQUEST,
+                                f"Параметр {name}: модель задается относительным путем в каталоге моделей")
+
+    def resolve(self, spec, expected=None):
+        """ТС по имени из библиотеки или записи каталога; expected - требуемый класс."""
+        if isinstance(spec, str):
+            vehicle = self.library.get(spec)
+            if vehicle is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"В библиотеке нет '{spec}'")
+        elif isinstance(spec, dict):
+            vehicle_cls, params = validate_record(spec)
+            self.check_model_paths(vehicle_cls, params)
+            vehicle = vehicle_cls(**params)
+        else:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "ТС задается именем или записью каталога")
+        if expected is not None and not isinstance(vehicle, expected):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Ожидался {expected.TYPE_LABEL}, получен {vehicle.TYPE_LABEL}")
+        return vehicle
+
+    def resolve_many(self, specs, vehicle_cls):
+        """Структурированный массив параметров: '*' - все ТС класса из библиотеки."""
+        if specs == '*':
+            return self.library.to_structured(vehicle_cls)
+        if not isinstance(specs, list):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Ожидался список ТС или '*'")
+        return to_structured([self.resolve(spec, vehicle_cls) for spec in specs], vehicle_cls)
+
+    async def describe(self, vehicle):
+        """Описание ТС для ответа; треугольники ТС с моделями считаются в пуле и кэшируются по geometry_key."""
+        if vehicle.model_paths():
+            key = ('triangles', geometry_key(vehicle))
+            # Объем словаря в кэше результатов - оценка, он мал по сравнению с мешами
+            triangles = await self.run_job(key, lambda result: 64 * len(result), _triangles_job,
+                                           type(vehicle), vehicle.get_params())
+        else:
+            triangles = {lod: vehicle.estimate_triangles(lod) for lod in LOD_SEGMENTS}
+        return {
+            'unique_name': vehicle.get_unique_name(),
+            'type': type(vehicle).__name__,
+            'key': vehicle_key(vehicle),
+            'params': vehicle.get_params(),
+            'wheel_count': vehicle.wheel_count(),
+            'triangles': triangles,
+        }
+
+    # --- Эндпоинты ---
+
+    async def create_vehicle(self, body):
+        vehicle = self.resolve(body)
+        unique_name = vehicle.get_unique_name()
+        existing = self.library.get(unique_name)
+        if existing is not None:
+            if existing.get_params() != vehicle.get_params():
+                raise HTTPError(HTTPStatus.CONFLICT, f"Техника '{unique_name}' уже есть с другими параметрами")
+            return HTTPStatus.OK, await self.describe(existing)
+        description = await self.describe(vehicle) # Модель проверяется до сохранения в библиотеке
+        self.library.add(vehicle)
+        return HTTPStatus.CREATED, description
+
+    async def assemble(self, body):
+        tractor = self.resolve(body.get('tractor'), Tractor)
+        trailer = self.resolve(body.get('trailer'), SemiTrailer)
+        dims = coupling_dimensions(to_structured([tractor], Tractor)[0], to_structured([trailer], SemiTrailer)[0])
+        tractor_description, trailer_description = await asyncio.gather(self.describe(tractor),
+                                                                        self.describe(trailer))
+        return HTTPStatus.OK, {
+            'tractor': tractor_description,
+            'trailer': trailer_description,
+            'dimensions': {name: float(value) for name, value in dims.items()},
+            # Размещение прицепа относительно тягача, как в Scene.add_articulated_vehicle
+            'trailer_offset': [tractor.saddle_pos - trailer.kingpin_offset,
+                               (trailer.width - tractor.cab_width) / 2, tractor.frame_level_z],
+        }
+
+    async def evaluate(self, body):
+        tractors = self.resolve_many(body.get('tractors'), Tractor)
+        trailers = self.resolve_many(body.get('trailers'), SemiTrailer)
+        if len(tractors) * len(trailers) > MAX_PAIRS:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Больше {MAX_PAIRS} пар за запрос")
+        digest = hashlib.blake2b(tractors.tobytes() + b'|' + trailers.tobytes(), digest_size=16)
+        key = ('evaluate', digest.hexdigest())
+        data = await self.run_job(key, len, _evaluate_job, tractors, trailers)
+        return HTTPStatus.OK, data, {'Content-Type': 'application/json; charset=utf-8'}
+
+    async def export(self, body):
+        fmt = body.get('format', 'glb')
+        if fmt not in FORMATS:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Формат должен быть одним из {tuple(FORMATS)}")
+        lod = body.get('lod')
+        if lod is not None and lod not in LOD_SEGMENTS:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"lod должен быть одним из {tuple(LOD_SEGMENTS)}")
+        if 'vehicle' in body:
+            vehicles = [self.resolve(body['vehicle'])]
+        else:
+            vehicles = [self.resolve(body.get('tractor'), Tractor), self.resolve(body.get('trailer'), SemiTrailer)]
+        key = ('export', fmt, lod, *(geometry_key(v) for v in vehicles))
+        records = [(type(v), v.get_params()) for v in vehicles]
+        data = await self.run_job(key, len, _export_job, records, fmt, lod)
+        extension, mime = FORMATS[fmt]
+        return HTTPStatus.OK, data, {'Content-Type': mime,
+                                     'Content-Disposition': f'attachment; filename="model.{extension}"'}
+
+    async def health(self, body):
+        return HTTPStatus.OK, {'pending': self._pending, 'max_pending': self.max_pending,
+                               'inflight': len(self._inflight), 'cached_results': len(self._results),
+                               'library_size': len(self.library), **self.counters}
+
+    # --- HTTP ---
+
+    async def dispatch(self, method, path, body):
+        """Вызывает обработчик и возвращает (код, тело bytes, заголовки)."""
+        handler = self.routes.get((method, path.split('?', 1)[0]))
+        try:
+            if handler is None:
+                if any(route_path == path for _, route_path in self.routes):
+                    raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Метод не поддерживается")
+                raise HTTPError(HTTPStatus.NOT_FOUND, "Неизвестный путь")
+            try:
+                payload = json.loads(body) if body else {}
+            except ValueError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Тело запроса не является JSON") from None
+            if not isinstance(payload, dict):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Тело запроса должно быть объектом JSON")
+            status, result, *headers = await handler(payload)
+            headers = headers[0] if headers else {'Content-Type': 'application/json; charset=utf-8'}
+            if not isinstance(result, bytes):
+                result = json.dumps(result, ensure_ascii=False).encode('utf-8')
+            return status, result, headers
+        except HTTPError as e:
+            error = e
+        except CatalogError as e:
+            error = HTTPError(HTTPStatus.BAD_REQUEST, str(e)) # Текст собран из полей запроса
+        except (AssetError, OSError):
+            # Текст исключения содержит пути и сведения о файлах сервера
+            error = HTTPError(HTTPStatus.BAD_REQUEST, "Не удалось загрузить модель ТС")
+        except (ValueError, TypeError, KeyError):
+            error = HTTPError(HTTPStatus.BAD_REQUEST, "Некорректные параметры запроса")
+        self.counters[f'status_{error.status.value}'] += 1
+        body = json.dumps({'error': str(error)}, ensure_ascii=False).encode('utf-8')
+        return error.status, body, {'Content-Type': 'application/json; charset=utf-8', **error.headers}
+
+    async def handle_connection(self, reader, writer):
+        """Обслуживает соединение: запросы по очереди, пока клиент держит keep-alive."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._write(writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, b'', {}, False)
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, path, version = lines[0].split(' ', 2)
+                except ValueError:
+                    await self._write(writer, HTTPStatus.BAD_REQUEST, b'', {}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+
+                if 'transfer-encoding' in headers:
+                    # Тело chunked не читается, и без ответа с закрытием оно разбиралось бы как следующий запрос
+                    await self._write(writer, HTTPStatus.LENGTH_REQUIRED, b'', {}, False)
+                    break
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._write(writer, HTTPStatus.BAD_REQUEST, b'', {}, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._write(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, b'', {}, False)
+                    break
+                try:
+                    body = await reader.readexactly(length) if length else b''
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                self.counters['requests'] += 1
+                status, payload, response_headers = await self.dispatch(method, path, body)
+                await self._write(writer, status, payload, response_headers, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write(writer, status, body, headers, keep_alive):
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}",
+                 f"Content-Length: {len(body)}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        async with server:
+            await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP-сервис конструктора ТС")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None, help="процессов в пуле (по умолчанию - по числу ядер)")
+    parser.add_argument('--max-pending', type=int, default=64, help="задач в работе до ответа 503")
+    parser.add_argument('--library', default=os.environ.get('VEHICLE_LIBRARY_PATH'),
+                        help="каталог постоянной библиотеки (по умолчанию - только в памяти)")
+    args = parser.parse_args(argv)
+
+    library = open_library(args.library) if args.library else VehicleLibrary()
+    service = RenderService(library, workers=args.workers, max_pending=args.max_pending)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,478 @@
+"""Кинематика поворота сцепки тягач + полуприцеп и габаритный коридор.
+
+Модель одноколейная, без бокового увода шин. Центр передней оси тягача
+ведется по заданной траектории. Середина задней тележки тягача тянется за
+ним на расстоянии базы, а середина тележки прицепа - за седлом. Каждое
+звено описывает трактрису. На шаге, где ведущая точка сдвигается по прямой
+на d, угол psi между звеном и направлением сдвига меняется точно:
+tan(psi/2) умножается на exp(-d/база). Поэтому ошибка дает только
+замена траектории ломаной, а схема устойчива при любом шаге. Все пары
+считаются одновременно массивами (P, 2), цикл Python идет только по шагам
+траектории.
+
+Размеры берутся из тех же параметров, что в Scene.add_articulated_vehicle и
+fleet_evaluation.coupling_dimensions: седло в saddle_pos, шкворень в
+kingpin_offset от переднего края прицепа. В плане тягач - прямоугольник
+кабины и рамы, прицеп - прямоугольник кузова.
+
+План - плоскость x, y земли, курс - единичный вектор "вперед". В локальных
+координатах ТС ось x направлена назад от переднего края, поэтому поворот
+узла сцены yaw равен углу курса + pi.
+"""
+import numpy as np
+import plotly.graph_objects as go
+
+from figure_transport import quantize
+from fleet_evaluation import as_structured
+from parallel import map_blocks
+from vehicle_constructor import SemiTrailer, Tractor, geometry_cache, merge_parts, place_part
+
+DEFAULT_STEP = 0.1 # Шаг по траектории передней оси, м
+# Габаритный круг поворота (Правила ЕЭК ООН, Регламент ЕС 1230/2012): радиусы, м
+TURNING_CIRCLE_OUTER = 12.5
+TURNING_CIRCLE_INNER = 5.3
+
+CIRCLE_RESULT_DTYPE = np.dtype([
+    ('tractor', 'i4'), ('trailer', 'i4'),
+    ('front_radius', 'f8'), ('inner_radius', 'f8'), ('outer_radius', 'f8'), ('passes', '?'),
+])
+
+# --- Геометрия сцепки ---
+
+def combination_geometry(tractors, trailers):
+    """Размеры кинематической схемы для транслируемых массивов параметров (м).
+
+    Продольные размеры тягача отсчитываются от центра передней оси, прицепа -
+    от шкворня. База - до середины тележки; hitch_offset - седло позади
+    середины задней тележки тягача (отрицательный - впереди нее).
+    """
+    t, s = tractors, trailers
+    first_rear_axle_pos = t['front_axle_pos'] + t['wheelbase']
+    rear_axle_pos = first_rear_axle_pos + (t['num_rear_axles'] - 1) * t['rear_axle_spacing'] / 2
+    saddle_pos = first_rear_axle_pos + t['saddle_pos_from_rear_axle']
+    chassis_len = saddle_pos + (t['num_rear_axles'] - 1) * t['rear_axle_spacing'] + 0.5
+    trailer_axle_pos = s['length'] - s['axle_pos_from_rear'] - (s['num_axles'] - 1) * s['axle_spacing'] / 2
+    geometry = {
+        'tractor_base': rear_axle_pos - t['front_axle_pos'],
+        'hitch_offset': saddle_pos - rear_axle_pos,
+        'trailer_base': trailer_axle_pos - s['kingpin_offset'],
+        'tractor_front': t['front_axle_pos'],
+        'tractor_rear': np.maximum(chassis_len, t['cab_length']) - t['front_axle_pos'],
+        'tractor_half_width': t['cab_width'] / 2,
+        'trailer_front': s['kingpin_offset'],
+        'trailer_rear': s['length'] - s['kingpin_offset'],
+        'trailer_half_width': s['width'] / 2,
+        'frame_level_z': t['wheel_diameter'] / 2 + 0.3,
+    }
+    shape = np.broadcast(*geometry.values()).shape
+    return {name: np.broadcast_to(np.asarray(value, dtype=float), shape) for name, value in geometry.items()}
+
+def turning_radius(geometry, outer_radius=TURNING_CIRCLE_OUTER):
+    """Радиус траектории центра передней оси, при котором наружный передний угол тягача идет по outer_radius.
+
+    В установившемся повороте центр поворота лежит на линии задней тележки.
+    nan - тягач не вписывается в круг (база с передним свесом длиннее радиуса).
+    """
+    reach = geometry['tractor_base'] + geometry['tractor_front']
+    with np.errstate(invalid='ignore'):
+        rear_radius = np.sqrt(outer_radius ** 2 - reach ** 2) - geometry['tractor_half_width']
+        return np.where(rear_radius > 0, np.hypot(rear_radius, geometry['tractor_base']), np.nan)
+
+# --- Траектории ---
+
+def _arc_positions(radius, angle, steps):
+    """Точки дуги влево от начала координат по курсу +x с центром в (0, radius): генератор (P, 2)."""
+    radius = np.asarray(radius, dtype=float)
+    for phi in np.linspace(0, angle, steps + 1):
+        yield np.stack([radius * np.sin(phi), radius * (1 - np.cos(phi))], axis=-1)
+
+def arc_path(radius, angle=2 * np.pi, approach=0.0, exit=0.0, step=DEFAULT_STEP):
+    """Траектория передней оси (S, 2): прямая approach, дуга влево на angle радиан и прямая exit.
+
+    Дуга начинается в начале координат с курсом +x, центр поворота - (0, radius).
+    """
+    pieces = []
+    if approach > 0:
+        n = int(np.ceil(approach / step))
+        pieces.append(np.column_stack([np.linspace(-approach, 0, n, endpoint=False), np.zeros(n)]))
+    steps = max(1, int(np.ceil(radius * angle / step)))
+    pieces.append(np.array(list(_arc_positions(radius, angle, steps))))
+    if exit > 0:
+        n = int(np.ceil(exit / step))
+        distance = np.linspace(0, exit, n + 1)[1:, None]
+        pieces.append(pieces[-1][-1] + distance * (np.cos(angle), np.sin(angle)))
+    return np.concatenate(pieces)
+
+def resample_path(points, step=DEFAULT_STEP):
+    """Ломаная points (N, 2), переразбитая на отрезки не длиннее step (для произвольных траекторий)."""
+    points = np.asarray(points, dtype=float)
+    stations = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(points, axis=0), axis=1))])
+    samples = np.linspace(0, stations[-1], max(2, int(np.ceil(stations[-1] / step)) + 1))
+    return np.column_stack([np.interp(samples, stations, points[:, 0]), np.interp(samples, stations, points[:, 1])])
+
+# --- Интегрирование ---
+
+def _unit(vectors):
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+def _turn(heading_x, heading_y, direction_x, direction_y, decay):
+    """Курс звена после прямолинейного сдвига ведущей точки по единичному направлению direction.
+
+    tan(psi/2) = sin / (1 + cos) угла psi от направления сдвига до курса
+    умножается на decay = exp(-d/база), новый курс собирается по формулам
+    половинного угла - без тригонометрии. Компоненты передаются отдельными
+    массивами, чтобы пакетные расчеты шли по непрерывной памяти.
+    """
+    cos = direction_x * heading_x + direction_y * heading_y + 1
+    sin = (direction_x * heading_y - direction_y * heading_x) * decay
+    scale = cos * cos + sin * sin
+    if not np.all(scale): # Курс точно против сдвига (psi = pi) не меняется
+        reverse = scale == 0
+        cos, sin, scale = np.where(reverse, 0, cos), np.where(reverse, 1, sin), np.where(reverse, 1, scale)
+    cos, sin = (cos * cos - sin * sin) / scale, 2 * cos * sin / scale
+    return cos * direction_x - sin * direction_y, sin * direction_x + cos * direction_y
+
+def _directions(motion):
+    """Длины и единичные направления сдвигов motion (..., 2).
+
+    Без сдвига направление - +x: множитель exp(-d/база) тогда равен 1, и
+    курс в _turn не меняется при любом направлении.
+    """
+    distance = np.linalg.norm(motion, axis=-1)
+    moved = distance > 0
+    direction = np.where(moved[..., None], motion / np.where(moved, distance, 1)[..., None], (1.0, 0.0))
+    return distance, direction
+
+def _follow(heading, motion, base):
+    """Курс звена после сдвига ведущей точки на motion: точное решение трактрисы для прямолинейного сдвига."""
+    distance, direction = _directions(motion)
+    return np.stack(_turn(heading[..., 0], heading[..., 1], direction[..., 0], direction[..., 1],
+                          np.exp(-distance / base)), axis=-1)
+
+def _integrate(geometry, positions, direction):
+    """Генератор состояний по шагам: (передняя ось, курс тягача, седло, курс прицепа), массивы (P, 2).
+
+    positions - точки передней оси по шагам ((2,) или (P, 2)); на первом шаге
+    автопоезд выпрямлен по направлению direction.
+    """
+    shape = geometry['tractor_base'].shape + (2,)
+    tractor_base, trailer_base = geometry['tractor_base'], geometry['trailer_base']
+    hitch_distance = (geometry['tractor_base'] + geometry['hitch_offset'])[..., None] # От передней оси до седла
+    previous_front = previous_hitch = None
+    for front in positions:
+        front = np.broadcast_to(front, shape)
+        if previous_front is None:
+            tractor_heading = trailer_heading = np.broadcast_to(_unit(np.asarray(direction, dtype=float)), shape)
+        else:
+            tractor_heading = _follow(tractor_heading, front - previous_front, tractor_base)
+        hitch = front - hitch_distance * tractor_heading
+        if previous_hitch is not None:
+            trailer_heading = _follow(trailer_heading, hitch - previous_hitch, trailer_base)
+        previous_front, previous_hitch = front, hitch
+        yield front, tractor_heading, hitch, trailer_heading
+
+def _center_distances(anchor, heading, front, rear, half_width, center):
+    """Ближайшее и дальнее расстояния от точки center до прямоугольника звена в плане.
+
+    Прямоугольник задан точкой anchor, курсом heading и размерами вперед
+    (front), назад (rear) и в полширины от anchor.
+    """
+    offset = center - anchor
+    u = (offset * heading).sum(axis=-1)
+    v = np.abs(offset[..., 1] * heading[..., 0] - offset[..., 0] * heading[..., 1])
+    return np.sqrt(_near_squared(u, v, front, rear, half_width)), np.sqrt(_far_squared(u, v, front, rear, half_width))
+
+def _near_squared(u, v, front, rear, half_width):
+    """Квадрат расстояния до ближайшей точки прямоугольника от точки u (вдоль курса), v (модуль поперек) от anchor."""
+    along = np.maximum(np.maximum(u - front, -rear - u), 0)
+    across = np.maximum(v - half_width, 0)
+    return along * along + across * across
+
+def _far_squared(u, v, front, rear, half_width):
+    """Квадрат расстояния до дальнего угла прямоугольника, обозначения как в _near_squared."""
+    along = np.maximum(front - u, u + rear)
+    across = v + half_width
+    return along * along + across * across
+
+def _rectangles(geometry, front, tractor_heading, hitch, trailer_heading):
+    """Прямоугольники тягача и прицепа: (anchor, курс, вперед, назад, полширины)."""
+    g = geometry
+    return ((front, tractor_heading, g['tractor_front'], g['tractor_rear'], g['tractor_half_width']),
+            (hitch, trailer_heading, g['trailer_front'], g['trailer_rear'], g['trailer_half_width']))
+
+class SweptPath:
+    """Результат simulate: траектории всех пар по шагам.
+
+    front_axle, tractor_heading, hitch, trailer_heading - массивы (S, P, 2);
+    geometry - размеры схемы (combination_geometry) для каждой пары.
+    """
+    def __init__(self, geometry, front_axle, tractor_heading, hitch, trailer_heading):
+        self.geometry = geometry
+        self.front_axle = front_axle
+        self.tractor_heading = tractor_heading
+        self.hitch = hitch
+        self.trailer_heading = trailer_heading
+
+    def __len__(self):
+        return self.front_axle.shape[1]
+
+    @property
+    def trailer_axle(self):
+        """Середина тележки прицепа по шагам (S, P, 2)."""
+        return self.hitch - self.geometry['trailer_base'][:, None] * self.trailer_heading
+
+    def radii(self, center):
+        """Внутренний и внешний радиусы коридора относительно точки center: два массива (P,)."""
+        near, far = zip(*(_center_distances(*rectangle, np.asarray(center, dtype=float))
+                          for rectangle in _rectangles(self.geometry, self.front_axle, self.tractor_heading,
+                                                       self.hitch, self.trailer_heading)))
+        return np.minimum(*near).min(axis=0), np.maximum(*far).max(axis=0)
+
+    def transforms(self, index=0, steps=slice(None)):
+        """Размещения (x, y, z, yaw) узлов тягача и прицепа пары index на шагах steps: два массива (N, 4).
+
+        Размещения совместимы со Scene.set_instances и place_part: прицеп стоит
+        на уровне рамы тягача, как в Scene.add_articulated_vehicle.
+        """
+        g = {name: value[index] for name, value in self.geometry.items()}
+        tractor = _node_transforms(self.front_axle[steps, index], self.tractor_heading[steps, index],
+                                   g['tractor_front'], g['tractor_half_width'], 0.0)
+        trailer = _node_transforms(self.hitch[steps, index], self.trailer_heading[steps, index],
+                                   g['trailer_front'], g['trailer_half_width'], g['frame_level_z'])
+        return tractor, trailer
+
+    def envelope(self, index=0, spacing=0.5, iterations=8):
+        """Границы габаритного коридора пары index: точки (N, 2) слева и справа от траектории.
+
+        Контуры тягача и прицепа на всех шагах (точки через spacing метров)
+        проецируются на траекторию передней оси, продленную прямыми на длину
+        автопоезда в обе стороны. Для каждого отрезка траектории берутся
+        крайние боковые отклонения точек слева и справа.
+        """
+        g = {name: value[index] for name, value in self.geometry.items()}
+        path = self.front_axle[:, index]
+        length = g['tractor_front'] + g['tractor_rear'] + g['trailer_front'] + g['trailer_rear']
+        ds = max(np.linalg.norm(np.diff(path, axis=0), axis=1).mean(), 1e-3)
+        extension = np.arange(1, int(np.ceil(length / ds)) + 1)[:, None] * ds
+        start, end = _unit(path[1] - path[0]), _unit(path[-1] - path[-2])
+        path = np.concatenate([path[0] - extension[::-1] * start, path, path[-1] + extension * end])
+        segments = np.diff(path, axis=0)
+        stations = np.concatenate([[0], np.cumsum(np.linalg.norm(segments, axis=1))])
+        tangents = _unit(segments)
+        step_stations = stations[len(extension):len(extension) + len(self.front_axle)]
+
+        points, guesses = [], []
+        behind = 0.0
+        for anchor, heading, front, rear, half_width in _rectangles(g, self.front_axle[:, index],
+                                                                    self.tractor_heading[:, index],
+                                                                    self.hitch[:, index], self.trailer_heading[:, index]):
+            u, v = _outline(front, rear, half_width, spacing)
+            normal = np.stack([-heading[:, 1], heading[:, 0]], axis=-1)
+            points.append(anchor[:, None, :] + u[None, :, None] * heading[:, None, :]
+                          + v[None, :, None] * normal[:, None, :])
+            guesses.append(step_stations[:, None] - behind + u[None, :])
+            behind = g['tractor_base'] + g['hitch_offset']
+        points = np.concatenate(points, axis=1).reshape(-1, 2)
+        guess = np.concatenate(guesses, axis=1).ravel()
+
+        # Проекция на ломаную итерациями по касательной отрезка (метод Ньютона)
+        for _ in range(iterations):
+            segment = np.clip(np.searchsorted(stations, guess, side='right') - 1, 0, len(segments) - 1)
+            guess = stations[segment] + ((points - path[segment]) * tangents[segment]).sum(axis=1)
+        segment = np.clip(np.searchsorted(stations, guess, side='right') - 1, 0, len(segments) - 1)
+        offset = points - path[segment]
+        lateral = tangents[segment, 0] * offset[:, 1] - tangents[segment, 1] * offset[:, 0]
+
+        left, right = np.full(len(segments), -np.inf), np.full(len(segments), np.inf)
+        np.maximum.at(left, segment, lateral)
+        np.minimum.at(right, segment, lateral)
+        covered = np.isfinite(left)
+        normals = np.stack([-tangents[covered, 1], tangents[covered, 0]], axis=1)
+        base = path[:-1][covered]
+        return base + left[covered, None] * normals, base + right[covered, None] * normals
+
+    def swept_width(self, index=0, spacing=0.5):
+        """Наибольшая ширина коридора пары index поперек траектории (м)."""
+        left, right = self.envelope(index, spacing)
+        return float(np.linalg.norm(left - right, axis=1).max())
+
+    def polygon(self, index=0, spacing=0.5):
+        """Многоугольник коридора (N, 2): левая граница вперед, правая - обратно."""
+        left, right = self.envelope(index, spacing)
+        return np.concatenate([left, right[::-1]])
+
+def _outline(front, rear, half_width, spacing):
+    """Точки контура прямоугольника (u вперед, v влево) с шагом не больше spacing."""
+    n_long = max(2, int(np.ceil((front + rear) / spacing)) + 1)
+    n_cross = max(2, int(np.ceil(2 * half_width / spacing)) + 1)
+    along, across = np.linspace(-rear, front, n_long), np.linspace(-half_width, half_width, n_cross)
+    u = np.concatenate([along, along, np.full(n_cross, front), np.full(n_cross, -rear)])
+    v = np.concatenate([np.full(n_long, half_width), np.full(n_long, -half_width), across, across])
+    return u, v
+
+def _node_transforms(anchor, heading, anchor_x, anchor_y, z):
+    """Размещения узла, при которых локальная точка (anchor_x, anchor_y) ТС попадает в anchor, а ось -x - в курс."""
+    yaw = np.arctan2(heading[:, 1], heading[:, 0]) + np.pi
+    cos, sin = np.cos(yaw), np.sin(yaw)
+    return np.column_stack([anchor[:, 0] - (cos * anchor_x - sin * anchor_y),
+                            anchor[:, 1] - (sin * anchor_x + cos * anchor_y),
+                            np.full(len(yaw), z), yaw])
+
+def simulate(tractors, trailers, path, direction=None):
+    """Моделирует движение пар (tractors[i], trailers[i]) по траектории передней оси.
+
+    tractors и trailers - структурированные массивы параметров (или ТС и
+    списки ТС), транслируемые друг на друга. path - точки (S, 2), общие для
+    всех пар, или (S, P, 2). Автопоезд стартует выпрямленным по направлению
+    direction (по умолчанию - по первому отрезку траектории).
+    """
+    tractors, trailers = as_structured(tractors, Tractor), as_structured(trailers, SemiTrailer)
+    geometry = combination_geometry(tractors, trailers)
+    path = np.asarray(path, dtype=float)
+    if direction is None:
+        direction = path[1] - path[0]
+    states = [np.stack(values) for values in zip(*_integrate(geometry, path, direction))]
+    return SweptPath(geometry, *states)
+
+# --- Пакетная проверка круга поворота ---
+
+def _circle_block(tractors, trailers, tractor_start, outer_radius, inner_radius, angle, step, tolerance):
+    """Проверяет все пары блока тягачей; строки упорядочены по тягачу, затем по прицепу.
+
+    Движение тягача от прицепа не зависит, поэтому тягач и седло
+    интегрируются по тягачам блока (T, 1), а по парам (T, N) - только курс
+    и зазоры прицепа.
+    """
+    geometry = combination_geometry(tractors[:, None], trailers[None, :])
+    lead = {name: value[:, :1] for name, value in geometry.items()}
+    front_radius = turning_radius(lead, outer_radius)
+    feasible = np.isfinite(front_radius)
+    radius = np.where(feasible, front_radius, outer_radius) # Невписывающиеся пары считаются, но не проходят
+    center = np.stack([np.zeros_like(radius), radius], axis=-1)
+
+    steps = max(1, int(np.ceil(radius.max(initial=0) * angle / step)))
+    # Пока хвост еще на прямой въезда, он снаружи круга: внешний радиус - по второй половине дуги
+    settled = (steps + 1) // 2
+    fronts, tractor_headings, hitches, _ = (
+        np.stack(states) for states in zip(*_integrate(lead, _arc_positions(radius, angle, steps), (1.0, 0.0))))
+    near, far = _center_distances(fronts, tractor_headings, lead['tractor_front'], lead['tractor_rear'],
+                                  lead['tractor_half_width'], center)
+    # Дальше по парам копятся квадраты расстояний
+    inner = np.broadcast_to(near.min(axis=0) ** 2, geometry['trailer_base'].shape).copy()
+    outer = np.broadcast_to(far[settled:].max(axis=0) ** 2, geometry['trailer_base'].shape).copy()
+
+    # Сдвиги седла и положение центра круга относительно седла зависят только от тягача: (S, T, 1)
+    distance, direction = _directions(np.diff(hitches, axis=0))
+    direction_x, direction_y = direction[..., 0], direction[..., 1]
+    offset = center - hitches
+    offset_x, offset_y = offset[..., 0], offset[..., 1]
+    # Размеры прицепа - по прицепам (1, N)
+    trailer_base = geometry['trailer_base'][:1]
+    trailer = geometry['trailer_front'][:1], geometry['trailer_rear'][:1], geometry['trailer_half_width'][:1]
+    heading_x, heading_y = np.ones(inner.shape), np.zeros(inner.shape)
+    for index in range(steps + 1):
+        if index:
+            heading_x, heading_y = _turn(heading_x, heading_y, direction_x[index - 1], direction_y[index - 1],
+                                         np.exp(-distance[index - 1] / trailer_base))
+        u = offset_x[index] * heading_x + offset_y[index] * heading_y
+        v = np.abs(offset_y[index] * heading_x - offset_x[index] * heading_y)
+        np.minimum(inner, _near_squared(u, v, *trailer), out=inner)
+        if index >= settled:
+            np.maximum(outer, _far_squared(u, v, *trailer), out=outer)
+
+    result = np.empty(inner.size, dtype=CIRCLE_RESULT_DTYPE)
+    tractor_idx, trailer_idx = np.indices(inner.shape)
+    result['tractor'] = tractor_idx.ravel() + tractor_start
+    result['trailer'] = trailer_idx.ravel()
+    feasible = np.broadcast_to(feasible, inner.shape).ravel()
+    result['front_radius'] = np.broadcast_to(front_radius, inner.shape).ravel()
+    result['inner_radius'] = np.where(feasible, np.sqrt(inner.ravel()), np.nan)
+    result['outer_radius'] = np.where(feasible, np.sqrt(outer.ravel()), np.nan)
+    result['passes'] = feasible & (result['inner_radius'] >= inner_radius) & (
+        result['outer_radius'] <= outer_radius + tolerance)
+    return result
+
+def turning_circle_check(tractors, trailers, outer_radius=TURNING_CIRCLE_OUTER, inner_radius=TURNING_CIRCLE_INNER,
+                         angle=2 * np.pi, step=DEFAULT_STEP, tolerance=0.05, chunk_size=1 << 14, workers=None):
+    """Проверяет все пары тягач x прицеп на габаритный круг поворота; массив CIRCLE_RESULT_DTYPE.
+
+    Наружный передний угол тягача ведется по окружности outer_radius
+    (turning_radius), автопоезд въезжает в круг выпрямленным и проходит дугу
+    angle. Пара проходит, если ни одна точка не заходит внутрь inner_radius,
+    а во второй половине дуги (автопоезд уже в круге) не выходит за
+    outer_radius + tolerance. Пары считаются блоками по
+    chunk_size, при workers > 0 - в пуле процессов (parallel.map_blocks).
+    """
+    tractors, trailers = as_structured(tractors, Tractor), as_structured(trailers, SemiTrailer)
+    args = (outer_radius, inner_radius, angle, step, tolerance)
+    if not len(tractors) or not len(trailers):
+        return np.empty(0, dtype=CIRCLE_RESULT_DTYPE)
+    return np.concatenate(list(map_blocks(_circle_block, tractors, trailers, chunk_size, workers, args)))
+
+# --- Отображение ---
+
+def swept_path_figure(result, tractor, trailer, index=0, frames=30, lod='coarse'):
+    """3D-фигура маневра пары index: коридор, следы осей и анимация автопоезда.
+
+    Детали ТС берутся из geometry_cache и в каждом кадре размещаются по
+    transforms (поворот yaw вокруг оси Z). Кадры меняют только координаты
+    вершин трасс автопоезда; треугольники задаются один раз.
+    """
+    left, right = result.envelope(index)
+    n = len(left)
+    ribbon = np.concatenate([left, right])
+    k = np.arange(n - 1)
+    faces = np.concatenate([np.column_stack([k, k + 1, n + k]), np.column_stack([k + 1, n + k + 1, n + k])])
+    front_axle, trailer_axle = result.front_axle[:, index], result.trailer_axle[:, index]
+    traces = [
+        go.Mesh3d(x=quantize(ribbon[:, 0]), y=quantize(ribbon[:, 1]), z=np.full(2 * n, 0.02),
+                  i=faces[:, 0], j=faces[:, 1], k=faces[:, 2], color='gold', opacity=0.35,
+                  name='Габаритный коридор', hoverinfo='name'),
+        go.Scatter3d(x=quantize(front_axle[:, 0]), y=quantize(front_axle[:, 1]), z=np.full(len(front_axle), 0.05),
+                     mode='lines', line=dict(color='royalblue', width=4), name='Передняя ось тягача'),
+        go.Scatter3d(x=quantize(trailer_axle[:, 0]), y=quantize(trailer_axle[:, 1]), z=np.full(len(trailer_axle), 0.05),
+                     mode='lines', line=dict(color='lightcoral', width=4), name='Тележка прицепа'),
+    ]
+
+    steps = np.unique(np.linspace(0, len(result.front_axle) - 1, frames).round().astype(int))
+    tractor_transforms, trailer_transforms = result.transforms(index, steps)
+    tractor_parts = geometry_cache.get_components(tractor, lod=lod)
+    trailer_parts = geometry_cache.get_components(trailer, lod=lod)
+
+    def posed(frame):
+        parts = [place_part(p, tractor_transforms[frame:frame + 1]) for p in tractor_parts]
+        parts += [place_part(p, trailer_transforms[frame:frame + 1]) for p in trailer_parts]
+        return merge_parts(parts)
+
+    first = posed(0)
+    vehicle_traces = list(range(len(traces), len(traces) + len(first)))
+    for color, (vertices, faces, names) in first.items():
+        traces.append(go.Mesh3d(x=quantize(vertices[:, 0]), y=quantize(vertices[:, 1]), z=quantize(vertices[:, 2]),
+                                i=faces[:, 0], j=faces[:, 1], k=faces[:, 2], color=color, opacity=1.0,
+                                name=', '.join(dict.fromkeys(names)), hoverinfo='name'))
+    animation = [go.Frame(name=str(step), traces=vehicle_traces,
+                          data=[go.Mesh3d(x=quantize(v[:, 0]), y=quantize(v[:, 1]), z=quantize(v[:, 2]))
+                                for v, _, _ in posed(frame).values()])
+                 for frame, step in enumerate(steps)]
+
+    fig = go.Figure(data=traces, frames=animation)
+    play = dict(frame=dict(duration=80, redraw=True), transition=dict(duration=0), fromcurrent=True)
+    fig.update_layout(
+        title_text='Маневр автопоезда',
+        scene=dict(
+            xaxis=dict(title='X (м)'),
+            yaxis=dict(title='Y (м)'),
+            zaxis=dict(title='Высота (Z)'),
+            aspectmode='data',
+        ),
+        updatemenus=[dict(type='buttons', showactive=False, x=0, y=0, xanchor='left', yanchor='top', buttons=[
+            dict(label='▶', method='animate', args=[None, play]),
+            dict(label='❚❚', method='animate', args=[[None], dict(frame=dict(duration=0, redraw=False),
+                                                                 mode='immediate')]),
+        ])],
+        sliders=[dict(steps=[dict(method='animate', label='', args=[[str(step)], dict(
+            mode='immediate', frame=dict(duration=0, redraw=True), transition=dict(duration=0))])
+                             for step in steps], x=0.1, len=0.9, currentvalue=dict(visible=False))],
+        margin=dict(l=10, r=10, b=10, t=40)
+    )
+    return fig
@@ -0,0 +1,199 @@
+"""Программный растеризатор миниатюр ТС в PNG без браузера и Plotly.
+
+Треугольники деталей проецируются ортографической камерой, закрашиваются
+по Ламберту и растеризуются с z-буфером векторно, без циклов Python по
+треугольникам и пикселям: строки треугольников раскладываются в отрезки
+покрытых пикселей, а z-тест - это np.minimum.at по буферу глубины.
+Картинка рисуется с двукратным суперсэмплингом и уменьшается Pillow.
+"""
+import io
+
+import numpy as np
+from PIL import Image, ImageColor
+
+from caching import LRUCache
+from instrumentation import metrics, timed
+from parallel import process_pool
+from vehicle_constructor import geometry_cache, geometry_key
+
+DEFAULT_SIZE = (160, 120)
+DEFAULT_LOD = 'coarse'
+BACKGROUND = (255, 255, 255)
+SUPERSAMPLE = 2
+_MAX_CANDIDATES = 1 << 20 # Пикселей на одну пачку строк треугольников
+
+# --- Растеризация ---
+
+def _view_basis(azimuth, elevation):
+    """Оси камеры (вправо, вверх, вглубь) для камеры на азимуте и высоте (градусы)."""
+    az, el = np.radians(azimuth), np.radians(elevation)
+    forward = -np.array([np.cos(el) * np.cos(az), np.cos(el) * np.sin(az), np.sin(el)])
+    right = np.cross(forward, (0, 0, 1))
+    right /= np.linalg.norm(right)
+    up = np.cross(right, forward)
+    return right, up, forward
+
+def _shade(triangles, colors, forward):
+    """Цвет каждого треугольника: двусторонний Ламберт от света со стороны камеры и сверху."""
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    light = -forward + (0, 0, 0.6)
+    light /= np.linalg.norm(light)
+    intensity = 0.35 + 0.65 * np.abs(normals @ light)
+    return (colors * intensity[:, None]).clip(0, 255).astype(np.uint8)
+
+def _candidate_batches(counts):
+    """Границы пачек строк, в каждой не больше _MAX_CANDIDATES пикселей (кроме одиночных)."""
+    ends = np.cumsum(counts)
+    start = 0
+    while start < len(counts):
+        base = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, base + _MAX_CANDIDATES, side='right')), start + 1)
+        yield start, stop
+        start = stop
+
+def rasterize(points, depth, colors, width, height, background=BACKGROUND):
+    """Растеризует треугольники в массив (height, width, 3) uint8.
+
+    points (M, 3, 2) - вершины в пикселях (y вниз), depth (M, 3) - глубина
+    (меньше - ближе), colors (M, 3) - цвета треугольников. Для каждой строки
+    треугольника отрезок покрытых пикселей находится аналитически из трех
+    барицентрических координат (линейных по x), поэтому перебираются только
+    пиксели внутри треугольников; глубина берется из уравнения плоскости.
+    """
+    image = np.empty((height * width, 3), dtype=np.uint8)
+    image[:] = background
+    zbuffer = np.full(height * width, np.inf)
+
+    x, y = points[:, :, 0], points[:, :, 1]
+    xj, yj, xk, yk = np.roll(x, -1, axis=1), np.roll(y, -1, axis=1), np.roll(x, -2, axis=1), np.roll(y, -2, axis=1)
+    area = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (x[:, 2] - x[:, 0]) * (y[:, 1] - y[:, 0])
+    top = np.maximum(np.ceil(y.min(axis=1) - 0.5), 0).astype(np.int64)
+    bottom = np.minimum(np.floor(y.max(axis=1) - 0.5), height - 1).astype(np.int64)
+    visible = np.flatnonzero((np.abs(area) > 1e-12) & (bottom >= top)
+                             & (x.max(axis=1) >= 0) & (x.min(axis=1) <= width))
+    if not len(visible):
+        return image.reshape(height, width, 3)
+
+    # Барицентрическая координата i = A_i * sx + B_i * sy + C_i
+    area = area[visible, None]
+    A = (yj - yk)[visible] / area
+    B = (xk - xj)[visible] / area
+    C = (xj * yk - xk * yj)[visible] / area
+    z = depth[visible]
+    plane = np.stack([(A * z).sum(axis=1), (B * z).sum(axis=1), (C * z).sum(axis=1)], axis=1)
+
+    # Строки всех треугольников и отрезки [left, right] покрытых пикселей в них
+    rows = bottom[visible] - top[visible] + 1
+    tri = np.repeat(np.arange(len(visible)), rows)
+    py = top[visible][tri] + np.arange(rows.sum()) - np.repeat(np.cumsum(rows) - rows, rows)
+    beta = B[tri] * (py + 0.5)[:, None] + C[tri]
+    alpha = A[tri]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bound = -beta / alpha
+    left = np.where(alpha > 0, bound, -np.inf).max(axis=1)
+    right = np.where(alpha < 0, bound, np.inf).min(axis=1)
+    empty = ((alpha == 0) & (beta < 0)).any(axis=1)
+    left = np.maximum(np.ceil(np.maximum(left, -1) - 0.5), 0).astype(np.int64)
+    right = np.minimum(np.floor(np.minimum(right, width + 1) - 0.5), width - 1).astype(np.int64)
+    counts = np.where(empty, 0, np.maximum(right - left + 1, 0))
+
+    for start, stop in _candidate_batches(counts):
+        n = counts[start:stop]
+        row = np.repeat(np.arange(start, stop), n)
+        px = left[row] + np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        t = tri[row]
+        pz = plane[t, 0] * (px + 0.5) + plane[t, 1] * (py[row] + 0.5) + plane[t, 2]
+        pixel = py[row] * width + px
+
+        # z-тест без сортировки: минимум глубины по пикселю, затем цвет победителей
+        np.minimum.at(zbuffer, pixel, pz)
+        nearest = pz == zbuffer[pixel]
+        image[pixel[nearest]] = colors[visible[t[nearest]]]
+    return image.reshape(height, width, 3)
+
+def render_parts(parts, size=DEFAULT_SIZE, azimuth=215, elevation=25, margin=0.06, background=BACKGROUND):
+    """Рисует детали в изображение Pillow размера size (ширина, высота)."""
+    width, height = size
+    ss_width, ss_height = width * SUPERSAMPLE, height * SUPERSAMPLE
+    parts = [p for p in parts if len(p.faces)]
+    if not parts:
+        return Image.new('RGB', size, background)
+
+    triangles = np.concatenate([p.vertices[p.faces] for p in parts])
+    palette = {p.color: ImageColor.getrgb(p.color)[:3] for p in parts}
+    colors = np.repeat(np.array([palette[p.color] for p in parts], dtype=float),
+                       [len(p.faces) for p in parts], axis=0)
+    right, up, forward = _view_basis(azimuth, elevation)
+    colors = _shade(triangles, colors, forward)
+
+    screen = np.stack([triangles @ right, -(triangles @ up)], axis=-1) # y экрана вниз
+    depth = triangles @ forward
+    low, high = screen.reshape(-1, 2).min(axis=0), screen.reshape(-1, 2).max(axis=0)
+    extent = np.maximum(high - low, 1e-9)
+    usable = np.array([ss_width, ss_height]) * (1 - 2 * margin)
+    scale = (usable / extent).min()
+    offset = (np.array([ss_width, ss_height]) - extent * scale) / 2
+    points = (screen - low) * scale + offset
+
+    pixels = rasterize(points, depth, colors, ss_width, ss_height, background)
+    return Image.fromarray(pixels, 'RGB').resize(size, Image.LANCZOS)
+
+@timed('thumbnails.render')
+def render_thumbnail(vehicle, size=DEFAULT_SIZE, lod=DEFAULT_LOD):
+    """PNG-миниатюра ТС (bytes) без кэша миниатюр; геометрия берется из geometry_cache."""
+    image = render_parts(geometry_cache.get_components(vehicle, lod=lod), tuple(size))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+# --- Кэш и пакетный режим ---
+
+# Общий для процесса кэш PNG-миниатюр по ключу параметров ТС, размера и LOD
+thumbnail_cache = LRUCache(max_bytes=32 << 20)
+metrics.register_gauge('thumbnail_cache_bytes', lambda: thumbnail_cache.nbytes, "Объем PNG-миниатюр в кэше")
+
+def thumbnail_key(vehicle, size=DEFAULT_SIZE, lod=DEFAULT_LOD):
+    return geometry_key(vehicle, 'thumbnail', *size, lod)
+
+def thumbnail(vehicle, size=DEFAULT_SIZE, lod=DEFAULT_LOD, cache=thumbnail_cache):
+    """PNG-миниатюра ТС из кэша; рисуется только при промахе."""
+    key = thumbnail_key(vehicle, size, lod)
+    png = cache.lookup(key)
+    if png is None:
+        png = render_thumbnail(vehicle, size, lod)
+        cache.store(key, png)
+    return png
+
+def _render_batch(vehicles, size, lod):
+    return [render_thumbnail(vehicle, size, lod) for vehicle in vehicles]
+
+def render_thumbnails(vehicles, size=DEFAULT_SIZE, lod=DEFAULT_LOD, workers=None, chunk_size=32,
+                      cache=thumbnail_cache):
+    """Миниатюры для списка ТС в том же порядке.
+
+    Закэшированные берутся из кэша; остальные рисуются здесь или, при
+    workers > 0, пачками по chunk_size в parallel.process_pool, и кладутся в кэш.
+    """
+    vehicles = list(vehicles)
+    keys = [thumbnail_key(vehicle, size, lod) for vehicle in vehicles]
+    result = [cache.lookup(key) for key in keys]
+    missing = list({keys[i]: i for i in range(len(vehicles)) if result[i] is None}.values())
+    if not missing:
+        return result
+
+    chunks = [missing[start:start + chunk_size] for start in range(0, len(missing), chunk_size)]
+    if workers:
+        with process_pool(workers) as pool:
+            rendered = pool.map(_render_batch, [[vehicles[i] for i in chunk] for chunk in chunks],
+                                [size] * len(chunks), [lod] * len(chunks))
+            rendered = [png for batch in rendered for png in batch]
+    else:
+        rendered = _render_batch([vehicles[i] for i in missing], size, lod)
+
+    pngs = {}
+    for i, png in zip(missing, rendered):
+        cache.store(keys[i], png)
+        pngs[keys[i]] = png
+    return [png if png is not None else pngs[key] for png, key in zip(result, keys)]
@@ -1,285 +1,861 @@
-import plotly.graph_objects as go
-import numpy as np
-
-# --- Вспомогательные функции отрисовки ---
-
-def _create_cuboid(origin, dimensions, color='lightblue', name='cuboid'):
-    """Создает параллелепипед (кубоид) для Plotly."""
-    x0, y0, z0 = origin
-    dx, dy, dz = dimensions
-    vertices = np.array([
-        [x0, y0, z0], [x0 + dx, y0, z0], [x0 + dx, y0 + dy, z0], [x0, y0 + dy, z0],
-        [x0, y0, z0 + dz], [x0 + dx, y0, z0 + dz], [x0 + dx, y0 + dy, z0 + dz], [x0, y0 + dy, z0 + dz]
-    ])
-    faces = np.array([
-        [0, 1, 2], [0, 2, 3], [4, 5, 6], [4, 6, 7], [0, 4, 5], [0, 5, 1],
-        [1, 5, 6], [1, 6, 2], [2, 6, 7], [2, 7, 3], [3, 7, 4], [3, 4, 0]
-    ])
-    return go.Mesh3d(
-        x=vertices[:, 0], y=vertices[:, 1], z=vertices[:, 2],
-        i=faces[:, 0], j=faces[:, 1], k=faces[:, 2],
-        color=color, opacity=1.0, name=name, hoverinfo='name'
-    )
-
-def _create_cylinder(center, radius, length, axis='y', color='darkgrey', name='cylinder', num_points=30):
-    """Создает цилиндр для Plotly."""
-    cx, cy, cz = center
-    theta = np.linspace(0, 2 * np.pi, num_points)
-    
-    if axis == 'y':
-        v = np.linspace(cy - length / 2, cy + length / 2, 2)
-        theta_grid, v_grid = np.meshgrid(theta, v)
-        x_grid, y_grid, z_grid = radius * np.cos(theta_grid) + cx, v_grid, radius * np.sin(theta_grid) + cz
-    elif axis == 'x':
-        v = np.linspace(cx - length / 2, cx + length / 2, 2)
-        theta_grid, v_grid = np.meshgrid(theta, v)
-        x_grid, y_grid, z_grid = v_grid, radius * np.cos(theta_grid) + cy, radius * np.sin(theta_grid) + cz
-    else: # 'z'
-        v = np.linspace(cz - length / 2, cz + length / 2, 2)
-        theta_grid, v_grid = np.meshgrid(theta, v)
-        x_grid, y_grid, z_grid = radius * np.cos(theta_grid) + cx, radius * np.sin(theta_grid) + cy, v_grid
-        
-    colorscale = [[0, color], [1, color]]
-    return go.Surface(x=x_grid, y=y_grid, z=z_grid, colorscale=colorscale, showscale=False, name=name, hoverinfo='name')
-
-# --- Классы Сущностей ---
-
-class Tractor:
-    """Класс для представления Тягача."""
-    def __init__(self, brand="Tractor", model="Default", cab_length=2.2, cab_width=2.5, cab_height=2.8,
-                 front_axle_pos=1.45, wheelbase=3.6, saddle_pos_from_rear_axle=0.5,
-                 num_rear_axles=2, rear_axle_spacing=1.3, wheel_type='dual',
-                 wheel_diameter=1.0, wheel_width=0.4):
-        self.brand = brand
-        self.model = model
-        self.cab_length = cab_length
-        self.cab_width = cab_width
-        self.cab_height = cab_height
-        self.front_axle_pos = front_axle_pos
-        self.wheelbase = wheelbase
-        self.saddle_pos_from_rear_axle = saddle_pos_from_rear_axle
-        self.num_rear_axles = num_rear_axles
-        self.rear_axle_spacing = rear_axle_spacing
-        self.wheel_type = wheel_type
-        self.wheel_diameter = wheel_diameter
-        self.wheel_width = wheel_width
-        
-        self.wheel_radius = self.wheel_diameter / 2
-        self.frame_level_z = self.wheel_radius + 0.3 # Более реалистичная высота рамы
-        self.first_rear_axle_pos = self.front_axle_pos + self.wheelbase
-        self.saddle_pos = self.first_rear_axle_pos + self.saddle_pos_from_rear_axle
-
-    def get_unique_name(self):
-        return f"{self.brand} {self.model} (Тягач)"
-
-    def get_components(self, x_offset=0, y_offset=0, z_offset=0):
-        """Возвращает список всех 3D компонентов тягача со смещением."""
-        parts = []
-        
-        # TODO: Заменить на загрузку .gltf модели кабины
-        parts.append(_create_cuboid((x_offset, y_offset, z_offset + self.frame_level_z), 
-                                   (self.cab_length, self.cab_width, self.cab_height), 'royalblue', 'Кабина'))
-        
-        chassis_len = self.first_rear_axle_pos + (self.num_rear_axles -1) * self.rear_axle_spacing + self.saddle_pos_from_rear_axle + 0.5
-        frame_width = 1.0
-        parts.append(_create_cuboid((x_offset, y_offset + (self.cab_width - frame_width) / 2, z_offset + self.frame_level_z - 0.2), 
-                                   (chassis_len, frame_width, 0.2), 'dimgray', 'Рама тягача'))
-        saddle_x_center = self.first_rear_axle_pos + self.saddle_pos_from_rear_axle
-        saddle_width = 1.2
-        parts.append(_create_cuboid((x_offset + saddle_x_center - 0.5, y_offset + (self.cab_width - saddle_width) / 2, z_offset + self.frame_level_z), 
-                                   (1.0, saddle_width, 0.05), 'darkslategrey', 'Седло'))
-        
-        y_left_center_single = y_offset + self.wheel_width / 2
-        y_right_center_single = y_offset + self.cab_width - self.wheel_width / 2
-        
-        y_left_center_dual = y_offset + self.wheel_width
-        y_right_center_dual = y_offset + self.cab_width - self.wheel_width
-
-        parts.append(_create_cylinder((x_offset + self.front_axle_pos, y_left_center_single, z_offset + self.wheel_radius), self.wheel_radius, self.wheel_width, 'y', name='Колесо'))
-        parts.append(_create_cylinder((x_offset + self.front_axle_pos, y_right_center_single, z_offset + self.wheel_radius), self.wheel_radius, self.wheel_width, 'y', name='Колесо'))
-        
-        for i in range(self.num_rear_axles):
-            axle_x = self.first_rear_axle_pos + (i * self.rear_axle_spacing)
-            if self.wheel_type == 'dual':
-                centers = [
-                    (x_offset + axle_x, y_left_center_dual - self.wheel_width/2, z_offset + self.wheel_radius),
-                    (x_offset + axle_x, y_left_center_dual + self.wheel_width/2, z_offset + self.wheel_radius),
-                    (x_offset + axle_x, y_right_center_dual - self.wheel_width/2, z_offset + self.wheel_radius),
-                    (x_offset + axle_x, y_right_center_dual + self.wheel_width/2, z_offset + self.wheel_radius)
-                ]
-            else: # single
-                centers = [
-                    (x_offset + axle_x, y_left_center_single, z_offset + self.wheel_radius),
-                    (x_offset + axle_x, y_right_center_single, z_offset + self.wheel_radius)
-                ]
-            for center in centers: 
-                parts.append(_create_cylinder(center, self.wheel_radius, self.wheel_width, 'y', name='Колесо'))
-
-        return parts
-
-class SemiTrailer:
-    """Класс для представления Полуприцепа."""
-    def __init__(self, brand="Trailer", model="Default", length=13.6, width=2.55, height=2.7,
-                 kingpin_offset=1.2, axle_pos_from_rear=2.5,
-                 num_axles=3, axle_spacing=1.3, wheel_type='single',
-                 wheel_diameter=1.0, wheel_width=0.4):
-        self.brand = brand
-        self.model = model
-        self.length = length
-        self.width = width
-        self.height = height
-        self.kingpin_offset = kingpin_offset
-        self.axle_pos_from_rear = axle_pos_from_rear
-        self.num_axles = num_axles
-        self.axle_spacing = axle_spacing
-        self.wheel_type = wheel_type
-        self.wheel_diameter = wheel_diameter
-        self.wheel_width = wheel_width
-        self.wheel_radius = self.wheel_diameter / 2
-
-    def get_unique_name(self):
-        return f"{self.brand} {self.model} (Прицеп)"
-
-    def get_components(self, x_offset=0, y_offset=0, z_offset=0):
-        """Возвращает список всех 3D компонентов полуприцепа со смещением."""
-        parts = []
-
-        parts.append(_create_cuboid((x_offset, y_offset, z_offset), (self.length, self.width, self.height), 'lightcoral', 'Кузов'))
-        frame_width = 1.0
-        parts.append(_create_cuboid((x_offset, y_offset + (self.width - frame_width)/2, z_offset - 0.2), (self.length, frame_width, 0.2), 'dimgray', 'Рама прицепа'))
-        
-        y_left_center_single = y_offset + self.wheel_width / 2
-        y_right_center_single = y_offset + self.width - self.wheel_width / 2
-        
-        y_left_center_dual = y_offset + self.wheel_width
-        y_right_center_dual = y_offset + self.width - self.wheel_width
-        
-        first_axle_pos = self.length - self.axle_pos_from_rear
-        for i in range(self.num_axles):
-            axle_x = x_offset + first_axle_pos - (i * self.axle_spacing)
-            if self.wheel_type == 'dual':
-                centers = [
-                    (axle_x, y_left_center_dual - self.wheel_width/2, z_offset - 0.2 + self.wheel_radius),
-                    (axle_x, y_left_center_dual + self.wheel_width/2, z_offset - 0.2 + self.wheel_radius),
-                    (axle_x, y_right_center_dual - self.wheel_width/2, z_offset - 0.2 + self.wheel_radius),
-                    (axle_x, y_right_center_dual + self.wheel_width/2, z_offset - 0.2 + self.wheel_radius)
-                ]
-            else: # single
-                centers = [
-                    (axle_x, y_left_center_single, z_offset - 0.2 + self.wheel_radius),
-                    (axle_x, y_right_center_single, z_offset - 0.2 + self.wheel_radius)
-                ]
-            for center in centers: 
-                parts.append(_create_cylinder(center, self.wheel_radius, self.wheel_width, 'y', name='Колесо'))
-            
-        return parts
-        
-class Van:
-    """Класс для представления Фургона."""
-    def __init__(self, brand="Van", model="Default", body_length=6.0, body_width=2.4, body_height=2.2,
-                 cab_length=2.0, front_axle_pos=1.2, wheelbase=4.0,
-                 num_rear_axles=1, rear_axle_spacing=0, wheel_type='dual',
-                 wheel_diameter=0.8, wheel_width=0.3):
-        self.brand = brand
-        self.model = model
-        self.body_length = body_length
-        self.body_width = body_width
-        self.body_height = body_height
-        self.cab_length = cab_length
-        self.front_axle_pos = front_axle_pos
-        self.wheelbase = wheelbase
-        self.num_rear_axles = num_rear_axles
-        self.rear_axle_spacing = rear_axle_spacing
-        self.wheel_type = wheel_type
-        self.wheel_diameter = wheel_diameter
-        self.wheel_width = wheel_width
-        
-        self.wheel_radius = self.wheel_diameter / 2
-        self.frame_level_z = self.wheel_radius + 0.3
-    
-    def get_unique_name(self):
-        return f"{self.brand} {self.model} (Фургон)"
-
-    def get_components(self, x_offset=0, y_offset=0, z_offset=0):
-        """Возвращает список всех 3D компонентов фургона."""
-        parts = []
-        
-        parts.append(_create_cuboid((x_offset, y_offset, z_offset + self.frame_level_z),
-                                   (self.cab_length, self.body_width, self.body_height), 'skyblue', 'Кабина фургона'))
-        parts.append(_create_cuboid((x_offset + self.cab_length, y_offset, z_offset + self.frame_level_z),
-                                   (self.body_length, self.body_width, self.body_height), 'lightgrey', 'Кузов фургона'))
-        chassis_len = self.cab_length + self.body_length
-        frame_width = 1.0
-        parts.append(_create_cuboid((x_offset, y_offset + (self.body_width - frame_width)/2, z_offset + self.frame_level_z - 0.2),
-                                   (chassis_len, frame_width, 0.2), 'dimgray', 'Рама фургона'))
-        
-        y_left_center_single = y_offset + self.wheel_width / 2
-        y_right_center_single = y_offset + self.body_width - self.wheel_width / 2
-
-        y_left_center_dual = y_offset + self.wheel_width
-        y_right_center_dual = y_offset + self.body_width - self.wheel_width
-        
-        parts.append(_create_cylinder((x_offset + self.front_axle_pos, y_left_center_single, z_offset + self.wheel_radius), self.wheel_radius, self.wheel_width, 'y', name='Колесо'))
-        parts.append(_create_cylinder((x_offset + self.front_axle_pos, y_right_center_single, z_offset + self.wheel_radius), self.wheel_radius, self.wheel_width, 'y', name='Колесо'))
-        
-        first_rear_axle_pos = self.front_axle_pos + self.wheelbase
-        for i in range(self.num_rear_axles):
-            axle_x = first_rear_axle_pos + (i * self.rear_axle_spacing)
-            if self.wheel_type == 'dual':
-                 centers = [
-                    (x_offset + axle_x, y_left_center_dual - self.wheel_width/2, z_offset + self.wheel_radius),
-                    (x_offset + axle_x, y_left_center_dual + self.wheel_width/2, z_offset + self.wheel_radius),
-                    (x_offset + axle_x, y_right_center_dual - self.wheel_width/2, z_offset + self.wheel_radius),
-                    (x_offset + axle_x, y_right_center_dual + self.wheel_width/2, z_offset + self.wheel_radius)
-                ]
-            else: # single
-                centers = [
-                    (x_offset + axle_x, y_left_center_single, z_offset + self.wheel_radius),
-                    (x_offset + axle_x, y_right_center_single, z_offset + self.wheel_radius)
-                ]
-            for center in centers: 
-                parts.append(_create_cylinder(center, self.wheel_radius, self.wheel_width, 'y', name='Колесо'))
-            
-        return parts
-
-# --- Класс Сборщика ---
-class Scene:
-    """Класс для сборки и отображения различных транспортных сущностей."""
-    def __init__(self):
-        self.components = []
-
-    def add(self, vehicle, x=0, y=0, z=0):
-        """Универсальный метод для добавления любого транспортного средства на сцену."""
-        if vehicle:
-            self.components.extend(vehicle.get_components(x_offset=x, y_offset=y, z_offset=z))
-
-    def add_articulated_vehicle(self, tractor, trailer):
-        """Добавляет сцепку тягача и полуприцепа на сцену."""
-        if tractor and trailer:
-            trailer_start_x = tractor.saddle_pos - trailer.kingpin_offset
-            y_offset_tractor = (trailer.width - tractor.cab_width) / 2
-            
-            self.add(tractor, y=y_offset_tractor)
-            self.add(trailer, x=trailer_start_x, z=tractor.frame_level_z)
-
-    def generate_figure(self):
-        """Собирает все добавленные компоненты в единую 3D модель."""
-        if not self.components:
-            fig = go.Figure()
-        else:
-            fig = go.Figure(data=self.components)
-        
-        fig.update_layout(
-            title_text='3D Модель',
-            scene=dict(
-                xaxis=dict(title='Длина (X)', autorange="reversed"),
-                yaxis=dict(title='Ширина (Y)'),
-                zaxis=dict(title='Высота (Z)'),
-                aspectmode='data',
-            ),
-            margin=dict(l=10, r=10, b=10, t=40)
-        )
-        return fig
-
-
-
+import functools
+import hashlib
+import inspect
+
+import plotly.graph_objects as go
+import numpy as np
+
+from caching import LRUCache
+from figure_transport import compact_mesh
+from instrumentation import inc, metrics, span, timed
+from mesh_assets import asset_cache
+
+# --- Уровни детализации ---
+
+# Число сегментов окружности колеса для каждого уровня детализации (LOD).
+# Кубоиды точны при любом уровне и всегда состоят из 12 треугольников.
+LOD_SEGMENTS = {'coarse': 12, 'medium': 30, 'fine': 64}
+LOD_ORDER = ('fine', 'medium', 'coarse') # От подробного к грубому
+DEFAULT_LOD = 'medium'
+DEFAULT_TRIANGLE_BUDGET = 60000
+
+# --- Вспомогательные функции отрисовки ---
+
+class Part:
+    """Геометрия одной детали: вершины (N, 3), треугольники (M, 3), цвет и имя."""
+    __slots__ = ('vertices', 'faces', 'color', 'name')
+
+    def __init__(self, vertices, faces, color, name):
+        self.vertices = vertices
+        self.faces = faces
+        self.color = color
+        self.name = name
+
+    @property
+    def num_triangles(self):
+        return len(self.faces)
+
+
+_CUBOID_CORNERS = np.array([
+    [0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+    [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]
+], dtype=float)
+
+# Треугольники обходятся против часовой стрелки при взгляде снаружи (нормали наружу)
+_CUBOID_FACES = np.array([
+    [0, 2, 1], [0, 3, 2], [4, 5, 6], [4, 6, 7], [0, 1, 5], [0, 5, 4],
+    [1, 2, 6], [1, 6, 5], [2, 3, 7], [2, 7, 6], [3, 0, 4], [3, 4, 7]
+])
+_CUBOID_FACES.flags.writeable = False
+
+def _check_outward(vertices, faces):
+    """Проверяет, что у выпуклого замкнутого шаблона все нормали треугольников смотрят наружу."""
+    triangles = vertices[faces]
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    outward = (normals * (triangles.mean(axis=1) - vertices.mean(axis=0))).sum(axis=1) > 0
+    if not outward.all():
+        raise AssertionError(f"Треугольники {np.flatnonzero(~outward).tolist()} шаблона обращены внутрь")
+
+_check_outward(_CUBOID_CORNERS, _CUBOID_FACES)
+
+def _create_cuboid(origin, dimensions, color='lightblue', name='cuboid'):
+    """Создает параллелепипед (кубоид) как деталь сцены."""
+    vertices = _CUBOID_CORNERS * np.asarray(dimensions, dtype=float) + np.asarray(origin, dtype=float)
+    return Part(vertices, _CUBOID_FACES, color, name)
+
+def _create_box_part(model, origin, dimensions, color, name):
+    """Деталь по габаритной коробке: меш из файла model, вписанный в коробку, или кубоид.
+
+    Меш берется из общего кэша (asset_cache) и разбирается только при первом
+    обращении; буфер треугольников разделяется со всеми размещениями модели.
+    """
+    if not model:
+        return _create_cuboid(origin, dimensions, color, name)
+    asset = asset_cache.get(model)
+    return Part(asset.fit_to_box(origin, dimensions), asset.faces, color, name)
+
+@functools.lru_cache(maxsize=None)
+def _unit_cylinder(num_points):
+    """Замкнутый цилиндр радиуса 1 и длины 1 вдоль оси Y с центром в нуле.
+
+    Вершины: два кольца по num_points точек и два центра торцов. Треугольники
+    обходятся против часовой стрелки при взгляде снаружи (нормали наружу).
+    Результат кэшируется и используется как шаблон для всех колес.
+    """
+    theta = np.linspace(0, 2 * np.pi, num_points, endpoint=False)
+    ring = np.column_stack([np.cos(theta), np.zeros(num_points), np.sin(theta)])
+    near, far = ring + (0, -0.5, 0), ring + (0, 0.5, 0)
+    vertices = np.concatenate([near, far, [[0, -0.5, 0], [0, 0.5, 0]]])
+
+    k = np.arange(num_points)
+    k_next = (k + 1) % num_points
+    near_center, far_center = 2 * num_points, 2 * num_points + 1
+    faces = np.concatenate([
+        np.column_stack([num_points + k_next, k_next, k]),
+        np.column_stack([num_points + k, num_points + k_next, k]),
+        np.column_stack([k, k_next, np.full(num_points, near_center)]),
+        np.column_stack([num_points + k_next, num_points + k, np.full(num_points, far_center)]),
+    ])
+    _check_outward(vertices, faces)
+    vertices.flags.writeable = False
+    faces.flags.writeable = False
+    return vertices, faces
+
+_AXIS_ORDER = {'x': [1, 0, 2], 'y': [0, 1, 2], 'z': [0, 2, 1]}
+_MIRRORED_AXES = {'x', 'z'} # Перестановка двух осей - отражение: обход треугольников надо развернуть
+
+def _create_cylinder(center, radius, length, axis='y', color='darkgrey', name='cylinder', num_points=30):
+    """Создает замкнутый цилиндр как деталь сцены."""
+    template, faces = _unit_cylinder(num_points)
+    vertices = (template * (radius, length, radius))[:, _AXIS_ORDER[axis]]
+    if axis in _MIRRORED_AXES:
+        faces = faces[:, ::-1]
+    return Part(vertices + np.asarray(center, dtype=float), faces, color, name)
+
+def _create_wheel_set(centers, radius, width, num_points=30, color='darkgrey', name='Колесо'):
+    """Создает все колеса с центрами centers (N, 3) одной деталью.
+
+    Геометрия получается одним броадкастом шаблона _unit_cylinder на все центры,
+    без отдельного вызова _create_cylinder на каждое колесо.
+    """
+    centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+    template, template_faces = _unit_cylinder(num_points)
+    vertices = (template * (radius, width, radius))[None, :, :] + centers[:, None, :]
+    faces = template_faces[None, :, :] + (np.arange(len(centers)) * len(template))[:, None, None]
+    return Part(vertices.reshape(-1, 3), faces.reshape(-1, 3), color, name)
+
+def _axle_wheel_centers(axle_xs, y_offset, track_width, wheel_width, wheel_type, z):
+    """Возвращает центры колес (len(axle_xs) * k, 3) для набора осей.
+
+    Одинарные колеса стоят у бортов, сдвоенные - парами внутрь от бортов.
+    """
+    if wheel_type == 'dual':
+        y_local = [wheel_width / 2, 3 * wheel_width / 2,
+                   track_width - 3 * wheel_width / 2, track_width - wheel_width / 2]
+    else: # single
+        y_local = [wheel_width / 2, track_width - wheel_width / 2]
+    axle_xs = np.asarray(axle_xs, dtype=float)
+    ys = y_offset + np.asarray(y_local)
+    centers = np.empty((len(axle_xs), len(ys), 3))
+    centers[:, :, 0] = axle_xs[:, None]
+    centers[:, :, 1] = ys[None, :]
+    centers[:, :, 2] = z
+    return centers.reshape(-1, 3)
+
+def merge_parts(parts):
+    """Сливает детали одного цвета в общие буферы вершин, треугольников и имен.
+
+    Возвращает словарь {цвет: (vertices, faces, names)}, где names содержит
+    имя детали для каждой вершины. Порядок цветов совпадает с порядком деталей.
+    """
+    groups = {}
+    for part in parts:
+        groups.setdefault(part.color, []).append(part)
+
+    merged = {}
+    for color, group in groups.items():
+        counts = np.array([len(p.vertices) for p in group])
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        vertices = np.concatenate([p.vertices for p in group])
+        faces = np.concatenate([p.faces + offset for p, offset in zip(group, offsets)])
+        names = np.repeat(np.array([p.name for p in group], dtype=object), counts)
+        merged[color] = (vertices, faces, names)
+    return merged
+
+@timed('figure.build_trace')
+def _batched_mesh(color, vertices, faces, names):
+    """Строит один индексированный Mesh3d для всех деталей одного цвета.
+
+    Буферы сжимаются для передачи в браузер (см. figure_transport.compact_mesh).
+    """
+    vertices, faces, hovertext = compact_mesh(vertices, faces, names)
+    return mesh_trace(color, ', '.join(dict.fromkeys(names)), vertices, faces, hovertext)
+
+def mesh_trace(color, name, vertices, faces, hovertext):
+    """Mesh3d из уже сжатых буферов."""
+    return go.Mesh3d(
+        x=vertices[:, 0], y=vertices[:, 1], z=vertices[:, 2],
+        i=faces[:, 0], j=faces[:, 1], k=faces[:, 2],
+        color=color, opacity=1.0, name=name,
+        hovertext=hovertext, hoverinfo='text'
+    )
+
+def scene_figure(traces):
+    """Фигура сцены с осями и разметкой конструктора."""
+    fig = go.Figure(data=traces)
+    fig.update_layout(
+        title_text='3D Модель',
+        scene=dict(
+            xaxis=dict(title='Длина (X)', autorange="reversed"),
+            yaxis=dict(title='Ширина (Y)'),
+            zaxis=dict(title='Высота (Z)'),
+            aspectmode='data',
+        ),
+        margin=dict(l=10, r=10, b=10, t=40)
+    )
+    return fig
+
+# --- Классы Сущностей ---
+
+class Vehicle:
+    """Общая основа ТС: схема параметров конструктора и доступ к ним."""
+    __slots__ = ()
+    PARAMETERS = {} # Имя параметра конструктора -> тип значения
+    TYPE_LABEL = '' # Тип ТС в уникальном имени
+    NUM_CUBOIDS = 0 # Число кубоидов в get_components
+    MODEL_PARAMETERS = () # Параметры с путями к мешам, заменяющим кубоиды (пусто - кубоид)
+    NAMING_PARAMETERS = ('brand', 'model') # Параметры, не влияющие на геометрию
+
+    @classmethod
+    def make_unique_name(cls, brand, model):
+        return f"{brand} {model} ({cls.TYPE_LABEL})"
+
+    def get_unique_name(self):
+        return self.make_unique_name(self.brand, self.model)
+
+    def get_params(self):
+        """Возвращает параметры конструктора, приведенные к типам из схемы."""
+        return {name: kind(getattr(self, name)) for name, kind in self.PARAMETERS.items()}
+
+    @classmethod
+    def default_params(cls):
+        """Значения параметров по умолчанию из сигнатуры конструктора."""
+        signature = inspect.signature(cls.__init__)
+        return {name: p.default for name, p in signature.parameters.items() if name in cls.PARAMETERS}
+
+    def model_paths(self):
+        """Непустые пути к мешам моделей этого ТС."""
+        return [path for path in (getattr(self, name) for name in self.MODEL_PARAMETERS) if path]
+
+    def estimate_triangles(self, lod=DEFAULT_LOD):
+        """Число треугольников геометрии ТС на уровне детализации lod (без ее построения).
+
+        Для мешей моделей используется уже разобранный (или загружаемый) меш из кэша.
+        """
+        triangles = 12 * self.NUM_CUBOIDS + 4 * LOD_SEGMENTS[lod] * self.wheel_count()
+        for path in self.model_paths():
+            triangles += asset_cache.get(path).num_triangles - 12
+        return triangles
+
+    @staticmethod
+    def _wheels_per_axle(wheel_type):
+        return 4 if wheel_type == 'dual' else 2
+
+class Tractor(Vehicle):
+    """Класс для представления Тягача."""
+    TYPE_LABEL = "Тягач"
+    NUM_CUBOIDS = 3
+    PARAMETERS = {
+        'brand': str, 'model': str, 'cab_length': float, 'cab_width': float, 'cab_height': float,
+        'front_axle_pos': float, 'wheelbase': float, 'saddle_pos_from_rear_axle': float,
+        'num_rear_axles': int, 'rear_axle_spacing': float, 'wheel_type': str,
+        'wheel_diameter': float, 'wheel_width': float, 'cab_model': str
+    }
+    MODEL_PARAMETERS = ('cab_model',)
+    __slots__ = (*PARAMETERS, 'wheel_radius', 'frame_level_z', 'first_rear_axle_pos', 'saddle_pos')
+
+    def __init__(self, brand="Tractor", model="Default", cab_length=2.2, cab_width=2.5, cab_height=2.8,
+                 front_axle_pos=1.45, wheelbase=3.6, saddle_pos_from_rear_axle=0.5,
+                 num_rear_axles=2, rear_axle_spacing=1.3, wheel_type='dual',
+                 wheel_diameter=1.0, wheel_width=0.4, cab_model=''):
+        self.brand = brand
+        self.model = model
+        self.cab_length = cab_length
+        self.cab_width = cab_width
+        self.cab_height = cab_height
+        self.front_axle_pos = front_axle_pos
+        self.wheelbase = wheelbase
+        self.saddle_pos_from_rear_axle = saddle_pos_from_rear_axle
+        self.num_rear_axles = num_rear_axles
+        self.rear_axle_spacing = rear_axle_spacing
+        self.wheel_type = wheel_type
+        self.wheel_diameter = wheel_diameter
+        self.wheel_width = wheel_width
+        self.cab_model = cab_model # Путь к .gltf/.glb кабины; пусто - кубоид
+        
+        self.wheel_radius = self.wheel_diameter / 2
+        self.frame_level_z = self.wheel_radius + 0.3 # Более реалистичная высота рамы
+        self.first_rear_axle_pos = self.front_axle_pos + self.wheelbase
+        self.saddle_pos = self.first_rear_axle_pos + self.saddle_pos_from_rear_axle
+
+    def wheel_count(self):
+        return 2 + self.num_rear_axles * self._wheels_per_axle(self.wheel_type)
+
+    def get_components(self, x_offset=0, y_offset=0, z_offset=0, lod=DEFAULT_LOD):
+        """Возвращает список всех 3D компонентов тягача со смещением."""
+        parts = []
+        
+        parts.append(_create_box_part(self.cab_model, (x_offset, y_offset, z_offset + self.frame_level_z),
+                                      (self.cab_length, self.cab_width, self.cab_height), 'royalblue', 'Кабина'))
+        
+        chassis_len = self.first_rear_axle_pos + (self.num_rear_axles -1) * self.rear_axle_spacing + self.saddle_pos_from_rear_axle + 0.5
+        frame_width = 1.0
+        parts.append(_create_cuboid((x_offset, y_offset + (self.cab_width - frame_width) / 2, z_offset + self.frame_level_z - 0.2), 
+                                   (chassis_len, frame_width, 0.2), 'dimgray', 'Рама тягача'))
+        saddle_x_center = self.first_rear_axle_pos + self.saddle_pos_from_rear_axle
+        saddle_width = 1.2
+        parts.append(_create_cuboid((x_offset + saddle_x_center - 0.5, y_offset + (self.cab_width - saddle_width) / 2, z_offset + self.frame_level_z), 
+                                   (1.0, saddle_width, 0.05), 'darkslategrey', 'Седло'))
+        
+        z_wheel = z_offset + self.wheel_radius
+        front_centers = _axle_wheel_centers([x_offset + self.front_axle_pos], y_offset, self.cab_width,
+                                            self.wheel_width, 'single', z_wheel)
+        rear_axle_xs = x_offset + self.first_rear_axle_pos + np.arange(self.num_rear_axles) * self.rear_axle_spacing
+        rear_centers = _axle_wheel_centers(rear_axle_xs, y_offset, self.cab_width,
+                                           self.wheel_width, self.wheel_type, z_wheel)
+        parts.append(_create_wheel_set(np.concatenate([front_centers, rear_centers]),
+                                       self.wheel_radius, self.wheel_width, LOD_SEGMENTS[lod]))
+
+        return parts
+
+class SemiTrailer(Vehicle):
+    """Класс для представления Полуприцепа."""
+    TYPE_LABEL = "Прицеп"
+    NUM_CUBOIDS = 2
+    PARAMETERS = {
+        'brand': str, 'model': str, 'length': float, 'width': float, 'height': float,
+        'kingpin_offset': float, 'axle_pos_from_rear': float, 'num_axles': int,
+        'axle_spacing': float, 'wheel_type': str, 'wheel_diameter': float, 'wheel_width': float,
+        'body_model': str
+    }
+    MODEL_PARAMETERS = ('body_model',)
+    __slots__ = (*PARAMETERS, 'wheel_radius')
+
+    def __init__(self, brand="Trailer", model="Default", length=13.6, width=2.55, height=2.7,
+                 kingpin_offset=1.2, axle_pos_from_rear=2.5,
+                 num_axles=3, axle_spacing=1.3, wheel_type='single',
+                 wheel_diameter=1.0, wheel_width=0.4, body_model=''):
+        self.brand = brand
+        self.model = model
+        self.length = length
+        self.width = width
+        self.height = height
+        self.kingpin_offset = kingpin_offset
+        self.axle_pos_from_rear = axle_pos_from_rear
+        self.num_axles = num_axles
+        self.axle_spacing = axle_spacing
+        self.wheel_type = wheel_type
+        self.wheel_diameter = wheel_diameter
+        self.wheel_width = wheel_width
+        self.body_model = body_model # Путь к .gltf/.glb кузова; пусто - кубоид
+        self.wheel_radius = self.wheel_diameter / 2
+
+    def wheel_count(self):
+        return self.num_axles * self._wheels_per_axle(self.wheel_type)
+
+    def get_components(self, x_offset=0, y_offset=0, z_offset=0, lod=DEFAULT_LOD):
+        """Возвращает список всех 3D компонентов полуприцепа со смещением."""
+        parts = []
+
+        parts.append(_create_box_part(self.body_model, (x_offset, y_offset, z_offset),
+                                      (self.length, self.width, self.height), 'lightcoral', 'Кузов'))
+        frame_width = 1.0
+        parts.append(_create_cuboid((x_offset, y_offset + (self.width - frame_width)/2, z_offset - 0.2), (self.length, frame_width, 0.2), 'dimgray', 'Рама прицепа'))
+        
+        first_axle_pos = self.length - self.axle_pos_from_rear
+        axle_xs = x_offset + first_axle_pos - np.arange(self.num_axles) * self.axle_spacing
+        centers = _axle_wheel_centers(axle_xs, y_offset, self.width, self.wheel_width,
+                                      self.wheel_type, z_offset - 0.2 + self.wheel_radius)
+        parts.append(_create_wheel_set(centers, self.wheel_radius, self.wheel_width, LOD_SEGMENTS[lod]))
+
+        return parts
+
+class Van(Vehicle):
+    """Класс для представления Фургона."""
+    TYPE_LABEL = "Фургон"
+    NUM_CUBOIDS = 3
+    PARAMETERS = {
+        'brand': str, 'model': str, 'body_length': float, 'body_width': float, 'body_height': float,
+        'cab_length': float, 'front_axle_pos': float, 'wheelbase': float, 'num_rear_axles': int,
+        'rear_axle_spacing': float, 'wheel_type': str, 'wheel_diameter': float, 'wheel_width': float,
+        'cab_model': str, 'body_model': str
+    }
+    MODEL_PARAMETERS = ('cab_model', 'body_model')
+    __slots__ = (*PARAMETERS, 'wheel_radius', 'frame_level_z')
+
+    def __init__(self, brand="Van", model="Default", body_length=6.0, body_width=2.4, body_height=2.2,
+                 cab_length=2.0, front_axle_pos=1.2, wheelbase=4.0,
+                 num_rear_axles=1, rear_axle_spacing=0, wheel_type='dual',
+                 wheel_diameter=0.8, wheel_width=0.3, cab_model='', body_model=''):
+        self.brand = brand
+        self.model = model
+        self.body_length = body_length
+        self.body_width = body_width
+        self.body_height = body_height
+        self.cab_length = cab_length
+        self.front_axle_pos = front_axle_pos
+        self.wheelbase = wheelbase
+        self.num_rear_axles = num_rear_axles
+        self.rear_axle_spacing = rear_axle_spacing
+        self.wheel_type = wheel_type
+        self.wheel_diameter = wheel_diameter
+        self.wheel_width = wheel_width
+        self.cab_model = cab_model
+        self.body_model = body_model
+        
+        self.wheel_radius = self.wheel_diameter / 2
+        self.frame_level_z = self.wheel_radius + 0.3
+    
+    def wheel_count(self):
+        return 2 + self.num_rear_axles * self._wheels_per_axle(self.wheel_type)
+
+    def get_components(self, x_offset=0, y_offset=0, z_offset=0, lod=DEFAULT_LOD):
+        """Возвращает список всех 3D компонентов фургона."""
+        parts = []
+        
+        parts.append(_create_box_part(self.cab_model, (x_offset, y_offset, z_offset + self.frame_level_z),
+                                      (self.cab_length, self.body_width, self.body_height), 'skyblue', 'Кабина фургона'))
+        parts.append(_create_box_part(self.body_model, (x_offset + self.cab_length, y_offset, z_offset + self.frame_level_z),
+                                      (self.body_length, self.body_width, self.body_height), 'lightgrey', 'Кузов фургона'))
+        chassis_len = self.cab_length + self.body_length
+        frame_width = 1.0
+        parts.append(_create_cuboid((x_offset, y_offset + (self.body_width - frame_width)/2, z_offset + self.frame_level_z - 0.2),
+                                   (chassis_len, frame_width, 0.2), 'dimgray', 'Рама фургона'))
+        
+        z_wheel = z_offset + self.wheel_radius
+        front_centers = _axle_wheel_centers([x_offset + self.front_axle_pos], y_offset, self.body_width,
+                                            self.wheel_width, 'single', z_wheel)
+        first_rear_axle_pos = self.front_axle_pos + self.wheelbase
+        rear_axle_xs = x_offset + first_rear_axle_pos + np.arange(self.num_rear_axles) * self.rear_axle_spacing
+        rear_centers = _axle_wheel_centers(rear_axle_xs, y_offset, self.body_width,
+                                           self.wheel_width, self.wheel_type, z_wheel)
+        parts.append(_create_wheel_set(np.concatenate([front_centers, rear_centers]),
+                                       self.wheel_radius, self.wheel_width, LOD_SEGMENTS[lod]))
+
+        return parts
+
+# --- Кэш геометрии ---
+
+def vehicle_key(vehicle, *extra):
+    """Контентный ключ геометрии ТС: хэш типа, параметров конструктора и дополнительных значений.
+
+    Марка и модель (NAMING_PARAMETERS) в ключ не входят: записи каталога с
+    одинаковой геометрией делят кэши геометрии и миниатюр.
+    """
+    params = {name: value for name, value in vehicle.get_params().items() if name not in vehicle.NAMING_PARAMETERS}
+    payload = repr((type(vehicle).__name__, sorted(params.items()),
+                    tuple(float(v) if isinstance(v, (int, float)) else v for v in extra)))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+def geometry_key(vehicle, *extra):
+    """vehicle_key с версиями файлов моделей ТС: измененный меш дает новый ключ."""
+    fingerprints = [repr(asset_cache.fingerprint(path)) for path in vehicle.model_paths()]
+    return vehicle_key(vehicle, *extra, *fingerprints)
+
+def _freeze_part(part):
+    """Делает буферы детали неизменяемыми, чтобы их можно было разделять между сессиями."""
+    part.vertices.flags.writeable = False
+    part.faces.flags.writeable = False
+    return part
+
+class GeometryCache(LRUCache):
+    """Общий для процесса LRU-кэш геометрии ТС.
+
+    Ключ - geometry_key от параметров ТС, смещений размещения и LOD, значение -
+    кортеж неизменяемых деталей. Кэш потокобезопасен и общий для всех сессий
+    Streamlit в одном серверном процессе.
+    """
+    def __init__(self, max_entries=256):
+        super().__init__(max_entries=max_entries)
+
+    def get_components(self, vehicle, x_offset=0, y_offset=0, z_offset=0, lod=DEFAULT_LOD):
+        """Возвращает детали ТС из кэша, строя их только при промахе."""
+        key = geometry_key(vehicle, x_offset, y_offset, z_offset, lod)
+        parts = self.lookup(key)
+        if parts is not None:
+            return parts
+
+        with span('geometry.build'):
+            parts = tuple(_freeze_part(p) for p in vehicle.get_components(x_offset=x_offset, y_offset=y_offset,
+                                                                          z_offset=z_offset, lod=lod))
+        inc('parts_generated', len(parts))
+        inc('triangles_generated', sum(len(p.faces) for p in parts))
+        self.store(key, parts)
+        return parts
+
+geometry_cache = GeometryCache()
+metrics.register_gauge('geometry_cache_hits', lambda: geometry_cache.hits, "Попадания в кэш геометрии", 'counter')
+metrics.register_gauge('geometry_cache_misses', lambda: geometry_cache.misses, "Промахи кэша геометрии", 'counter')
+metrics.register_gauge('geometry_cache_entries', lambda: len(geometry_cache), "Записей в кэше геометрии")
+
+# --- Класс Сборщика ---
+
+HIGHLIGHT_COLOR = 'red' # Цвет выделенных деталей (например, пересечений в сцепке)
+
+def _as_transforms(transforms):
+    """Приводит размещения к массиву (N, 4): x, y, z и поворот yaw вокруг оси Z (радианы).
+
+    Допускаются строки из трех чисел (без поворота).
+    """
+    transforms = np.asarray(transforms, dtype=float)
+    if transforms.ndim == 1:
+        transforms = transforms[None, :]
+    if transforms.shape[1] == 3:
+        transforms = np.column_stack([transforms, np.zeros(len(transforms))])
+    return transforms
+
+def _compose_transforms(parent, child):
+    """Композиция размещений: каждое дочернее размещение внутри каждого родительского."""
+    cos, sin = np.cos(parent[:, 3])[:, None], np.sin(parent[:, 3])[:, None]
+    x = parent[:, 0:1] + cos * child[None, :, 0] - sin * child[None, :, 1]
+    y = parent[:, 1:2] + sin * child[None, :, 0] + cos * child[None, :, 1]
+    z = parent[:, 2:3] + child[None, :, 2]
+    yaw = parent[:, 3:4] + child[None, :, 3]
+    return np.stack([x, y, z, yaw], axis=-1).reshape(-1, 4)
+
+def place_part(part, transforms):
+    """Размещает деталь по всем размещениям transforms (N, 4) одной деталью.
+
+    Буфер граней исходной детали разделяется, если размещение одно и без поворота.
+    """
+    if len(transforms) == 1 and transforms[0, 3] == 0:
+        if not transforms[0, :3].any():
+            return part
+        return Part(part.vertices + transforms[0, :3], part.faces, part.color, part.name)
+
+    cos, sin = np.cos(transforms[:, 3])[:, None], np.sin(transforms[:, 3])[:, None]
+    x, y, z = part.vertices[:, 0][None, :], part.vertices[:, 1][None, :], part.vertices[:, 2][None, :]
+    vertices = np.empty((len(transforms), len(part.vertices), 3))
+    vertices[:, :, 0] = transforms[:, 0:1] + cos * x - sin * y
+    vertices[:, :, 1] = transforms[:, 1:2] + sin * x + cos * y
+    vertices[:, :, 2] = transforms[:, 2:3] + z
+    offsets = (np.arange(len(transforms)) * len(part.vertices))[:, None, None]
+    faces = (part.faces[None, :, :] + offsets).reshape(-1, 3)
+    return Part(vertices.reshape(-1, 3), faces, part.color, part.name)
+
+def _highlighted(part, names):
+    """Деталь с цветом HIGHLIGHT_COLOR, если ее имя в names; буферы разделяются с исходной."""
+    if part.name not in names:
+        return part
+    return Part(part.vertices, part.faces, HIGHLIGHT_COLOR, part.name)
+
+def _empty_mesh(color):
+    """Пустой Mesh3d для цвета, у которого на сцене не осталось деталей."""
+    return go.Mesh3d(x=[], y=[], z=[], i=[], j=[], k=[], color=color, name=color)
+
+def grid_layout(count, columns, spacing_x, spacing_y, origin=(0, 0, 0), yaw=0.0):
+    """Размещения (count, 4) по сетке: ряды вдоль Y по columns мест, ряды идут вдоль X."""
+    index = np.arange(count)
+    transforms = np.zeros((count, 4))
+    transforms[:, 0] = origin[0] + (index // columns) * spacing_x
+    transforms[:, 1] = origin[1] + (index % columns) * spacing_y
+    transforms[:, 2] = origin[2]
+    transforms[:, 3] = yaw
+    return transforms
+
+def row_layout(count, spacing, axis='y', origin=(0, 0, 0), yaw=0.0):
+    """Размещения (count, 4) в один ряд вдоль оси axis с шагом spacing."""
+    transforms = np.zeros((count, 4))
+    transforms[:, :3] = origin
+    transforms[:, 'xyz'.index(axis)] += np.arange(count) * spacing
+    transforms[:, 3] = yaw
+    return transforms
+
+class SceneNode:
+    """Именованный узел сцены: группа или ТС с размещениями относительно родителя.
+
+    Размещения transforms (N, 4) - это x, y, z и поворот yaw вокруг оси Z;
+    обычный узел имеет одно размещение, а узел с N размещениями рисует свое
+    содержимое N раз (инстансинг): геометрия ТС строится один раз.
+    Листовой узел хранит ТС, его детали в локальных координатах и детали,
+    размещенные в координатах сцены. Флаг dirty означает, что детали узла
+    нужно пересчитать при следующей генерации фигуры.
+    """
+    def __init__(self, name, vehicle=None, transforms=((0, 0, 0, 0),), parent=None):
+        self.name = name
+        self.vehicle = vehicle
+        self.transforms = _as_transforms(transforms)
+        self.parent = parent
+        self.children = {}
+        self.key = None # geometry_key, по которому построены parts
+        self.parts = () # Детали ТС в локальных координатах
+        self.world_parts = [] # Детали в координатах сцены
+        self.highlight = frozenset() # Имена деталей, выделенных цветом HIGHLIGHT_COLOR
+        self.dirty = True
+
+    @property
+    def path(self):
+        if self.parent is None or self.parent.parent is None:
+            return self.name
+        return f"{self.parent.path}/{self.name}"
+
+    def world_transforms(self):
+        """Все размещения узла в координатах сцены с учетом размещений предков."""
+        transforms, node = self.transforms, self.parent
+        while node is not None:
+            transforms = _compose_transforms(node.transforms, transforms)
+            node = node.parent
+        return transforms
+
+    def iter_nodes(self):
+        """Обходит узел и всех его потомков в порядке добавления."""
+        yield self
+        for child in self.children.values():
+            yield from child.iter_nodes()
+
+    def mark_dirty(self):
+        for node in self.iter_nodes():
+            node.dirty = True
+
+class Scene:
+    """Класс для сборки и отображения различных транспортных сущностей.
+
+    Сцена хранит дерево именованных узлов. Изменение ТС или смещения узла
+    помечает его грязным; при следующем generate_figure/generate_patch
+    перестраиваются только грязные узлы и только трассы их цветов.
+
+    Уровень детализации колес задается lod ('coarse', 'medium', 'fine') или
+    выбирается автоматически (lod='auto') по назначению сцены и бюджету
+    треугольников: см. resolve_lod.
+    """
+    def __init__(self, cache=geometry_cache, lod='auto', purpose='interactive',
+                 triangle_budget=DEFAULT_TRIANGLE_BUDGET):
+        self.cache = cache # None - строить геометрию без кэша
+        self.lod = lod
+        self.purpose = purpose # 'interactive' - просмотр в браузере, 'export' - снимки и экспорт
+        self.triangle_budget = triangle_budget
+        self._lod = None # LOD, с которым построена текущая геометрия
+        self.root = SceneNode('')
+        self._trace_colors = [] # Цвет каждой трассы последней фигуры, по индексу трассы
+        self._dirty_colors = set()
+        self._auto_names = 0
+
+    def get_node(self, path):
+        """Возвращает узел по пути вида 'articulated/trailer' или None."""
+        node = self.root
+        for name in path.split('/'):
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    def set_node(self, path, vehicle=None, x=0, y=0, z=0):
+        """Создает или обновляет узел; узел становится грязным, только если что-то изменилось."""
+        return self.set_instances(path, vehicle, [(x, y, z, 0)])
+
+    def set_instances(self, path, vehicle, transforms):
+        """Как set_node, но с массивом размещений (N, 3) или (N, 4) - узел рисуется N раз."""
+        parent_path, _, name = path.rpartition('/')
+        parent = self.get_node(parent_path) if parent_path else self.root
+        if parent is None:
+            raise KeyError(f"Родительский узел '{parent_path}' не найден")
+
+        transforms = _as_transforms(transforms)
+        node = parent.children.get(name)
+        if node is None:
+            node = parent.children[name] = SceneNode(name, vehicle, transforms, parent)
+            return node
+
+        if vehicle is not None and node.children:
+            for child in list(node.children):
+                self.remove(f"{path}/{child}")
+        if not np.array_equal(transforms, node.transforms):
+            node.transforms = transforms
+            node.mark_dirty()
+        if vehicle is not node.vehicle:
+            try:
+                if vehicle is None or node.key != geometry_key(vehicle, self._lod):
+                    node.dirty = True
+            except OSError:
+                node.dirty = True # Файл модели недоступен - ошибку покажет построение
+            node.vehicle = vehicle
+        return node
+
+    def set_highlight(self, path, part_names=()):
+        """Выделяет детали узла с именами part_names цветом HIGHLIGHT_COLOR (пустой набор снимает выделение)."""
+        node = self.get_node(path)
+        if node is None:
+            raise KeyError(f"Узел '{path}' не найден")
+        part_names = frozenset(part_names)
+        if part_names != node.highlight:
+            node.highlight = part_names
+            node.dirty = True
+        return node
+
+    def remove(self, path):
+        """Удаляет узел вместе с потомками."""
+        node = self.get_node(path)
+        if node is None:
+            return
+        for child in node.iter_nodes():
+            self._dirty_colors.update(p.color for p in child.world_parts)
+        del node.parent.children[node.name]
+
+    def clear(self):
+        for name in list(self.root.children):
+            self.remove(name)
+
+    def add(self, vehicle, x=0, y=0, z=0, name=None):
+        """Универсальный метод для добавления любого транспортного средства на сцену."""
+        if vehicle:
+            if name is None:
+                self._auto_names += 1
+                name = f"vehicle_{self._auto_names}"
+            return self.set_node(name, vehicle, x, y, z)
+
+    def add_instances(self, vehicle, transforms, name=None):
+        """Размещает одно ТС много раз (например, по grid_layout/row_layout)."""
+        if vehicle:
+            if name is None:
+                self._auto_names += 1
+                name = f"vehicle_{self._auto_names}"
+            return self.set_instances(name, vehicle, transforms)
+
+    def add_articulated_vehicle(self, tractor, trailer, name='articulated', transforms=((0, 0, 0, 0),)):
+        """Добавляет сцепку тягача и полуприцепа на сцену узлами name/tractor и name/trailer.
+
+        transforms позволяет поставить одну и ту же сцепку в несколько мест.
+        """
+        if tractor and trailer:
+            trailer_start_x = tractor.saddle_pos - trailer.kingpin_offset
+            y_offset_tractor = (trailer.width - tractor.cab_width) / 2
+
+            if self.get_node(name) is None or self.get_node(name).vehicle is not None:
+                self.remove(name)
+            self.set_instances(name, None, transforms)
+            self.set_node(f"{name}/tractor", tractor, y=y_offset_tractor)
+            self.set_node(f"{name}/trailer", trailer, x=trailer_start_x, z=tractor.frame_level_z)
+
+    def vehicles(self):
+        """Все ТС сцены (листовые узлы) в порядке добавления, без учета числа размещений."""
+        return [node.vehicle for node in self.root.iter_nodes() if node.vehicle is not None]
+
+    def placed_vehicles(self):
+        """Пары (ТС, число его размещений на сцене) по листовым узлам."""
+        return [(node.vehicle, len(node.world_transforms()))
+                for node in self.root.iter_nodes() if node.vehicle is not None]
+
+    def resolve_lod(self, purpose=None):
+        """Выбирает уровень детализации для текущего содержимого сцены.
+
+        Явно заданный lod используется как есть. В режиме 'auto' экспорт
+        начинает с 'fine', интерактивный просмотр одного ТС или сцепки - с
+        'medium', а сцена из нескольких ТС - с 'coarse'. Затем уровень
+        понижается, пока оценка числа треугольников превышает бюджет.
+        purpose переопределяет назначение сцены (например, для экспорта).
+        """
+        if self.lod != 'auto':
+            return self.lod
+        placed = self.placed_vehicles()
+        if (purpose or self.purpose) == 'export':
+            start = 'fine'
+        elif sum(count for _, count in placed) <= 2:
+            start = 'medium'
+        else:
+            start = 'coarse'
+        levels = LOD_ORDER[LOD_ORDER.index(start):]
+        for lod in levels:
+            if self.estimate_triangles(lod) <= self.triangle_budget:
+                return lod
+        return levels[-1]
+
+    def estimate_triangles(self, lod=None):
+        """Оценка числа треугольников сцены на уровне lod (по умолчанию - resolve_lod())."""
+        lod = lod or self.resolve_lod()
+        return sum(v.estimate_triangles(lod) * count for v, count in self.placed_vehicles())
+
+    def _build_parts(self, vehicle, lod):
+        if self.cache is not None:
+            return self.cache.get_components(vehicle, lod=lod)
+        return tuple(vehicle.get_components(lod=lod))
+
+    def iter_geometry(self, lod=None, colors=None, max_instances=256):
+        """Потоково выдает детали сцены в координатах сцены, не сохраняя их.
+
+        Геометрия каждого ТС берется из кэша в локальных координатах и
+        размещается порциями по max_instances размещений, поэтому память не
+        зависит от размера сцены. lod по умолчанию выбирается для экспорта;
+        colors ограничивает вывод деталями указанных цветов.
+        """
+        lod = lod or self.resolve_lod(purpose='export')
+        for node in self.root.iter_nodes():
+            if node.vehicle is None:
+                continue
+            parts = [p for p in self._build_parts(node.vehicle, lod) if colors is None or p.color in colors]
+            if not parts:
+                continue
+            transforms = node.world_transforms()
+            for start in range(0, len(transforms), max_instances):
+                chunk = transforms[start:start + max_instances]
+                for part in parts:
+                    yield place_part(part, chunk)
+
+    @timed('scene.refresh')
+    def _refresh(self):
+        """Пересчитывает грязные узлы и запоминает цвета затронутых трасс.
+
+        Узлы с файлами моделей проверяются и без флага dirty: измененный на
+        диске файл меняет geometry_key, и узел перестраивается.
+        """
+        lod = self.resolve_lod()
+        if lod != self._lod:
+            self._lod = lod
+            self.root.mark_dirty()
+        for node in self.root.iter_nodes():
+            if not node.dirty and (node.vehicle is None or not node.vehicle.model_paths()):
+                continue
+            key = None if node.vehicle is None else geometry_key(node.vehicle, lod)
+            if not node.dirty and key == node.key:
+                continue
+            self._dirty_colors.update(p.color for p in node.world_parts)
+            if node.vehicle is None:
+                node.key, node.parts = None, ()
+            elif key != node.key:
+                node.key, node.parts = key, self._build_parts(node.vehicle, lod)
+            transforms = node.world_transforms()
+            node.world_parts = [place_part(_highlighted(p, node.highlight), transforms) for p in node.parts]
+            self._dirty_colors.update(p.color for p in node.world_parts)
+            node.dirty = False
+
+    @property
+    def components(self):
+        """Все детали сцены в координатах сцены."""
+        self._refresh()
+        return [p for node in self.root.iter_nodes() for p in node.world_parts]
+
+    @timed('scene.generate_figure')
+    def generate_figure(self):
+        """Собирает все добавленные компоненты в единую 3D модель.
+
+        Детали одного цвета объединяются в один Mesh3d, поэтому число трасс
+        не зависит от количества осей и колес.
+        """
+        merged = merge_parts(self.components)
+        self._trace_colors = list(merged)
+        self._dirty_colors.clear()
+        return scene_figure([_batched_mesh(color, *buffers) for color, buffers in merged.items()])
+
+    @timed('scene.generate_patch')
+    def generate_patch(self):
+        """Возвращает изменения с последней генерации: {индекс трассы: Mesh3d}.
+
+        В патч попадают только трассы цветов, затронутых грязными или
+        удаленными узлами. Трасса цвета, у которого не осталось деталей,
+        заменяется пустой, чтобы индексы остальных трасс не сдвигались.
+        Новые цвета получают индексы после существующих трасс.
+        """
+        parts = self.components
+        dirty = self._dirty_colors
+        merged = merge_parts([p for p in parts if p.color in dirty])
+        for color in merged:
+            if color not in self._trace_colors:
+                self._trace_colors.append(color)
+
+        patch = {}
+        for index, color in enumerate(self._trace_colors):
+            if color in dirty:
+                patch[index] = _batched_mesh(color, *merged[color]) if color in merged else _empty_mesh(color)
+        dirty.clear()
+        return patch
+
+    @timed('scene.update_figure')
+    def update_figure(self, fig):
+        """Применяет generate_patch к фигуре, построенной этой сценой, без ее пересоздания."""
+        patch = self.generate_patch()
+        with fig.batch_update():
+            for index, trace in sorted(patch.items()):
+                if index < len(fig.data):
+                    fig.data[index].update(trace.to_plotly_json())
+                else:
+                    fig.add_trace(trace)
+        return patch
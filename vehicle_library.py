@@ -0,0 +1,503 @@
+"""Колоночное хранилище библиотеки ТС.
+
+Для каждого типа ТС параметры хранятся по колонкам: числовые параметры - в
+массивах NumPy, строковые (марка, модель, тип колес) - словарным кодированием
+(массив целочисленных кодов + таблица значений). Объекты Tractor/SemiTrailer/Van
+создаются только при обращении к конкретной записи.
+
+PersistentVehicleLibrary хранит те же колонки на диске в файлах .npy, которые
+открываются через memory map, и дописывает новые записи в журнал.
+"""
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from fleet_evaluation import params_dtype
+from vehicle_constructor import Tractor, SemiTrailer, Van
+
+VEHICLE_TYPES = (Tractor, SemiTrailer, Van)
+
+class _Columns:
+    """Колонки одного типа ТС с запасом емкости под добавление.
+
+    Колонки могут быть массивами только для чтения (например, memory map с
+    диска): при первом добавлении они копируются в растущие буферы.
+    """
+    def __init__(self, vehicle_cls, capacity=16):
+        self.vehicle_cls = vehicle_cls
+        self.size = 0
+        self.data = {}
+        self.categories = {} # Строковый параметр -> значения по коду (список или массив NumPy)
+        self._codes = {} # Строковый параметр -> {значение: код}, строится лениво
+        self._postings = {} # Строковый параметр -> (строки, отсортированные по коду; границы кодов)
+        self._names = None # Уникальные имена по номеру строки, строятся лениво
+        dtype = params_dtype(vehicle_cls)
+        for name, kind in vehicle_cls.PARAMETERS.items():
+            if kind is str:
+                self.data[name] = np.empty(capacity, dtype=np.int32)
+                self.categories[name] = []
+            else:
+                self.data[name] = np.empty(capacity, dtype=dtype[name])
+
+    @classmethod
+    def from_arrays(cls, vehicle_cls, data, categories, size):
+        """Оборачивает готовые колонки (например, memory map) без копирования."""
+        columns = cls(vehicle_cls, capacity=0)
+        columns.data.update(data)
+        columns.categories.update(categories)
+        columns.size = size
+        return columns
+
+    def _reserve(self, size):
+        capacity = len(next(iter(self.data.values())))
+        if size <= capacity and all(column.flags.writeable for column in self.data.values()):
+            return
+        capacity = max(size, 2 * capacity, 16)
+        for name, column in self.data.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.data[name] = grown
+
+    def _code_table(self, name):
+        codes = self._codes.get(name)
+        if codes is None:
+            if not isinstance(self.categories[name], list):
+                self.categories[name] = self.categories[name].tolist()
+            codes = self._codes[name] = {v: i for i, v in enumerate(self.categories[name])}
+        return codes
+
+    def _encode(self, name, value):
+        codes = self._code_table(name)
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.categories[name])
+            self.categories[name].append(value)
+        return code
+
+    def append(self, params):
+        """Добавляет запись и возвращает номер ее строки."""
+        return self.extend([params])
+
+    def extend(self, params_list):
+        """Добавляет записи одной операцией на колонку; возвращает номер первой строки."""
+        start, count = self.size, len(params_list)
+        self._reserve(start + count)
+        for name, kind in self.vehicle_cls.PARAMETERS.items():
+            values = [params[name] for params in params_list]
+            if kind is str:
+                values = [self._encode(name, value) for value in values]
+            self.data[name][start:start + count] = values
+        self.size += count
+        self._postings.clear()
+        if self._names is not None:
+            make = self.vehicle_cls.make_unique_name
+            self._names.extend(make(params['brand'], params['model']) for params in params_list)
+        return start
+
+    def row_params(self, row):
+        params = {}
+        for name, kind in self.vehicle_cls.PARAMETERS.items():
+            value = self.data[name][row]
+            params[name] = str(self.categories[name][value]) if kind is str else kind(value)
+        return params
+
+    @property
+    def names(self):
+        if self._names is None:
+            make = self.vehicle_cls.make_unique_name
+            self._names = [make(brand, model) for brand, model in zip(self.column('brand'), self.column('model'))]
+        return self._names
+
+    def rows_with(self, name, value):
+        """Номера строк со значением value: O(log n + k) по лениво построенному индексу.
+
+        Индекс - строки, отсортированные по коду, и границы каждого кода в них;
+        он перестраивается при первом запросе после добавления записей.
+        """
+        code = self._code_table(name).get(value)
+        if code is None:
+            return []
+        if name not in self._postings:
+            column = self.data[name][:self.size]
+            order = np.argsort(column, kind='stable')
+            bounds = np.searchsorted(column[order], np.arange(len(self.categories[name]) + 1))
+            self._postings[name] = (order, bounds)
+        order, bounds = self._postings[name]
+        return order[bounds[code]:bounds[code + 1]].tolist()
+
+    def column(self, name, start=0, stop=None):
+        """Значения параметра по строкам [start, stop) (строковые - декодированным списком)."""
+        values = self.data[name][start:self.size if stop is None else stop]
+        if name in self.categories:
+            categories = self.categories[name]
+            if isinstance(categories, list):
+                return [categories[code] for code in values.tolist()]
+            return categories[values].tolist()
+        return values
+
+    def to_structured(self):
+        # Строковые поля по самому длинному значению в словаре колонки, без обрезки
+        dtype = params_dtype(self.vehicle_cls, {name: max(map(len, values), default=1)
+                                                for name, values in self.categories.items()})
+        result = np.empty(self.size, dtype=dtype)
+        for name in dtype.names:
+            result[name] = self.column(name)
+        return result
+
+class VehicleLibrary:
+    """Библиотека ТС с колоночным хранением и индексами по имени, типу, марке и модели.
+
+    Поддерживает основные операции словаря {уникальное имя: ТС}, которым
+    библиотека была раньше: in, [], len, keys(), items().
+    """
+    def __init__(self, vehicle_types=VEHICLE_TYPES):
+        self._types = tuple(vehicle_types)
+        self._columns = {cls: _Columns(cls) for cls in self._types}
+        # Уникальное имя -> номер строки * число типов + номер типа, в порядке добавления.
+        # Одно целое вместо кортежа заметно экономит память на больших каталогах.
+        # None - индекс еще не построен (строится при первом обращении по имени).
+        self._name_index = {}
+
+    @property
+    def _index(self):
+        if self._name_index is None:
+            index = {}
+            for slot, cls in enumerate(self._types):
+                for row, unique_name in enumerate(self._columns[cls].names):
+                    index[unique_name] = row * len(self._types) + slot
+            self._name_index = index
+        return self._name_index
+
+    def _locate(self, unique_name):
+        row, slot = divmod(self._index[unique_name], len(self._types))
+        return self._types[slot], row
+
+    def _append(self, cls, params_list):
+        """Дописывает записи одного типа, уже проверенные на уникальность имен."""
+        start = self._columns[cls].extend(params_list)
+        slot, stride = self._types.index(cls), len(self._types)
+        for row, params in enumerate(params_list, start):
+            unique_name = cls.make_unique_name(params['brand'], params['model'])
+            self._index[unique_name] = row * stride + slot
+
+    def _fresh_records(self, records):
+        """Группирует по типам записи с новыми уникальными именами (без повторов внутри пачки)."""
+        fresh, seen = {}, set()
+        for cls, params in records:
+            unique_name = cls.make_unique_name(params['brand'], params['model'])
+            if unique_name not in self._index and unique_name not in seen:
+                seen.add(unique_name)
+                fresh.setdefault(cls, []).append(params)
+        return fresh
+
+    def add(self, vehicle):
+        """Сохраняет ТС; при совпадении уникального имени выбрасывает KeyError."""
+        unique_name = vehicle.get_unique_name()
+        if unique_name in self._index:
+            raise KeyError(f"Техника '{unique_name}' уже есть в библиотеке")
+        self._append(type(vehicle), [vehicle.get_params()])
+        return unique_name
+
+    def extend(self, records):
+        """Добавляет пачку записей (класс ТС, параметры) без создания объектов ТС.
+
+        Записи с уже существующими уникальными именами пропускаются.
+        Возвращает число добавленных записей.
+        """
+        fresh = self._fresh_records(records)
+        for cls, params_list in fresh.items():
+            self._append(cls, params_list)
+        return sum(len(params_list) for params_list in fresh.values())
+
+    def __contains__(self, unique_name):
+        return unique_name in self._index
+
+    def __getitem__(self, unique_name):
+        cls, row = self._locate(unique_name)
+        return cls(**self._columns[cls].row_params(row))
+
+    def get(self, unique_name, default=None):
+        return self[unique_name] if unique_name in self._index else default
+
+    def __len__(self):
+        return sum(columns.size for columns in self._columns.values())
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def keys(self):
+        return list(self._index)
+
+    def items(self):
+        for unique_name in self._index:
+            yield unique_name, self[unique_name]
+
+    def iter_params(self, vehicle_cls, chunk_size=10000):
+        """Потоково выдает параметры всех ТС типа vehicle_cls, декодируя колонки блоками."""
+        columns = self._columns[vehicle_cls]
+        names = list(vehicle_cls.PARAMETERS)
+        for start in range(0, columns.size, chunk_size):
+            stop = min(start + chunk_size, columns.size)
+            values = [columns.column(name, start, stop) for name in names]
+            values = [v if isinstance(v, list) else v.tolist() for v in values]
+            for row in zip(*values):
+                yield dict(zip(names, row))
+
+    def names(self, vehicle_cls):
+        """Уникальные имена всех ТС указанного типа в порядке добавления."""
+        return list(self._columns[vehicle_cls].names)
+
+    def find(self, vehicle_cls, brand=None, model=None):
+        """Имена ТС типа vehicle_cls с заданной маркой и/или моделью (через индексы)."""
+        columns = self._columns[vehicle_cls]
+        rows = None
+        for name, value in (('brand', brand), ('model', model)):
+            if value is not None:
+                matched = columns.rows_with(name, value)
+                rows = matched if rows is None else sorted(set(rows).intersection(matched))
+        if rows is None:
+            rows = range(columns.size)
+        return [columns.names[row] for row in rows]
+
+    def column(self, vehicle_cls, name):
+        """Колонка параметра name для всех ТС типа vehicle_cls."""
+        return self._columns[vehicle_cls].column(name)
+
+    def model_paths(self):
+        """Все непустые пути к мешам моделей в библиотеке (по таблицам значений, без обхода строк)."""
+        paths = set()
+        for cls, columns in self._columns.items():
+            if columns.size:
+                for name in cls.MODEL_PARAMETERS:
+                    paths.update(str(path) for path in columns.categories[name] if path)
+        return sorted(paths)
+
+    def to_structured(self, vehicle_cls):
+        """Структурированный массив параметров для fleet_evaluation."""
+        return self._columns[vehicle_cls].to_structured()
+
+# --- Хранение на диске ---
+
+MANIFEST_NAME = 'MANIFEST.json'
+FORMAT_VERSION = 1
+
+def _fsync_dir(path):
+    """Сбрасывает на диск запись каталога (переименования); на Windows не поддерживается."""
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def _save_array(path, array):
+    with open(path, 'wb') as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+
+class PersistentVehicleLibrary(VehicleLibrary):
+    """Библиотека ТС, сохраняемая в каталоге на диске.
+
+    Структура каталога:
+      MANIFEST.json         - номер текущего поколения и число строк каждого типа;
+      gen-<N>/              - колонки поколения N: <Тип>.<параметр>.npy, для строковых
+                              параметров еще <Тип>.<параметр>.categories.npy;
+      journal-<N>.jsonl     - записи, добавленные после построения поколения N.
+
+    Колонки открываются через memory map (только чтение), поэтому открытие
+    каталога не зависит от его размера, а страницы файлов разделяются ОС между
+    всеми, кто их читает. Новые записи дописываются в журнал; compact()
+    переносит журнал в новое поколение колонок. Переключение поколения -
+    атомарная замена MANIFEST.json, поэтому сбой в любой момент оставляет
+    либо старое, либо новое поколение целиком. Писатель должен быть один
+    (один серверный процесс); внутри процесса используйте open_library().
+    """
+    def __init__(self, path, compact_every=10000, vehicle_types=VEHICLE_TYPES):
+        super().__init__(vehicle_types)
+        self.path = path
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        manifest_path = os.path.join(path, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest['version'] != FORMAT_VERSION:
+                raise ValueError(f"Неподдерживаемая версия библиотеки: {manifest['version']}")
+        else:
+            manifest = {'version': FORMAT_VERSION, 'generation': 0, 'rows': {}}
+        self.generation = manifest['generation']
+        self._load_generation(manifest['rows'])
+        self._remove_stale_files()
+        self._journal_records = self._replay_journal()
+        self._journal = open(self._journal_path(self.generation), 'ab')
+
+    def _generation_dir(self, generation):
+        return os.path.join(self.path, f"gen-{generation}")
+
+    def _journal_path(self, generation):
+        return os.path.join(self.path, f"journal-{generation}.jsonl")
+
+    def _load_generation(self, rows):
+        """Открывает колонки текущего поколения через memory map."""
+        directory = self._generation_dir(self.generation)
+        for cls in self._types:
+            size = rows.get(cls.__name__, 0)
+            if not size:
+                continue
+            data, categories = {}, {}
+            defaults = cls.default_params()
+            for name, kind in cls.PARAMETERS.items():
+                prefix = os.path.join(directory, f"{cls.__name__}.{name}")
+                if not os.path.exists(prefix + '.npy'):
+                    # Параметр добавлен в схему после записи поколения: заполняем значением по умолчанию
+                    if kind is str:
+                        data[name] = np.zeros(size, dtype=np.int32)
+                        categories[name] = [defaults[name]]
+                    else:
+                        data[name] = np.full(size, defaults[name], dtype=params_dtype(cls)[name])
+                    continue
+                data[name] = np.load(prefix + '.npy', mmap_mode='r')
+                if kind is str:
+                    categories[name] = np.load(prefix + '.categories.npy', mmap_mode='r')
+            self._columns[cls] = _Columns.from_arrays(cls, data, categories, size)
+        self._name_index = None
+
+    def _remove_stale_files(self):
+        """Удаляет поколения и журналы, оставшиеся от прерванной или завершенной компакции."""
+        keep = {f"gen-{self.generation}", f"journal-{self.generation}.jsonl", MANIFEST_NAME}
+        for entry in os.listdir(self.path):
+            if entry in keep or not entry.startswith(('gen-', 'journal-', MANIFEST_NAME)):
+                continue
+            full_path = os.path.join(self.path, entry)
+            if os.path.isdir(full_path):
+                shutil.rmtree(full_path, ignore_errors=True)
+            else:
+                os.remove(full_path)
+
+    def _replay_journal(self):
+        """Применяет журнал текущего поколения; оборванную последнюю строку отбрасывает."""
+        journal_path = self._journal_path(self.generation)
+        if not os.path.exists(journal_path):
+            return 0
+        types = {cls.__name__: cls for cls in self._types}
+        defaults = {name: cls.default_params() for name, cls in types.items()}
+        count, good_offset = 0, 0
+        with open(journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                # Записи, сделанные до расширения схемы, дополняются значениями по умолчанию
+                params = {**defaults[record['type']], **record['params']}
+                self._columns[types[record['type']]].append(params)
+                good_offset += len(line)
+                count += 1
+        if good_offset != os.path.getsize(journal_path):
+            with open(journal_path, 'r+b') as f:
+                f.truncate(good_offset)
+        self._name_index = None
+        return count
+
+    def add(self, vehicle):
+        """Сохраняет ТС в памяти и в журнале на диске."""
+        with self._lock:
+            unique_name = vehicle.get_unique_name()
+            if unique_name in self._index:
+                raise KeyError(f"Техника '{unique_name}' уже есть в библиотеке")
+            self.extend([(type(vehicle), vehicle.get_params())])
+            return unique_name
+
+    def extend(self, records):
+        """Добавляет пачку записей одной записью в журнал с одним fsync."""
+        with self._lock:
+            fresh = self._fresh_records(records)
+            if not fresh:
+                return 0
+
+            lines = ''.join(json.dumps({'type': cls.__name__, 'params': params}) + '\n'
+                            for cls, params_list in fresh.items() for params in params_list)
+            self._journal.write(lines.encode('utf-8'))
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            added = 0
+            for cls, params_list in fresh.items():
+                self._append(cls, params_list)
+                added += len(params_list)
+            self._journal_records += added
+            self._maybe_compact()
+            return added
+
+    def _maybe_compact(self):
+        """Компактирует, когда журнал дорос до compact_every и до размера колонок на диске.
+
+        Второе условие делает массовую загрузку амортизированно линейной:
+        каждая компакция переписывает не больше, чем удвоенный объем журнала.
+        """
+        if self.compact_every and self._journal_records >= max(self.compact_every, len(self) - self._journal_records):
+            self.compact()
+
+    def compact(self):
+        """Записывает все колонки в новое поколение и очищает журнал."""
+        with self._lock:
+            generation = self.generation + 1
+            final_dir = self._generation_dir(generation)
+            tmp_dir = final_dir + '.tmp'
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+
+            rows = {}
+            for cls, columns in self._columns.items():
+                if not columns.size:
+                    continue
+                rows[cls.__name__] = columns.size
+                for name, kind in cls.PARAMETERS.items():
+                    prefix = os.path.join(tmp_dir, f"{cls.__name__}.{name}")
+                    _save_array(prefix + '.npy', columns.data[name][:columns.size])
+                    if kind is str:
+                        _save_array(prefix + '.categories.npy', np.array(columns.categories[name], dtype=str))
+            _fsync_dir(tmp_dir)
+            os.replace(tmp_dir, final_dir)
+
+            manifest_tmp = os.path.join(self.path, MANIFEST_NAME + '.tmp')
+            with open(manifest_tmp, 'w', encoding='utf-8') as f:
+                json.dump({'version': FORMAT_VERSION, 'generation': generation, 'rows': rows}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(manifest_tmp, os.path.join(self.path, MANIFEST_NAME))
+            _fsync_dir(self.path)
+
+            # Новое поколение зафиксировано: переключаемся на его файлы и убираем старые
+            names = {cls: columns._names for cls, columns in self._columns.items()}
+            name_index = self._name_index
+            self._journal.close()
+            self.generation = generation
+            self._load_generation(rows)
+            for cls, columns in self._columns.items():
+                columns._names = names[cls]
+            self._name_index = name_index
+            self._journal = open(self._journal_path(generation), 'ab')
+            self._journal_records = 0
+            self._remove_stale_files()
+
+    def close(self):
+        with self._lock:
+            self._journal.close()
+
+_open_libraries = {}
+_open_libraries_lock = threading.Lock()
+
+def open_library(path, **kwargs):
+    """Возвращает общий для процесса экземпляр PersistentVehicleLibrary для каталога path."""
+    key = os.path.realpath(path)
+    with _open_libraries_lock:
+        library = _open_libraries.get(key)
+        if library is None:
+            library = _open_libraries[key] = PersistentVehicleLibrary(path, **kwargs)
+        return library